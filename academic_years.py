@@ -0,0 +1,52 @@
+"""
+Academic year service
+Resolves the current academic year, or the year containing a date, without a query
+"""
+from datetime import date, datetime
+from database import get_db
+from reference_data import get_academic_years, invalidate_reference_data
+
+
+def get_current_academic_year_id():
+    """ID of the academic year flagged is_current, or None"""
+    for year_id, _, is_current, _, _ in get_academic_years():
+        if is_current:
+            return year_id
+    return None
+
+
+def resolve_academic_year_id(for_date=None):
+    """
+    ID of the academic year whose start/end range contains for_date
+    (a date or 'YYYY-MM-DD' string). Falls back to the current year.
+    """
+    if for_date is None:
+        return get_current_academic_year_id()
+    if isinstance(for_date, str):
+        try:
+            for_date = datetime.strptime(for_date, '%Y-%m-%d').date()
+        except ValueError:
+            return get_current_academic_year_id()
+    elif isinstance(for_date, datetime):
+        for_date = for_date.date()
+
+    for year_id, _, _, start_date, end_date in get_academic_years():
+        if start_date <= for_date <= end_date:
+            return year_id
+    return get_current_academic_year_id()
+
+
+def get_academic_year_range(academic_year_id):
+    """(start_date, end_date) of an academic year, or None if it does not exist"""
+    for year_id, _, _, start_date, end_date in get_academic_years():
+        if year_id == academic_year_id:
+            return start_date, end_date
+    return None
+
+
+def set_current_academic_year(academic_year_id):
+    """Flag one academic year as current and invalidate cached years"""
+    cursor = get_db()
+    cursor.execute("UPDATE academic_years SET is_current = (id = %s)", (academic_year_id,))
+    cursor.connection.commit()
+    invalidate_reference_data()
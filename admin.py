@@ -2,8 +2,12 @@
 Admin Blueprint
 Handles admin operations: user management, classes, sections, subjects, dashboard
 """
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file, abort
 from database import get_db
+from pagination import fetch_page
+from reference_data import get_classes, get_academic_years, invalidate_reference_data
+from academic_years import set_current_academic_year
+from profiler import list_profiles, profile_path
 from utils import require_login, require_role, hash_password
 from config import Config
 import os
@@ -16,7 +20,7 @@ admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 def dashboard():
     """Admin dashboard with statistics"""
     try:
-        cursor = get_db()
+        cursor = get_db(readonly=True)
         
         # Get statistics
         cursor.execute("SELECT COUNT(*) FROM users WHERE role = 'student' AND is_active = TRUE")
@@ -65,13 +69,12 @@ def users():
     """List all users"""
     try:
         cursor = get_db()
-        cursor.execute("""
+        page = fetch_page(cursor, """
             SELECT u.id, u.username, u.email, u.role, u.is_active, u.created_at
             FROM users u
-            ORDER BY u.created_at DESC
-        """)
-        users_list = cursor.fetchall()
-        return render_template('admin/users.html', users=users_list)
+            WHERE 1=1
+        """, [], 'u.created_at', 'u.id', sort_index=5, id_index=0)
+        return render_template('admin/users.html', users=page.rows, page=page)
     except Exception as e:
         flash(f'Error loading users: {str(e)}', 'danger')
         return render_template('admin/users.html', users=[])
@@ -210,8 +213,7 @@ def classes():
         """)
         classes_list = cursor.fetchall()
         
-        cursor.execute("SELECT id, year_name, is_current FROM academic_years ORDER BY start_date DESC")
-        academic_years = cursor.fetchall()
+        academic_years = get_academic_years()
         
         return render_template('admin/classes.html', classes=classes_list, academic_years=academic_years)
     except Exception as e:
@@ -239,6 +241,7 @@ def add_class():
             (class_name, class_code or None, description or None, academic_year_id or None)
         )
         cursor.connection.commit()
+        invalidate_reference_data()
         flash('Class added successfully!', 'success')
     except Exception as e:
         cursor.connection.rollback()
@@ -255,12 +258,33 @@ def delete_class(class_id):
         cursor = get_db()
         cursor.execute("DELETE FROM classes WHERE id = %s", (class_id,))
         cursor.connection.commit()
+        invalidate_reference_data()
         flash('Class deleted successfully!', 'success')
     except Exception as e:
         cursor.connection.rollback()
         flash(f'Error deleting class: {str(e)}', 'danger')
     return redirect(url_for('admin.classes'))
 
+@admin_bp.route('/academic-years/current', methods=['POST'])
+@require_login
+@require_role('admin')
+def set_current_year():
+    """Change the current academic year"""
+    academic_year_id = request.form.get('academic_year_id', type=int)
+    
+    if not academic_year_id:
+        flash('Academic year is required.', 'danger')
+        return redirect(url_for('admin.classes'))
+    
+    try:
+        set_current_academic_year(academic_year_id)
+        flash('Current academic year updated successfully!', 'success')
+    except Exception as e:
+        get_db().connection.rollback()
+        flash(f'Error updating academic year: {str(e)}', 'danger')
+    
+    return redirect(url_for('admin.classes'))
+
 # ============================================
 # SECTION MANAGEMENT
 # ============================================
@@ -281,11 +305,8 @@ def sections():
         """)
         sections_list = cursor.fetchall()
         
-        cursor.execute("SELECT id, class_name FROM classes ORDER BY class_name")
-        classes_list = cursor.fetchall()
-        
-        cursor.execute("SELECT id, year_name FROM academic_years ORDER BY start_date DESC")
-        academic_years = cursor.fetchall()
+        classes_list = get_classes()
+        academic_years = get_academic_years()
         
         return render_template('admin/sections.html', 
                              sections=sections_list, 
@@ -316,6 +337,7 @@ def add_section():
             (section_name, class_id, capacity, academic_year_id or None)
         )
         cursor.connection.commit()
+        invalidate_reference_data()
         flash('Section added successfully!', 'success')
     except Exception as e:
         cursor.connection.rollback()
@@ -332,6 +354,7 @@ def delete_section(section_id):
         cursor = get_db()
         cursor.execute("DELETE FROM sections WHERE id = %s", (section_id,))
         cursor.connection.commit()
+        invalidate_reference_data()
         flash('Section deleted successfully!', 'success')
     except Exception as e:
         cursor.connection.rollback()
@@ -376,6 +399,7 @@ def add_subject():
             (subject_name, subject_code or None, description or None)
         )
         cursor.connection.commit()
+        invalidate_reference_data()
         flash('Subject added successfully!', 'success')
     except Exception as e:
         cursor.connection.rollback()
@@ -392,8 +416,31 @@ def delete_subject(subject_id):
         cursor = get_db()
         cursor.execute("DELETE FROM subjects WHERE id = %s", (subject_id,))
         cursor.connection.commit()
+        invalidate_reference_data()
         flash('Subject deleted successfully!', 'success')
     except Exception as e:
         cursor.connection.rollback()
         flash(f'Error deleting subject: {str(e)}', 'danger')
     return redirect(url_for('admin.subjects'))
+
+# ============================================
+# PROFILING
+# ============================================
+
+@admin_bp.route('/profiles')
+@require_login
+@require_role('admin')
+def profiles():
+    """Recent request profiles captured with ?_profile=1"""
+    return render_template('admin/profiles.html', profiles=list_profiles())
+
+@admin_bp.route('/profiles/<name>')
+@require_login
+@require_role('admin')
+def download_profile(name):
+    """Download a capture as collapsed stacks (flamegraph.pl / speedscope input)"""
+    path = profile_path(name)
+    if path is None:
+        abort(404)
+    return send_file(os.path.abspath(path), mimetype='text/plain', as_attachment=True,
+                     download_name=f'{name}.folded')
@@ -0,0 +1,53 @@
+"""
+Admission number allocation
+Numbers come from the admission_sequences table, one row per ADM<year>
+prefix. Allocating locks that row until the admitting transaction commits or
+rolls back, so concurrent admissions queue for a single indexed row instead of
+scanning students, and a rolled back admission hands its numbers back.
+"""
+from datetime import datetime
+
+ADMISSION_PREFIX = 'ADM'
+
+
+def admission_prefix(year=None):
+    return f'{ADMISSION_PREFIX}{year or datetime.now().year}'
+
+
+def format_admission_number(prefix, value):
+    return f'{prefix}{str(value).zfill(4)}'
+
+
+def peek_admission_numbers(cursor, count=1, year=None):
+    """
+    The count numbers allocate_admission_numbers would hand out now, without
+    reserving them (another admission may take them first)
+    """
+    prefix = admission_prefix(year)
+    cursor.execute("SELECT next_value FROM admission_sequences WHERE prefix = %s", (prefix,))
+    row = cursor.fetchone()
+    first = row[0] if row else 1
+    return [format_admission_number(prefix, value) for value in range(first, first + count)]
+
+
+def allocate_admission_numbers(cursor, count=1, year=None):
+    """
+    Reserve count consecutive admission numbers inside the cursor's transaction.
+    The caller must commit (keeping them) or roll back (releasing them).
+    """
+    prefix = admission_prefix(year)
+    # Creates the year's row on first use; either way the row is now locked
+    cursor.execute("""
+        INSERT INTO admission_sequences (prefix, next_value) VALUES (%s, 1)
+        ON DUPLICATE KEY UPDATE next_value = next_value
+    """, (prefix,))
+    cursor.execute("SELECT next_value FROM admission_sequences WHERE prefix = %s FOR UPDATE", (prefix,))
+    first = cursor.fetchone()[0]
+    cursor.execute("UPDATE admission_sequences SET next_value = next_value + %s WHERE prefix = %s",
+                   (count, prefix))
+    return [format_admission_number(prefix, value) for value in range(first, first + count)]
+
+
+def allocate_admission_number(cursor, year=None):
+    """Reserve one admission number inside the cursor's transaction"""
+    return allocate_admission_numbers(cursor, 1, year)[0]
@@ -3,8 +3,12 @@ School Management System - Main Application
 Flask application with modular Blueprint architecture
 """
 from flask import Flask, render_template
+from werkzeug.middleware.proxy_fix import ProxyFix
 from config import Config
 from database import init_db, close_db
+from query_stats import init_query_stats
+from metrics import init_metrics
+from profiler import init_profiler
 from auth import auth_bp
 from admin import admin_bp
 from student import student_bp
@@ -18,9 +22,15 @@ def create_app():
     """Application factory pattern"""
     app = Flask(__name__)
     app.config.from_object(Config)
+    if Config.PROXY_FIX_HOPS:
+        # Real client IPs (login rate limiting) from X-Forwarded-For
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=Config.PROXY_FIX_HOPS, x_proto=Config.PROXY_FIX_HOPS)
     
     # Initialize database
     init_db(app)
+    init_query_stats(app)
+    init_metrics(app)
+    init_profiler(app)
     
     # Create upload directories
     os.makedirs(Config.STUDENT_PHOTOS_FOLDER, exist_ok=True)
@@ -4,12 +4,89 @@ Handles attendance marking, reports, and history
 """
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
 from database import get_db
-from utils import require_login, require_role
+from reference_data import (get_classes, get_sections, get_subjects, get_academic_years,
+                            get_class_name, get_section_name)
+from academic_years import resolve_academic_year_id, get_academic_year_range
+from attendance_rollup import apply_attendance_changes
+from attendance_engine import build_class_wise_report
+from report_export import (EXPORT_FORMATS, export_response, daily_rows, class_wise_rows, student_rows,
+                           DAILY_HEADER, CLASS_WISE_HEADER, STUDENT_HEADER)
+from utils import require_login, require_role, get_current_user
 from datetime import datetime, date
 from collections import defaultdict
 
 attendance_bp = Blueprint('attendance', __name__, url_prefix='/attendance')
 
+ATTENDANCE_STATUSES = ('present', 'absent', 'late', 'half_day')
+
+def save_attendance(cursor, class_id, section_id, subject_id, attendance_date, attendance_data,
+                    marked_by=None, academic_year_id=None):
+    """
+    Upsert one attendance sheet (student_id -> status) for a class/section/date
+    with a single multi-row INSERT ... ON DUPLICATE KEY UPDATE.
+    Rollup tables are updated in the same transaction; the caller commits.
+    Returns counts of inserted, updated, unchanged and skipped (invalid
+    status or student not in the section) rows.
+    """
+    result = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0}
+    
+    submitted = {}
+    for student_id, status in attendance_data.items():
+        try:
+            student_id = int(student_id)
+        except (TypeError, ValueError):
+            result['skipped'] += 1
+            continue
+        if status not in ATTENDANCE_STATUSES:
+            result['skipped'] += 1
+            continue
+        submitted[student_id] = status
+    
+    if not submitted:
+        return result
+    
+    # Current statuses of the submitted students, locked until commit so a
+    # concurrent submission cannot change them underneath us
+    placeholders = ', '.join(['%s'] * len(submitted))
+    cursor.execute(f"""
+        SELECT s.id, a.status
+        FROM students s
+        LEFT JOIN attendance a ON a.student_id = s.id
+             AND a.attendance_date = %s AND a.subject_key = %s
+        WHERE s.class_id = %s AND s.section_id = %s AND s.id IN ({placeholders})
+        FOR UPDATE
+    """, [attendance_date, subject_id or 0, class_id, section_id, *submitted])
+    previous = dict(cursor.fetchall())
+    
+    rows = []
+    changes = []
+    for student_id, status in submitted.items():
+        if student_id not in previous:
+            result['skipped'] += 1
+            continue
+        if previous[student_id] is None:
+            result['inserted'] += 1
+        elif previous[student_id] == status:
+            result['unchanged'] += 1
+            continue
+        else:
+            result['updated'] += 1
+        rows.append((student_id, class_id, section_id, subject_id, attendance_date, status,
+                     marked_by, academic_year_id))
+        changes.append((student_id, previous[student_id], status))
+    
+    if rows:
+        # MySQLdb rewrites this into one multi-row statement
+        cursor.executemany("""
+            INSERT INTO attendance
+            (student_id, class_id, section_id, subject_id, attendance_date, status, marked_by, academic_year_id)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE status = VALUES(status), marked_by = VALUES(marked_by)
+        """, rows)
+        apply_attendance_changes(cursor, class_id, section_id, subject_id, attendance_date, changes)
+    
+    return result
+
 # ============================================
 # MARK ATTENDANCE (Teacher & Admin)
 # ============================================
@@ -38,50 +115,20 @@ def mark_attendance():
         
         try:
             cursor = get_db()
-            user_id = session.get('user_id')
-            marked_by = None
             
-            # Get teacher_id if user is teacher
-            if session.get('role') == 'teacher':
-                cursor.execute("SELECT id FROM teachers WHERE user_id = %s", (user_id,))
-                teacher = cursor.fetchone()
-                marked_by = teacher[0] if teacher else None
+            # teacher_id is resolved at login (None for admins)
+            marked_by = get_current_user()['teacher_id']
             
-            # Get current academic year
-            cursor.execute("SELECT id FROM academic_years WHERE is_current = TRUE LIMIT 1")
-            academic_year = cursor.fetchone()
-            academic_year_id = academic_year[0] if academic_year else None
+            # Academic year containing the (possibly backdated) attendance date
+            academic_year_id = resolve_academic_year_id(attendance_date)
             
-            # Check if attendance already marked for this date
-            cursor.execute("""
-                SELECT COUNT(*) FROM attendance 
-                WHERE class_id = %s AND section_id = %s AND attendance_date = %s 
-                AND (subject_id = %s OR (subject_id IS NULL AND %s IS NULL))
-            """, (class_id, section_id, attendance_date, subject_id, subject_id))
-            
-            existing_count = cursor.fetchone()[0]
-            if existing_count > 0:
-                flash('Attendance already marked for this date. Please edit existing attendance.', 'warning')
-                return redirect(url_for('attendance.view_attendance', 
-                                      class_id=class_id, section_id=section_id, date=attendance_date))
-            
-            # Insert attendance records
-            inserted_count = 0
-            for student_id, status in attendance_data.items():
-                if status in ['present', 'absent', 'late', 'half_day']:
-                    try:
-                        cursor.execute("""
-                            INSERT INTO attendance 
-                            (student_id, class_id, section_id, subject_id, attendance_date, status, marked_by, academic_year_id)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                        """, (student_id, class_id, section_id, subject_id, attendance_date, status, marked_by, academic_year_id))
-                        inserted_count += 1
-                    except Exception as e:
-                        # Skip duplicate entries
-                        continue
+            # Insert new rows and correct changed ones (re-submitting edits the sheet)
+            result = save_attendance(cursor, class_id, section_id, subject_id, attendance_date,
+                                     attendance_data, marked_by, academic_year_id)
             
             cursor.connection.commit()
-            flash(f'Attendance marked successfully for {inserted_count} students!', 'success')
+            flash(f"Attendance saved: {result['inserted']} marked, {result['updated']} updated, "
+                  f"{result['unchanged']} unchanged, {result['skipped']} skipped.", 'success')
             return redirect(url_for('attendance.view_attendance', 
                                   class_id=class_id, section_id=section_id, date=attendance_date))
         
@@ -98,6 +145,7 @@ def mark_attendance():
         attendance_date = request.args.get('date') or datetime.now().strftime('%Y-%m-%d')
         
         students = []
+        existing_status = {}
         if class_id and section_id:
             cursor.execute("""
                 SELECT s.id, s.admission_number, s.first_name, s.last_name, s.photo_path
@@ -106,19 +154,22 @@ def mark_attendance():
                 ORDER BY s.first_name, s.last_name
             """, (class_id, section_id))
             students = cursor.fetchall()
+            
+            # Pre-fill statuses already saved so the sheet can be corrected
+            cursor.execute("""
+                SELECT student_id, status FROM attendance
+                WHERE class_id = %s AND section_id = %s AND attendance_date = %s AND subject_key = 0
+            """, (class_id, section_id, attendance_date))
+            existing_status = dict(cursor.fetchall())
         
         # Get filter options
-        cursor.execute("SELECT id, class_name FROM classes ORDER BY class_name")
-        classes = cursor.fetchall()
-        
-        cursor.execute("SELECT id, section_name, class_id FROM sections ORDER BY class_id, section_name")
-        sections = cursor.fetchall()
-        
-        cursor.execute("SELECT id, subject_name FROM subjects ORDER BY subject_name")
-        subjects = cursor.fetchall()
+        classes = get_classes()
+        sections = get_sections()
+        subjects = get_subjects()
         
         return render_template('attendance/mark.html',
                              students=students,
+                             existing_status=existing_status,
                              classes=classes,
                              sections=sections,
                              subjects=subjects,
@@ -138,7 +189,7 @@ def mark_attendance():
 def view_attendance():
     """View attendance for a specific date, class, and section"""
     try:
-        cursor = get_db()
+        cursor = get_db(readonly=True)
         class_id = request.args.get('class_id', type=int)
         section_id = request.args.get('section_id', type=int)
         attendance_date = request.args.get('date') or datetime.now().strftime('%Y-%m-%d')
@@ -174,14 +225,9 @@ def view_attendance():
             attendance_records = {row[0]: {'status': row[1], 'remarks': row[2]} for row in cursor.fetchall()}
         
         # Get filter options
-        cursor.execute("SELECT id, class_name FROM classes ORDER BY class_name")
-        classes = cursor.fetchall()
-        
-        cursor.execute("SELECT id, section_name, class_id FROM sections ORDER BY class_id, section_name")
-        sections = cursor.fetchall()
-        
-        cursor.execute("SELECT id, subject_name FROM subjects ORDER BY subject_name")
-        subjects = cursor.fetchall()
+        classes = get_classes()
+        sections = get_sections()
+        subjects = get_subjects()
         
         return render_template('attendance/view.html',
                              students=students,
@@ -201,25 +247,31 @@ def view_attendance():
 # ATTENDANCE REPORTS
 # ============================================
 
+def _export_range(start_date, end_date):
+    """Date range for an export: a whole academic year when academic_year_id is given"""
+    academic_year_id = request.args.get('academic_year_id', type=int)
+    if academic_year_id:
+        year_range = get_academic_year_range(academic_year_id)
+        if year_range:
+            return year_range
+    return start_date, end_date
+
 @attendance_bp.route('/reports')
 @require_login
 @require_role('admin', 'teacher')
 def reports():
     """Attendance reports dashboard"""
     try:
-        cursor = get_db()
-        
         # Get filter options
-        cursor.execute("SELECT id, class_name FROM classes ORDER BY class_name")
-        classes = cursor.fetchall()
+        classes = get_classes()
+        sections = get_sections()
+        academic_years = get_academic_years()
         
-        cursor.execute("SELECT id, section_name, class_id FROM sections ORDER BY class_id, section_name")
-        sections = cursor.fetchall()
-        
-        return render_template('attendance/reports.html', classes=classes, sections=sections)
+        return render_template('attendance/reports.html', classes=classes, sections=sections,
+                               academic_years=academic_years)
     except Exception as e:
         flash(f'Error loading reports: {str(e)}', 'danger')
-        return render_template('attendance/reports.html', classes=[], sections=[])
+        return render_template('attendance/reports.html', classes=[], sections=[], academic_years=[])
 
 @attendance_bp.route('/reports/daily')
 @require_login
@@ -227,19 +279,27 @@ def reports():
 def daily_report():
     """Daily attendance report"""
     try:
-        cursor = get_db()
         report_date = request.args.get('date') or datetime.now().strftime('%Y-%m-%d')
         class_id = request.args.get('class_id', type=int)
         section_id = request.args.get('section_id', type=int)
         
+        export_format = request.args.get('format')
+        if export_format in EXPORT_FORMATS:
+            start_date, end_date = _export_range(request.args.get('start_date') or report_date,
+                                                 request.args.get('end_date') or report_date)
+            return export_response(f'daily_attendance_{start_date}_{end_date}', DAILY_HEADER,
+                                   daily_rows(start_date, end_date, class_id, section_id),
+                                   export_format, sheet_name='Daily Attendance')
+        
+        # One rollup row per section sheet; the largest sheet is the head count
         query = """
             SELECT c.class_name, sec.section_name, 
-                   COUNT(DISTINCT a.student_id) as total_students,
-                   SUM(CASE WHEN a.status = 'present' THEN 1 ELSE 0 END) as present_count,
-                   SUM(CASE WHEN a.status = 'absent' THEN 1 ELSE 0 END) as absent_count,
-                   SUM(CASE WHEN a.status = 'late' THEN 1 ELSE 0 END) as late_count,
-                   SUM(CASE WHEN a.status = 'half_day' THEN 1 ELSE 0 END) as half_day_count
-            FROM attendance a
+                   MAX(a.present_count + a.absent_count + a.late_count + a.half_day_count) as total_students,
+                   SUM(a.present_count) as present_count,
+                   SUM(a.absent_count) as absent_count,
+                   SUM(a.late_count) as late_count,
+                   SUM(a.half_day_count) as half_day_count
+            FROM attendance_daily_section_summary a
             JOIN classes c ON a.class_id = c.id
             JOIN sections sec ON a.section_id = sec.id
             WHERE a.attendance_date = %s
@@ -256,6 +316,7 @@ def daily_report():
         
         query += " GROUP BY c.class_name, sec.section_name ORDER BY c.class_name, sec.section_name"
         
+        cursor = get_db(readonly=True)
         cursor.execute(query, params)
         report_data = cursor.fetchall()
         
@@ -270,77 +331,38 @@ def daily_report():
 def class_wise_report():
     """Class-wise attendance report"""
     try:
-        cursor = get_db()
         class_id = request.args.get('class_id', type=int)
         section_id = request.args.get('section_id', type=int)
         start_date = request.args.get('start_date') or (datetime.now().replace(day=1)).strftime('%Y-%m-%d')
         end_date = request.args.get('end_date') or datetime.now().strftime('%Y-%m-%d')
         
+        # Exports may leave class/section empty to cover the whole school
+        export_format = request.args.get('format')
+        if export_format in EXPORT_FORMATS:
+            start_date, end_date = _export_range(start_date, end_date)
+            return export_response(f'class_wise_attendance_{start_date}_{end_date}', CLASS_WISE_HEADER,
+                                   class_wise_rows(start_date, end_date, class_id, section_id),
+                                   export_format, sheet_name='Class-Wise Attendance')
+        
         if not class_id or not section_id:
             flash('Class and section are required.', 'danger')
             return redirect(url_for('attendance.reports'))
         
-        # Get all students in class
-        cursor.execute("""
-            SELECT s.id, s.admission_number, s.first_name, s.last_name
-            FROM students s
-            WHERE s.class_id = %s AND s.section_id = %s AND s.is_active = TRUE
-            ORDER BY s.first_name, s.last_name
-        """, (class_id, section_id))
-        students = cursor.fetchall()
+        cursor = get_db(readonly=True)
+        report = build_class_wise_report(cursor, class_id, section_id, start_date, end_date)
         
-        # Get attendance for date range
-        cursor.execute("""
-            SELECT student_id, status, attendance_date
-            FROM attendance
-            WHERE class_id = %s AND section_id = %s 
-            AND attendance_date BETWEEN %s AND %s
-        """, (class_id, section_id, start_date, end_date))
-        attendance_data = cursor.fetchall()
-        
-        # Calculate statistics per student
-        student_stats = {}
-        for student_id, admission_number, first_name, last_name in students:
-            student_stats[student_id] = {
-                'name': f'{first_name} {last_name}',
-                'admission_number': admission_number,
-                'total_days': 0,
-                'present': 0,
-                'absent': 0,
-                'late': 0,
-                'half_day': 0,
-                'percentage': 0
-            }
-        
-        # Process attendance data
-        for student_id, status, attendance_date in attendance_data:
-            if student_id in student_stats:
-                student_stats[student_id]['total_days'] += 1
-                if status == 'present':
-                    student_stats[student_id]['present'] += 1
-                elif status == 'absent':
-                    student_stats[student_id]['absent'] += 1
-                elif status == 'late':
-                    student_stats[student_id]['late'] += 1
-                elif status == 'half_day':
-                    student_stats[student_id]['half_day'] += 1
-        
-        # Calculate percentages
-        for student_id in student_stats:
-            total = student_stats[student_id]['total_days']
-            present = student_stats[student_id]['present']
-            student_stats[student_id]['percentage'] = (present / total * 100) if total > 0 else 0
-        
-        cursor.execute("SELECT class_name FROM classes WHERE id = %s", (class_id,))
-        class_result = cursor.fetchone()
-        class_name = class_result[0] if class_result else 'Unknown'
-        
-        cursor.execute("SELECT section_name FROM sections WHERE id = %s", (section_id,))
-        section_result = cursor.fetchone()
-        section_name = section_result[0] if section_result else 'Unknown'
+        class_name = get_class_name(class_id)
+        section_name = get_section_name(section_id)
+        
+        if request.args.get('format') == 'json':
+            return jsonify(class_id=class_id, class_name=class_name,
+                           section_id=section_id, section_name=section_name,
+                           start_date=start_date, end_date=end_date, **report)
         
         return render_template('attendance/class_wise_report.html',
-                             student_stats=list(student_stats.values()),
+                             student_stats=report['students'],
+                             weekday_stats=report['weekdays'],
+                             summary=report['summary'],
                              class_name=class_name,
                              section_name=section_name,
                              start_date=start_date,
@@ -354,15 +376,12 @@ def class_wise_report():
 def student_report(student_id):
     """Individual student attendance report"""
     try:
-        cursor = get_db()
-        user_role = session.get('role')
-        user_id = session.get('user_id')
+        cursor = get_db(readonly=True)
+        current_user = get_current_user()
         
         # Check access - students can only view their own report
-        if user_role == 'student':
-            cursor.execute("SELECT id FROM students WHERE user_id = %s", (user_id,))
-            student = cursor.fetchone()
-            if not student or student[0] != student_id:
+        if current_user['role'] == 'student':
+            if current_user['student_id'] != student_id:
                 flash('You can only view your own attendance report.', 'danger')
                 return redirect(url_for('student.dashboard'))
         
@@ -383,6 +402,13 @@ def student_report(student_id):
             flash('Student not found.', 'danger')
             return redirect(url_for('attendance.reports'))
         
+        export_format = request.args.get('format')
+        if export_format in EXPORT_FORMATS:
+            start_date, end_date = _export_range(start_date, end_date)
+            return export_response(f'attendance_{student_info[0]}_{start_date}_{end_date}', STUDENT_HEADER,
+                                   student_rows(student_id, start_date, end_date),
+                                   export_format, sheet_name=student_info[0])
+        
         # Get attendance records
         cursor.execute("""
             SELECT attendance_date, status, remarks, subject_id, s.subject_name
@@ -0,0 +1,168 @@
+"""
+Attendance report engine
+Loads a section's attendance for a date range as compact integer arrays
+(student index, status code, day offset) and computes the class-wise report
+with NumPy: status counts, percentages, streaks and weekday breakdowns
+"""
+import numpy as np
+from attendance_rollup import to_date
+
+STATUSES = ('present', 'absent', 'late', 'half_day')  # status code = ENUM position - 1
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+# When a student has several sheets (subjects) on one day, the day counts as
+# the worst status: present < late < half_day < absent
+SEVERITY = np.array([0, 3, 1, 2], dtype=np.int8)
+ABSENT_SEVERITY = SEVERITY[STATUSES.index('absent')]
+
+
+def load_attendance_arrays(cursor, class_id, section_id, start_date, end_date):
+    """
+    Return an (n, 3) int32 array of (student_id, status code, day offset from
+    start_date) for every attendance row of the section in the range.
+    The ENUM is read by position so MySQL never ships status strings.
+    """
+    cursor.execute("""
+        SELECT student_id, status + 0 - 1, DATEDIFF(attendance_date, %s)
+        FROM attendance
+        WHERE class_id = %s AND section_id = %s AND attendance_date BETWEEN %s AND %s
+    """, (start_date, class_id, section_id, start_date, end_date))
+    rows = cursor.fetchall()
+    if not rows:
+        return np.empty((0, 3), dtype=np.int32)
+    return np.array(rows, dtype=np.int32)
+
+
+def _longest_absence_runs(day_student, absent, n_students):
+    """Longest run of consecutive recorded days marked absent, per student"""
+    longest = np.zeros(n_students, dtype=np.int64)
+    if not absent.any():
+        return longest
+    previous_absent = np.concatenate(([False], absent[:-1]))
+    same_student = np.concatenate(([False], day_student[1:] == day_student[:-1]))
+    run_start = absent & ~(previous_absent & same_student)
+    run_id = np.cumsum(run_start)
+    run_lengths = np.bincount(run_id[absent])[1:]
+    np.maximum.at(longest, day_student[run_start], run_lengths)
+    return longest
+
+
+def _current_present_streaks(day_student, present, n_students):
+    """Number of most recent recorded days marked present, per student"""
+    indexes = np.arange(n_students)
+    starts = np.searchsorted(day_student, indexes, side='left')
+    ends = np.searchsorted(day_student, indexes, side='right')
+    not_present = np.concatenate(([-1], np.flatnonzero(~present)))
+    last_not_present = not_present[np.searchsorted(not_present, ends) - 1]
+    return ends - np.maximum(starts, last_not_present + 1)
+
+
+def compute_class_report(student_ids, records, start_date, end_date):
+    """
+    Vectorized report over the arrays from load_attendance_arrays().
+    student_ids: ids of the students to report on (rows of other students,
+    e.g. ones who have since left the section, are ignored).
+    Returns numpy arrays keyed by metric, each indexed like student_ids except
+    'weekdays', a 7 x 4 table of status counts by day of week.
+    """
+    start_date, end_date = to_date(start_date), to_date(end_date)
+    student_ids = np.asarray(student_ids, dtype=np.int64)
+    n_students = len(student_ids)
+    order = np.argsort(student_ids, kind='stable')
+    sorted_ids = student_ids[order]
+
+    sidx = np.searchsorted(sorted_ids, records[:, 0])
+    known = sidx < n_students
+    known[known] = sorted_ids[sidx[known]] == records[known, 0]
+    sidx = sidx[known]
+    codes = records[known, 1].astype(np.int64)
+    days = records[known, 2].astype(np.int64)
+
+    counts = np.bincount(sidx * 4 + codes, minlength=n_students * 4).reshape(n_students, 4)
+    totals = counts.sum(axis=1)
+    percentages = np.divide(counts[:, 0] * 100.0, totals,
+                            out=np.zeros(n_students), where=totals > 0)
+
+    weekday = (start_date.weekday() + days) % 7
+    weekdays = np.bincount(weekday * 4 + codes, minlength=28).reshape(7, 4)
+
+    # One entry per (student, day), sorted by student then day
+    n_days = (end_date - start_date).days + 1
+    day_keys, inverse = np.unique(sidx * n_days + days, return_inverse=True)
+    day_severity = np.zeros(len(day_keys), dtype=np.int8)
+    np.maximum.at(day_severity, inverse, SEVERITY[codes])
+    day_student = day_keys // n_days
+
+    longest_absence = _longest_absence_runs(day_student, day_severity == ABSENT_SEVERITY, n_students)
+    present_streak = _current_present_streaks(day_student, day_severity == 0, n_students)
+
+    # Back from sorted order to the caller's order
+    unsort = np.empty(n_students, dtype=np.int64)
+    unsort[order] = np.arange(n_students)
+    return {
+        'counts': counts[unsort],
+        'total_days': totals[unsort],
+        'percentages': percentages[unsort],
+        'longest_absence': longest_absence[unsort],
+        'present_streak': present_streak[unsort],
+        'weekdays': weekdays,
+    }
+
+
+def build_class_wise_report(cursor, class_id, section_id, start_date, end_date):
+    """
+    Class-wise report for active students of a section, as plain Python
+    values ready for the template or JSON:
+    {'students': [...], 'weekdays': [...], 'summary': {...}}
+    """
+    cursor.execute("""
+        SELECT s.id, s.admission_number, s.first_name, s.last_name
+        FROM students s
+        WHERE s.class_id = %s AND s.section_id = %s AND s.is_active = TRUE
+        ORDER BY s.first_name, s.last_name
+    """, (class_id, section_id))
+    students = cursor.fetchall()
+
+    records = load_attendance_arrays(cursor, class_id, section_id, start_date, end_date)
+    report = compute_class_report([student[0] for student in students], records, start_date, end_date)
+
+    student_stats = []
+    for i, (student_id, admission_number, first_name, last_name) in enumerate(students):
+        present, absent, late, half_day = (int(count) for count in report['counts'][i])
+        student_stats.append({
+            'id': student_id,
+            'name': f'{first_name} {last_name}',
+            'admission_number': admission_number,
+            'total_days': int(report['total_days'][i]),
+            'present': present,
+            'absent': absent,
+            'late': late,
+            'half_day': half_day,
+            'percentage': float(report['percentages'][i]),
+            'current_streak': int(report['present_streak'][i]),
+            'longest_absence': int(report['longest_absence'][i]),
+        })
+
+    weekdays = []
+    for day_name, counts in zip(WEEKDAYS, report['weekdays']):
+        total = int(counts.sum())
+        if total:
+            weekdays.append({
+                'day': day_name,
+                'present': int(counts[0]),
+                'absent': int(counts[1]),
+                'late': int(counts[2]),
+                'half_day': int(counts[3]),
+                'total': total,
+                'percentage': float(counts[0] * 100.0 / total),
+            })
+
+    total_records = int(report['total_days'].sum())
+    total_present = int(report['counts'][:, 0].sum()) if len(students) else 0
+    summary = {
+        'students': len(students),
+        'records': total_records,
+        'present': total_present,
+        'percentage': (total_present / total_records * 100) if total_records > 0 else 0,
+    }
+    return {'students': student_stats, 'weekdays': weekdays, 'summary': summary}
@@ -0,0 +1,125 @@
+"""
+Attendance rollups
+Per-student-per-month and per-section-per-day status counts kept in step with
+the attendance table, so dashboards and reports read O(months) rows
+"""
+from datetime import date, datetime, timedelta
+
+STATUS_INDEX = {'present': 0, 'absent': 1, 'late': 2, 'half_day': 3}
+
+
+def to_date(value):
+    """Accept a date or 'YYYY-MM-DD' string"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def month_start(value):
+    return to_date(value).replace(day=1)
+
+
+def next_month(value):
+    value = month_start(value)
+    return (value + timedelta(days=32)).replace(day=1)
+
+
+def split_range(start_date, end_date):
+    """
+    Split a date range into the whole months covered by the monthly rollup and
+    the partial-month edges that must come from raw attendance rows.
+    Returns ((first_month, last_month) or None, [(edge_start, edge_end), ...]).
+    """
+    start_date, end_date = to_date(start_date), to_date(end_date)
+    if start_date > end_date:
+        return None, []
+
+    first_full = start_date if start_date.day == 1 else next_month(start_date)
+    last_full = month_start(end_date + timedelta(days=1)) - timedelta(days=1)
+    if first_full > last_full:
+        return None, [(start_date, end_date)]
+
+    edges = []
+    if start_date < first_full:
+        edges.append((start_date, first_full - timedelta(days=1)))
+    if end_date > last_full:
+        edges.append((last_full + timedelta(days=1), end_date))
+    return (first_full, month_start(last_full)), edges
+
+
+def apply_attendance_changes(cursor, class_id, section_id, subject_id, attendance_date, changes):
+    """
+    Add status deltas for one attendance sheet to both rollup tables.
+    changes: iterable of (student_id, old_status or None, new_status).
+    Must run in the same transaction as the attendance write.
+    """
+    changes = list(changes)
+    if not changes:
+        return
+
+    month = month_start(attendance_date)
+    section_delta = [0, 0, 0, 0]
+    student_rows = []
+    for student_id, old_status, new_status in changes:
+        delta = [0, 0, 0, 0]
+        if old_status:
+            delta[STATUS_INDEX[old_status]] -= 1
+        delta[STATUS_INDEX[new_status]] += 1
+        for i in range(4):
+            section_delta[i] += delta[i]
+        student_rows.append((student_id, month, class_id, section_id, *delta))
+
+    cursor.executemany("""
+        INSERT INTO attendance_monthly_summary
+        (student_id, month_start, class_id, section_id, present_count, absent_count, late_count, half_day_count)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            present_count = present_count + VALUES(present_count),
+            absent_count = absent_count + VALUES(absent_count),
+            late_count = late_count + VALUES(late_count),
+            half_day_count = half_day_count + VALUES(half_day_count)
+    """, student_rows)
+
+    cursor.execute("""
+        INSERT INTO attendance_daily_section_summary
+        (class_id, section_id, attendance_date, subject_key, present_count, absent_count, late_count, half_day_count)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            present_count = present_count + VALUES(present_count),
+            absent_count = absent_count + VALUES(absent_count),
+            late_count = late_count + VALUES(late_count),
+            half_day_count = half_day_count + VALUES(half_day_count)
+    """, (class_id, section_id, to_date(attendance_date), subject_id or 0, *section_delta))
+
+
+def rebuild_month(cursor, month):
+    """Recompute both rollups for one calendar month from the attendance table"""
+    first_day = month_start(month)
+    last_day = next_month(first_day) - timedelta(days=1)
+
+    cursor.execute("DELETE FROM attendance_monthly_summary WHERE month_start = %s", (first_day,))
+    cursor.execute("""
+        INSERT INTO attendance_monthly_summary
+        (student_id, month_start, class_id, section_id, present_count, absent_count, late_count, half_day_count)
+        SELECT student_id, %s, class_id, section_id,
+               SUM(status = 'present'), SUM(status = 'absent'),
+               SUM(status = 'late'), SUM(status = 'half_day')
+        FROM attendance
+        WHERE attendance_date BETWEEN %s AND %s
+        GROUP BY student_id, class_id, section_id
+    """, (first_day, first_day, last_day))
+
+    cursor.execute("DELETE FROM attendance_daily_section_summary WHERE attendance_date BETWEEN %s AND %s",
+                   (first_day, last_day))
+    cursor.execute("""
+        INSERT INTO attendance_daily_section_summary
+        (class_id, section_id, attendance_date, subject_key, present_count, absent_count, late_count, half_day_count)
+        SELECT class_id, section_id, attendance_date, subject_key,
+               SUM(status = 'present'), SUM(status = 'absent'),
+               SUM(status = 'late'), SUM(status = 'half_day')
+        FROM attendance
+        WHERE attendance_date BETWEEN %s AND %s
+        GROUP BY class_id, section_id, attendance_date, subject_key
+    """, (first_day, last_day))
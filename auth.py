@@ -2,13 +2,26 @@
 Authentication Blueprint
 Handles user login, logout, and session management
 """
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
-from werkzeug.security import check_password_hash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, make_response
 from database import get_db
-from utils import require_login, get_current_user
+from utils import (require_login, get_current_user, remember_principal, principal_cache,
+                   check_password, check_dummy_password, hash_password, password_needs_rehash,
+                   PasswordHasherBusy)
+from rate_limit import check_login_attempt, login_succeeded
+from metrics import inc_counter
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
+def _upgrade_password_hash(user_id, password):
+    """Re-hash with the current PASSWORD_HASH_METHOD while the plain password is at hand"""
+    try:
+        password_hash = hash_password(password)
+    except PasswordHasherBusy:
+        return  # Try again on a quieter login
+    cursor = get_db()
+    cursor.execute("UPDATE users SET password_hash = %s WHERE id = %s", (password_hash, user_id))
+    cursor.connection.commit()
+
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
     """User login page and handler"""
@@ -20,22 +33,43 @@ def login():
             flash('Username and password are required.', 'danger')
             return render_template('auth/login.html')
         
+        # Throttle per client and per account before any DB or hashing work
+        allowed, retry_after, scope = check_login_attempt(request.remote_addr, username)
+        if not allowed:
+            inc_counter('sms_login_rate_limited_total', scope=scope)
+            flash(f'Too many login attempts. Please wait {retry_after} seconds and try again.', 'danger')
+            response = make_response(render_template('auth/login.html'), 429)
+            response.headers['Retry-After'] = str(retry_after)
+            return response
+        
         try:
             cursor = get_db()
-            cursor.execute(
-                "SELECT id, username, email, password_hash, role, is_active FROM users WHERE username = %s",
-                (username,)
-            )
+            principal_version = principal_cache.version()
+            # Resolve the teacher/student profile in the same round trip
+            cursor.execute("""
+                SELECT u.id, u.username, u.email, u.password_hash, u.role, u.is_active,
+                       t.id, s.id, s.class_id, s.section_id
+                FROM users u
+                LEFT JOIN teachers t ON t.user_id = u.id
+                LEFT JOIN students s ON s.user_id = u.id
+                WHERE u.username = %s
+            """, (username,))
             user = cursor.fetchone()
             
             if user and user[5]:  # Check if user exists and is active
                 # Verify password
-                if check_password_hash(user[3], password):
+                if check_password(user[3], password):
+                    login_succeeded(username)
+                    if password_needs_rehash(user[3]):
+                        _upgrade_password_hash(user[0], password)
+                    
                     # Set session
                     session['user_id'] = user[0]
                     session['username'] = user[1]
                     session['email'] = user[2]
                     session['role'] = user[4]
+                    remember_principal(teacher_id=user[6], student_id=user[7], class_id=user[8],
+                                       section_id=user[9], version=principal_version)
                     
                     flash(f'Welcome back, {user[1]}!', 'success')
                     
@@ -49,8 +83,12 @@ def login():
                 else:
                     flash('Invalid username or password.', 'danger')
             else:
+                check_dummy_password(password)  # Same response time as a wrong password
                 flash('Invalid username or password.', 'danger')
         
+        except PasswordHasherBusy:
+            flash('Too many sign-ins right now. Please try again in a moment.', 'warning')
+            return render_template('auth/login.html'), 503
         except Exception as e:
             flash('An error occurred. Please try again.', 'danger')
             print(f"Login error: {str(e)}")
@@ -0,0 +1,373 @@
+"""
+End-to-end benchmark suite for the hot routes
+Drives the app through realistic scenarios, either in-process (Flask test
+client) or over HTTP against a running server, and writes the results as JSON
+so runs can be compared across commits.
+
+    python benchmark.py                                   # in-process, every scenario
+    python benchmark.py --target http://localhost:5000 --server-pid 1234
+    python benchmark.py --scenario attendance_rush --concurrency 32
+    python benchmark.py --compare instance/benchmarks/<earlier run>.json
+
+Scenarios use existing accounts (e.g. from generate_dataset.py, whose accounts
+share one password). Queries per request are read from the Server-Timing
+header, so the server must not run with APP_ENV=production. Every benchmark
+client logs in from the same address, so the login rate limiter is turned off
+for in-process runs; start a server under test with LOGIN_RATE_LIMIT_ENABLED=0.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import re
+import resource
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+import numpy as np
+from config import Config
+from database import connect
+
+SCENARIOS = ('attendance_rush', 'month_end_reports', 'notes', 'login_storm')
+QUERY_COUNT = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+class InProcessClient:
+    """One user session against the app in this process"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        body = response.get_data()
+        response.close()
+        return response.status_code, response.headers.get('Server-Timing', ''), len(body)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpClient:
+    """One user session (cookie jar) against a running server"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect)
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        request = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                return response.status, response.headers.get('Server-Timing', ''), len(response.read())
+        except urllib.error.HTTPError as error:
+            return error.code, error.headers.get('Server-Timing', ''), len(error.read())
+
+
+class Recorder:
+    """Latency, status and query count of every request, by request name"""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def call(self, client, name, method, path, data=None, expect=(200,)):
+        started_at = time.perf_counter()
+        try:
+            status, server_timing, _ = client.request(method, path, data)
+        except Exception:
+            status, server_timing = None, ''
+        latency = time.perf_counter() - started_at
+        match = QUERY_COUNT.search(server_timing)
+        with self._lock:
+            self.samples.setdefault(name, []).append(
+                (latency, status in expect, int(match.group(1)) if match else None))
+        return status
+
+    def summary(self, duration):
+        result = {}
+        total = 0
+        for name, samples in sorted(self.samples.items()):
+            latencies = np.array([sample[0] for sample in samples]) * 1000
+            queries = [sample[2] for sample in samples if sample[2] is not None]
+            total += len(samples)
+            result[name] = {
+                'requests': len(samples),
+                'errors': sum(1 for sample in samples if not sample[1]),
+                'latency_ms': {
+                    'p50': round(float(np.percentile(latencies, 50)), 2),
+                    'p95': round(float(np.percentile(latencies, 95)), 2),
+                    'p99': round(float(np.percentile(latencies, 99)), 2),
+                    'max': round(float(latencies.max()), 2),
+                    'mean': round(float(latencies.mean()), 2),
+                },
+                'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+            }
+        return {
+            'duration_s': round(duration, 3),
+            'requests': total,
+            'throughput_rps': round(total / duration, 2) if duration else 0,
+            'routes': result,
+        }
+
+
+def _run_workers(workers, make_client, work):
+    """Run work(client, worker_index) on `workers` threads, each with its own session"""
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(work, make_client(), i) for i in range(workers)]
+        for future in futures:
+            future.result()
+    return time.perf_counter() - started_at
+
+
+def _login(recorder, client, username, password):
+    return recorder.call(client, 'login', 'POST', '/auth/login',
+                         {'username': username, 'password': password}, expect=(302,))
+
+
+def _fixtures(args):
+    """Accounts and ids the scenarios need, read straight from the database"""
+    connection = connect()
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT u.username, ct.class_id, ct.section_id
+        FROM class_teachers ct
+        JOIN teachers t ON t.id = ct.teacher_id
+        JOIN users u ON u.id = t.user_id
+        WHERE u.is_active = TRUE
+        ORDER BY ct.id
+        LIMIT %s
+    """, (args.concurrency,))
+    teachers = []
+    for username, class_id, section_id in cursor.fetchall():
+        cursor.execute("SELECT id FROM students WHERE class_id = %s AND section_id = %s AND is_active = TRUE",
+                       (class_id, section_id))
+        teachers.append((username, class_id, section_id, [row[0] for row in cursor.fetchall()]))
+
+    cursor.execute("SELECT class_id, id FROM sections ORDER BY id")
+    sections = cursor.fetchall()
+
+    cursor.execute("""
+        SELECT u.username, s.class_id, s.section_id
+        FROM students s JOIN users u ON u.id = s.user_id
+        WHERE u.is_active = TRUE AND s.class_id IS NOT NULL
+        ORDER BY s.id
+        LIMIT %s
+    """, (max(args.concurrency, args.logins),))
+    students = []
+    for username, class_id, section_id in cursor.fetchall():
+        cursor.execute("""
+            SELECT id FROM notes
+            WHERE class_id = %s AND (section_id IS NULL OR section_id = %s) AND is_active = TRUE
+            ORDER BY id DESC LIMIT 20
+        """, (class_id, section_id))
+        students.append((username, [row[0] for row in cursor.fetchall()]))
+    connection.close()
+    return {'teachers': teachers, 'sections': sections, 'students': students}
+
+
+def attendance_rush(args, fixtures, make_client, recorder):
+    """Every class teacher opens and submits their sheet at the same time"""
+    teachers = fixtures['teachers']
+    if not teachers:
+        raise SystemExit('[ERROR] attendance_rush needs class teachers with assigned sections')
+
+    def work(client, i):
+        username, class_id, section_id, student_ids = teachers[i % len(teachers)]
+        rng = random.Random(args.seed + i)
+        _login(recorder, client, username, args.password)
+        for _ in range(args.iterations):
+            recorder.call(client, 'mark_attendance GET', 'GET',
+                          f'/attendance/mark?class_id={class_id}&section_id={section_id}&date={args.date}')
+            form = {'class_id': class_id, 'section_id': section_id, 'attendance_date': args.date}
+            for student_id in student_ids:
+                form[f'student_{student_id}'] = rng.choices(
+                    ('present', 'absent', 'late', 'half_day'), (90, 6, 3, 1))[0]
+            recorder.call(client, 'mark_attendance POST', 'POST', '/attendance/mark', form, expect=(302,))
+
+    return _run_workers(min(args.concurrency, len(teachers)), make_client, work)
+
+
+def month_end_reports(args, fixtures, make_client, recorder):
+    """Admins pull 30-day class-wise reports for random sections"""
+    sections = fixtures['sections']
+    end_date = datetime.strptime(args.date, '%Y-%m-%d').date()
+    start_date = end_date - timedelta(days=29)
+
+    def work(client, i):
+        rng = random.Random(args.seed + i)
+        _login(recorder, client, args.admin_user, args.admin_password)
+        for _ in range(args.iterations):
+            class_id, section_id = rng.choice(sections)
+            recorder.call(client, 'class_wise_report', 'GET',
+                          f'/attendance/reports/class-wise?class_id={class_id}&section_id={section_id}'
+                          f'&start_date={start_date}&end_date={end_date}')
+
+    return _run_workers(args.concurrency, make_client, work)
+
+
+def notes(args, fixtures, make_client, recorder):
+    """Students browse their notes list and download a few files"""
+    students = [student for student in fixtures['students'] if student[1]]
+    if not students:
+        raise SystemExit('[ERROR] notes needs students whose class has notes')
+
+    def work(client, i):
+        username, note_ids = students[i % len(students)]
+        rng = random.Random(args.seed + i)
+        _login(recorder, client, username, args.password)
+        for _ in range(args.iterations):
+            recorder.call(client, 'list_notes', 'GET', '/notes/list')
+            for note_id in rng.sample(note_ids, min(3, len(note_ids))):
+                recorder.call(client, 'download_notes', 'GET', f'/notes/download/{note_id}')
+
+    return _run_workers(min(args.concurrency, len(students)), make_client, work)
+
+
+def login_storm(args, fixtures, make_client, recorder):
+    """Many distinct users log in at once (plus some wrong passwords)"""
+    students = fixtures['students'][:args.logins]
+    if not students:
+        raise SystemExit('[ERROR] login_storm needs student accounts')
+    per_worker = max(len(students) // args.concurrency, 1)
+
+    def work(_, i):
+        for username, _ in students[i * per_worker:(i + 1) * per_worker]:
+            client = make_client()
+            _login(recorder, client, username, args.password)
+        client = make_client()
+        recorder.call(client, 'login (bad password)', 'POST', '/auth/login',
+                      {'username': students[i % len(students)][0], 'password': 'wrong-password'})
+
+    return _run_workers(min(args.concurrency, len(students)), make_client, work)
+
+
+def _peak_rss_mb(server_pid):
+    """Peak RSS of this process, or of a server process and its children"""
+    if server_pid is None:
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    total_kb = 0
+    pids = [server_pid]
+    try:
+        with open(f'/proc/{server_pid}/task/{server_pid}/children') as children_file:
+            pids += [int(pid) for pid in children_file.read().split()]
+    except OSError:
+        pass
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/status') as status_file:
+                for line in status_file:
+                    if line.startswith('VmHWM:'):
+                        total_kb += int(line.split()[1])
+        except OSError:
+            continue
+    return round(total_kb / 1024, 1)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline_path):
+    """Print p95 latency and throughput changes against an earlier run"""
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    print(f"\nCompared with {baseline.get('commit')} ({baseline_path}):")
+    for name, scenario in current['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if not before:
+            continue
+        change = (scenario['throughput_rps'] / before['throughput_rps'] - 1) * 100 if before['throughput_rps'] else 0
+        print(f"  {name}: {before['throughput_rps']} -> {scenario['throughput_rps']} req/s ({change:+.1f}%)")
+        for route, stats in scenario['routes'].items():
+            old = before['routes'].get(route)
+            if old:
+                print(f"    {route}: p95 {old['latency_ms']['p95']} -> {stats['latency_ms']['p95']} ms, "
+                      f"queries {old['queries_per_request']} -> {stats['queries_per_request']}")
+
+
+def run(args):
+    if args.target == 'inprocess':
+        from app import create_app
+        Config.LOGIN_RATE_LIMIT_ENABLED = False  # Every client is 127.0.0.1
+        app = create_app()
+        make_client = lambda: InProcessClient(app)
+    else:
+        make_client = lambda: HttpClient(args.target)
+
+    fixtures = _fixtures(args)
+    results = {
+        'commit': _git_commit(),
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'target': args.target,
+        'options': {key: value for key, value in vars(args).items()
+                    if key not in ('password', 'admin_password', 'compare', 'output')},
+        'scenarios': {},
+    }
+    for name in args.scenario:
+        recorder = Recorder()
+        duration = globals()[name](args, fixtures, make_client, recorder)
+        results['scenarios'][name] = recorder.summary(duration)
+        summary = results['scenarios'][name]
+        print(f"[OK] {name}: {summary['requests']} requests in {summary['duration_s']}s "
+              f"({summary['throughput_rps']} req/s)")
+        for route, stats in summary['routes'].items():
+            latency = stats['latency_ms']
+            print(f"    {route}: p50 {latency['p50']} / p95 {latency['p95']} / p99 {latency['p99']} ms, "
+                  f"{stats['queries_per_request']} queries, {stats['errors']} errors")
+    results['peak_rss_mb'] = _peak_rss_mb(args.server_pid)
+    print(f"    peak RSS: {results['peak_rss_mb']} MB")
+
+    output = args.output or os.path.join(
+        Config.RUNTIME_FOLDER, 'benchmarks',
+        f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{results['commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"\n[OK] Results written to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+    return results
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the hot routes')
+    parser.add_argument('--target', default='inprocess', help="'inprocess' or a server URL")
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                        help='Scenario to run (repeatable, default: all)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent user sessions')
+    parser.add_argument('--iterations', type=int, default=5, help='Iterations per session')
+    parser.add_argument('--logins', type=int, default=200, help='Accounts used by login_storm')
+    parser.add_argument('--date', default=date.today().isoformat(), help='Attendance/report date (YYYY-MM-DD)')
+    parser.add_argument('--password', default='password123', help='Password of teacher/student accounts')
+    parser.add_argument('--admin-user', default='admin')
+    parser.add_argument('--admin-password', default='admin123')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--server-pid', type=int, help='Server (e.g. gunicorn master) pid for peak RSS over HTTP')
+    parser.add_argument('--output', help='Results file (default: instance/benchmarks/<time>-<commit>.json)')
+    parser.add_argument('--compare', help='Earlier results file to compare against')
+    args = parser.parse_args()
+    args.scenario = args.scenario or list(SCENARIOS)
+    return args
+
+
+if __name__ == '__main__':
+    print("Running benchmarks...")
+    print("-" * 50)
+    run(_parse_args())
@@ -0,0 +1,116 @@
+"""
+Content-addressed storage for note files
+Every distinct file is stored once, named by its SHA-256 (under NOTES_FOLDER,
+in the layout of storage.py), with a row in note_blobs counting the active
+notes that use it. Uploading a file that is already stored only adds a
+reference; soft-deleting the last note that uses a blob removes the file.
+
+The note_blobs row is the lock: adding and collecting a blob both lock it
+(SELECT ... FOR UPDATE) and touch the file only while holding it, so an upload
+never loses its file to a concurrent delete of the same content.
+"""
+import hashlib
+import os
+import uuid
+from config import Config
+from metrics import inc_counter
+from storage import shard_path
+
+READ_SIZE = 64 * 1024
+
+
+def blob_path(sha256):
+    return shard_path(Config.NOTES_FOLDER, sha256)
+
+
+def temp_path():
+    """A fresh path next to the blobs (so adding one is a rename)"""
+    os.makedirs(Config.NOTES_FOLDER, exist_ok=True)
+    return os.path.join(Config.NOTES_FOLDER, f'.incoming-{uuid.uuid4().hex}')
+
+
+def save_stream(stream, path=None):
+    """Copy stream to a temp file, hashing it on the way; returns (path, sha256, size)"""
+    path = path or temp_path()
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, 'wb') as out:
+            while True:
+                block = stream.read(READ_SIZE)
+                if not block:
+                    break
+                digest.update(block)
+                out.write(block)
+                size += len(block)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, digest.hexdigest(), size
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def add_reference(cursor, source_path, sha256, size):
+    """
+    Reference the blob with this content inside the cursor's transaction,
+    storing source_path as the blob if it is new (source_path is consumed
+    either way). Returns (blob path, created). If the transaction is rolled
+    back and created is True, call drop_new_blob before the rollback.
+    """
+    path = blob_path(sha256)
+    cursor.execute("""
+        INSERT INTO note_blobs (sha256, file_path, file_size, ref_count) VALUES (%s, %s, %s, 1)
+        ON DUPLICATE KEY UPDATE ref_count = ref_count + 1
+    """, (sha256, path, size))
+    # rowcount is 1 for a new row, 2 for an existing one; either way the row is now locked
+    created = cursor.rowcount == 1
+    cursor.execute("SELECT file_path FROM note_blobs WHERE sha256 = %s FOR UPDATE", (sha256,))
+    path = cursor.fetchone()[0]
+    if created or not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(source_path, path)
+        created = True
+    else:
+        os.remove(source_path)
+        inc_counter('sms_note_blob_dedup_bytes_total', size)
+    return path, created
+
+
+def drop_new_blob(path):
+    """Remove a blob created by add_reference in a transaction about to roll back"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def release_reference(cursor, sha256):
+    """Drop one reference inside the cursor's transaction; call collect_blob after the commit"""
+    cursor.execute("UPDATE note_blobs SET ref_count = ref_count - 1 WHERE sha256 = %s AND ref_count > 0",
+                   (sha256,))
+
+
+def collect_blob(cursor, sha256):
+    """Delete the blob (file and row) if no active note references it; commits. True if deleted"""
+    cursor.execute("SELECT file_path, ref_count, file_size FROM note_blobs WHERE sha256 = %s FOR UPDATE",
+                   (sha256,))
+    row = cursor.fetchone()
+    if not row or row[1] > 0:
+        cursor.connection.commit()
+        return False
+    path, _, size = row
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    cursor.execute("DELETE FROM note_blobs WHERE sha256 = %s", (sha256,))
+    cursor.connection.commit()
+    inc_counter('sms_note_blob_freed_bytes_total', size or 0)
+    return True
@@ -0,0 +1,76 @@
+"""
+In-process cache utilities
+Versioned TTL caches whose invalidation is shared by all worker processes
+"""
+import os
+import threading
+import time
+import uuid
+from config import Config
+
+_caches = []
+
+
+class VersionedCache:
+    """
+    Thread-safe key/value cache with a TTL and a shared version stamp.
+
+    The version lives in a small file under CACHE_VERSION_FOLDER; invalidate()
+    atomically replaces that file, so every gunicorn worker notices the change
+    on its next lookup (one stat call, no database query).
+    """
+
+    def __init__(self, name, ttl):
+        self.name = name
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._version_path = os.path.join(Config.CACHE_VERSION_FOLDER, f'{name}.version')
+        _caches.append(self)
+
+    def version(self):
+        """Current shared version stamp (changes on every invalidate)"""
+        try:
+            stat = os.stat(self._version_path)
+        except FileNotFoundError:
+            return None
+        return f'{stat.st_ino}:{stat.st_mtime_ns}'
+
+    def get(self, key, loader):
+        """Return the cached value for key, calling loader() on a miss"""
+        version = self.version()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version and entry[1] > now:
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        value = loader()
+        with self._lock:
+            self._entries[key] = (version, now + self.ttl, value)
+        return value
+
+    def invalidate(self):
+        """Drop every entry in this and all other worker processes"""
+        os.makedirs(Config.CACHE_VERSION_FOLDER, exist_ok=True)
+        tmp_path = f'{self._version_path}.{uuid.uuid4().hex}'
+        with open(tmp_path, 'w') as version_file:
+            version_file.write(uuid.uuid4().hex)
+        os.replace(tmp_path, self._version_path)
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit/miss counters for monitoring"""
+        with self._lock:
+            return {'name': self.name, 'entries': len(self._entries),
+                    'hits': self.hits, 'misses': self.misses}
+
+
+def get_cache_stats():
+    """Hit/miss counters of every VersionedCache in this worker"""
+    return [cache.stats() for cache in _caches]
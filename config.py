@@ -6,10 +6,79 @@ load_dotenv()
 class Config:
     """Application configuration"""
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
+    APP_ENV = os.environ.get('APP_ENV') or 'development'  # 'production' hides diagnostic headers
     MYSQL_HOST = os.environ.get('MYSQL_HOST') or 'localhost'
     MYSQL_USER = os.environ.get('MYSQL_USER') or 'root'
     MYSQL_PASSWORD = os.environ.get('MYSQL_PASSWORD') or 'root'  # Change this to your MySQL password
     MYSQL_DB = os.environ.get('MYSQL_DB') or 'school_management'
+    MYSQL_PORT = int(os.environ.get('MYSQL_PORT') or 3306)
+    MYSQL_CHARSET = os.environ.get('MYSQL_CHARSET') or 'utf8mb4'
+    MYSQL_CONNECT_TIMEOUT = int(os.environ.get('MYSQL_CONNECT_TIMEOUT') or 10)
+    
+    # Connection pool settings (per worker process)
+    DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE') or 2)
+    DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE') or 10)
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT') or 5)  # seconds to queue when exhausted
+    DB_POOL_MAX_LIFETIME = int(os.environ.get('DB_POOL_MAX_LIFETIME') or 1800)  # recycle after N seconds
+    DB_POOL_PING_INTERVAL = float(os.environ.get('DB_POOL_PING_INTERVAL') or 0)  # 0 = ping on every borrow
+    
+    # Read replicas for get_db(readonly=True), comma-separated hosts
+    MYSQL_REPLICAS = [h.strip() for h in (os.environ.get('MYSQL_REPLICAS') or '').split(',') if h.strip()]
+    REPLICA_MAX_LAG = int(os.environ.get('REPLICA_MAX_LAG') or 5)  # seconds behind primary before fallback
+    REPLICA_LAG_CHECK_INTERVAL = int(os.environ.get('REPLICA_LAG_CHECK_INTERVAL') or 5)
+    READ_YOUR_WRITES_WINDOW = int(os.environ.get('READ_YOUR_WRITES_WINDOW') or 10)  # seconds pinned to primary after a commit
+    
+    # Query instrumentation (per-request SQL count/timing, Server-Timing header outside production)
+    QUERY_STATS_ENABLED = (os.environ.get('QUERY_STATS_ENABLED') or '1') == '1'
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS') or 200)  # log statements slower than this
+    N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD') or 5)  # same fingerprint N times per request
+    
+    # Runtime state shared by worker processes (cache versions, etc.)
+    RUNTIME_FOLDER = os.environ.get('RUNTIME_FOLDER') or 'instance'
+    CACHE_VERSION_FOLDER = os.path.join(RUNTIME_FOLDER, 'cache')
+    REFERENCE_CACHE_TTL = int(os.environ.get('REFERENCE_CACHE_TTL') or 3600)  # seconds
+    
+    # Prometheus metrics at /metrics, merged from per-worker snapshots
+    METRICS_ENABLED = (os.environ.get('METRICS_ENABLED') or '1') == '1'
+    METRICS_FOLDER = os.path.join(RUNTIME_FOLDER, 'metrics')
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL') or 1)  # seconds between snapshots
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or ''  # require "Authorization: Bearer <token>" when set
+    
+    # Admin request profiler (?_profile=1 or X-Profile: 1 on any page)
+    PROFILE_FOLDER = os.path.join(RUNTIME_FOLDER, 'profiles')
+    PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL') or 0.005)  # seconds between stack samples
+    PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP') or 50)  # most recent captures kept on disk
+    
+    # Password hashing (werkzeug method string with all parameters, e.g. pbkdf2:sha256:600000)
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt:32768:8:1'  # older hashes upgraded on login
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or 2)  # hashing processes per worker, 0 = inline
+    PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE') or 16)  # pending hashes before logins are turned away
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT') or 10)  # seconds
+    
+    # Login rate limiting (token buckets shared by all workers via RUNTIME_FOLDER/ratelimit.sqlite3)
+    LOGIN_RATE_LIMIT_ENABLED = (os.environ.get('LOGIN_RATE_LIMIT_ENABLED') or '1') == '1'
+    LOGIN_IP_BURST = int(os.environ.get('LOGIN_IP_BURST') or 100)  # attempts per client IP before throttling
+    LOGIN_IP_PER_MINUTE = float(os.environ.get('LOGIN_IP_PER_MINUTE') or 60)  # a school NAT can be one IP
+    LOGIN_USER_BURST = int(os.environ.get('LOGIN_USER_BURST') or 10)  # attempts per username before throttling
+    LOGIN_USER_PER_MINUTE = float(os.environ.get('LOGIN_USER_PER_MINUTE') or 2)
+    PROXY_FIX_HOPS = int(os.environ.get('PROXY_FIX_HOPS') or 0)  # reverse proxies in front of the app (X-Forwarded-For)
+    
+    # Bulk student import (/student/import and import_students.py)
+    IMPORT_FOLDER = os.path.join(RUNTIME_FOLDER, 'imports')  # job status and per-row result files
+    IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE') or 500)  # students per transaction
+    IMPORT_HASH_WORKERS = int(os.environ.get('IMPORT_HASH_WORKERS') or 0)  # hashing processes, 0 = one per CPU
+    
+    # Student search index (per worker, kept current through a shared change journal)
+    SEARCH_FOLDER = os.path.join(RUNTIME_FOLDER, 'search')
+    
+    # Notes full-text index (SEARCH_FOLDER/notes.sqlite3), fed by a background indexer
+    NOTE_INDEX_WORKER = (os.environ.get('NOTE_INDEX_WORKER') or '1') == '1'  # app workers may run the indexer (one at a time); 0 when only index_notes.py --watch does
+    NOTE_INDEX_POLL = float(os.environ.get('NOTE_INDEX_POLL') or 5)  # seconds between queue checks when idle
+    NOTE_TEXT_MAX_CHARS = int(os.environ.get('NOTE_TEXT_MAX_CHARS') or 500000)  # text indexed per document
+    
+    # Listing pages (students, teachers, users, notes)
+    PAGE_SIZE = int(os.environ.get('PAGE_SIZE') or 50)  # rows per page unless ?per_page= asks otherwise
+    MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE') or 200)
     
     # File upload settings
     UPLOAD_FOLDER = 'uploads'
@@ -17,3 +86,14 @@ class Config:
     NOTES_FOLDER = 'uploads/notes'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx', 'ppt', 'pptx', 'png', 'jpg', 'jpeg'}
+    UPLOAD_SHARD_DEPTH = int(os.environ.get('UPLOAD_SHARD_DEPTH') or 2)  # levels of 256 hash-prefixed subdirectories per upload folder
+    
+    # Chunked note uploads: each chunk is one request under MAX_CONTENT_LENGTH, so files can be larger
+    UPLOAD_SESSIONS_FOLDER = os.path.join(UPLOAD_FOLDER, 'partial')  # part files; same filesystem as NOTES_FOLDER
+    UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE') or 8 * 1024 * 1024)  # bytes per chunk, below MAX_CONTENT_LENGTH
+    MAX_CHUNKED_UPLOAD_SIZE = int(os.environ.get('MAX_CHUNKED_UPLOAD_SIZE') or 200 * 1024 * 1024)  # largest file
+    UPLOAD_SESSION_TTL = int(os.environ.get('UPLOAD_SESSION_TTL') or 24 * 3600)  # seconds before an abandoned upload is removed
+    
+    # Downloads: let the front proxy send protected files after the access check
+    DOWNLOAD_OFFLOAD = (os.environ.get('DOWNLOAD_OFFLOAD') or '').lower()  # '', 'x-accel-redirect' (nginx) or 'x-sendfile'
+    DOWNLOAD_ACCEL_PREFIX = os.environ.get('DOWNLOAD_ACCEL_PREFIX') or '/protected-uploads/'  # internal nginx location for UPLOAD_FOLDER
@@ -5,6 +5,8 @@ from werkzeug.security import generate_password_hash
 from flask import Flask
 from config import Config
 from database import init_db, get_db
+from academic_years import get_current_academic_year_id
+from admission import allocate_admission_number
 from datetime import date
 
 def create_student():
@@ -34,15 +36,7 @@ def create_student():
             section_id = section_result[0] if section_result else None
             
             # Get current academic year
-            cursor.execute("SELECT id FROM academic_years WHERE is_current = TRUE LIMIT 1")
-            academic_year_result = cursor.fetchone()
-            academic_year_id = academic_year_result[0] if academic_year_result else None
-            
-            # Generate admission number
-            year = date.today().year
-            cursor.execute("SELECT COUNT(*) FROM students WHERE admission_number LIKE %s", (f'ADM{year}%',))
-            count = cursor.fetchone()[0]
-            admission_number = f'ADM{year}{str(count + 1).zfill(4)}'
+            academic_year_id = get_current_academic_year_id()
             
             # Check if student user already exists
             cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
@@ -58,9 +52,17 @@ def create_student():
                 )
                 cursor.connection.commit()
                 print(f"[OK] Password updated for user '{username}'")
+                cursor.execute("SELECT admission_number FROM students WHERE user_id = %s", (existing_user[0],))
+                student_result = cursor.fetchone()
+                admission_number = student_result[0] if student_result else 'N/A'
             else:
-                # Create user account
+                # Hash first: the admission number's row lock is held until commit
                 password_hash = generate_password_hash(password)
+                
+                # Reserve an admission number
+                admission_number = allocate_admission_number(cursor)
+                
+                # Create user account
                 cursor.execute(
                     "INSERT INTO users (username, email, password_hash, role, is_active) VALUES (%s, %s, %s, %s, %s)",
                     (username, email, password_hash, 'student', True)
@@ -1,29 +1,457 @@
 """
 Database connection utility module
-Handles MySQL connection using Flask-MySQLdb
+Handles pooled MySQL connections (MySQLdb) shared by every request of a worker,
+with optional read-only routing to replicas
 """
-from flask import g
-from flask_mysqldb import MySQL
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from flask import g, session, has_request_context
+import MySQLdb
+from MySQLdb.connections import Connection
+from MySQLdb.cursors import DictCursor
 from config import Config
+from query_stats import InstrumentedCursor, InstrumentedSSCursor
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes free within the checkout timeout"""
+
+
+class PooledConnection(Connection):
+    """MySQLdb connection that remembers its age and last use"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.on_commit = None
+
+    def commit(self):
+        super().commit()
+        if self.on_commit is not None:
+            self.on_commit()
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of MySQL connections for one worker process.
+
+    Connections are opened lazily up to max_size. When every connection is
+    borrowed, acquire() waits up to `timeout` seconds for one to be released
+    before raising PoolTimeout. Borrowed connections are pinged (when idle for
+    longer than `ping_interval`) and recycled once older than `max_lifetime`.
+    """
+
+    def __init__(self, connect_kwargs, min_size=1, max_size=10, timeout=5.0,
+                 max_lifetime=1800, ping_interval=0, name='primary', on_commit=None):
+        self.connect_kwargs = connect_kwargs
+        self.on_commit = on_commit
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.ping_interval = ping_interval
+        self.name = name
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._reset()
+
+    def _reset(self):
+        """Start with an empty pool owned by the current process"""
+        self._pid = os.getpid()
+        self._idle = deque()
+        self._size = 0
+        self._borrowed = 0
+        self._waiting = 0
+        self._warmed = False
+        self._counters = {
+            'created': 0,
+            'recycled': 0,
+            'ping_failures': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'acquired': 0,
+        }
+
+    def _check_fork(self):
+        """Drop state inherited from a parent process (e.g. gunicorn --preload)"""
+        if self._pid != os.getpid():
+            # Keep references to the parent's sockets so they are never
+            # closed (and the parent's sessions killed) from this process.
+            self._inherited = list(self._idle)
+            self._reset()
+
+    def _connect(self):
+        connection = PooledConnection(**self.connect_kwargs)
+        connection.on_commit = self.on_commit
+        with self._lock:
+            self._counters['created'] += 1
+        return connection
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _warm_up(self):
+        """Open min_size connections the first time this process uses the pool"""
+        with self._lock:
+            if self._warmed:
+                return
+            self._warmed = True
+            missing = max(self.min_size - self._size, 0)
+            self._size += missing
+        for _ in range(missing):
+            try:
+                connection = self._connect()
+            except Exception:
+                with self._available:
+                    self._size -= 1
+                continue
+            with self._available:
+                self._idle.append(connection)
+                self._available.notify()
+
+    def _validate(self, connection):
+        """Return the connection if usable, otherwise close it and return None"""
+        now = time.monotonic()
+        if self.max_lifetime and now - connection.created_at > self.max_lifetime:
+            self._close(connection)
+            with self._lock:
+                self._counters['recycled'] += 1
+            return None
+        if now - connection.last_used >= self.ping_interval:
+            try:
+                connection.ping()
+            except Exception:
+                self._close(connection)
+                with self._lock:
+                    self._counters['ping_failures'] += 1
+                return None
+        return connection
+
+    def acquire(self):
+        """Borrow a connection, queueing briefly if the pool is exhausted"""
+        self._check_fork()
+        if not self._warmed:
+            self._warm_up()
+
+        deadline = time.monotonic() + self.timeout
+        connection = None
+        with self._available:
+            waited = False
+            while True:
+                if self._idle:
+                    connection = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    raise PoolTimeout(
+                        f"No {self.name} database connection available after {self.timeout}s "
+                        f"({self.max_size} in use)"
+                    )
+                if not waited:
+                    self._counters['waits'] += 1
+                    waited = True
+                self._waiting += 1
+                self._available.wait(remaining)
+                self._waiting -= 1
+            self._borrowed += 1
+            self._counters['acquired'] += 1
+
+        if connection is not None:
+            connection = self._validate(connection)
+        if connection is None:
+            try:
+                connection = self._connect()
+            except Exception:
+                with self._available:
+                    self._size -= 1
+                    self._borrowed -= 1
+                    self._available.notify()
+                raise
+        return connection
+
+    def release(self, connection, discard=False):
+        """Return a borrowed connection, rolling back any open transaction"""
+        if self._pid != os.getpid():
+            return
+        if not discard:
+            try:
+                # Ends the implicit transaction so the next borrower does not
+                # read from a stale REPEATABLE READ snapshot.
+                connection.rollback()
+                connection.last_used = time.monotonic()
+            except Exception:
+                discard = True
+        if not discard and self.max_lifetime and \
+                time.monotonic() - connection.created_at > self.max_lifetime:
+            discard = True
+            with self._lock:
+                self._counters['recycled'] += 1
+
+        if discard:
+            self._close(connection)
+        with self._available:
+            self._borrowed -= 1
+            if discard:
+                self._size -= 1
+            else:
+                self._idle.append(connection)
+            self._available.notify()
+
+    def close_all(self):
+        """Close every idle connection (borrowed ones are closed on release)"""
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+        for connection in idle:
+            self._close(connection)
+
+    def stats(self):
+        """Snapshot of pool usage for monitoring"""
+        with self._lock:
+            stats = {
+                'name': self.name,
+                'size': self._size,
+                'idle': len(self._idle),
+                'borrowed': self._borrowed,
+                'waiting': self._waiting,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+            }
+            stats.update(self._counters)
+        return stats
+
+
+class Replica:
+    """A read replica with its own pool and cached replication lag"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.lag = None
+        self.healthy = True
+        self.checked_at = 0.0
+        self._check_lock = threading.Lock()
+
+    def _read_lag(self):
+        """Seconds behind the primary, or None if replication is stopped"""
+        connection = self.pool.acquire()
+        discard = False
+        try:
+            cursor = connection.cursor(DictCursor)
+            try:
+                try:
+                    cursor.execute("SHOW REPLICA STATUS")
+                except MySQLdb.Error:
+                    cursor.execute("SHOW SLAVE STATUS")
+                status = cursor.fetchone()
+            finally:
+                cursor.close()
+        except Exception:
+            discard = True
+            raise
+        finally:
+            self.pool.release(connection, discard=discard)
+        if not status:
+            return 0  # Not replicating: a mirror that is always current
+        if 'Seconds_Behind_Source' in status:
+            return status['Seconds_Behind_Source']
+        return status.get('Seconds_Behind_Master')
+
+    def is_usable(self):
+        """Re-check lag at most every REPLICA_LAG_CHECK_INTERVAL seconds"""
+        now = time.monotonic()
+        if now - self.checked_at >= Config.REPLICA_LAG_CHECK_INTERVAL and \
+                self._check_lock.acquire(blocking=False):
+            try:
+                try:
+                    self.lag = self._read_lag()
+                except Exception:
+                    self.lag = None
+                self.healthy = self.lag is not None and self.lag <= Config.REPLICA_MAX_LAG
+                self.checked_at = now
+            finally:
+                self._check_lock.release()
+        return self.healthy
+
+    def mark_failed(self):
+        """Take the replica out of rotation until the next lag check"""
+        self.healthy = False
+        self.checked_at = time.monotonic()
+
+    def stats(self):
+        stats = self.pool.stats()
+        stats.update({'lag': self.lag, 'healthy': self.healthy})
+        return stats
+
+
+_pool = None
+_replicas = []
+_replica_cycle = None
+
+
+def _connect_kwargs(host):
+    """MySQLdb connection arguments for the given host"""
+    return {
+        'host': host,
+        'port': Config.MYSQL_PORT,
+        'user': Config.MYSQL_USER,
+        'passwd': Config.MYSQL_PASSWORD,
+        'db': Config.MYSQL_DB,
+        'charset': Config.MYSQL_CHARSET,
+        'use_unicode': True,
+        'connect_timeout': Config.MYSQL_CONNECT_TIMEOUT,
+    }
+
+
+def connect(**overrides):
+    """Open a standalone (unpooled) connection to the primary, e.g. for CLI scripts"""
+    kwargs = _connect_kwargs(Config.MYSQL_HOST)
+    kwargs.update(overrides)
+    return MySQLdb.connect(**kwargs)
+
+
+def _pool_for(host, name, on_commit=None):
+    return ConnectionPool(
+        _connect_kwargs(host),
+        min_size=Config.DB_POOL_MIN_SIZE,
+        max_size=Config.DB_POOL_MAX_SIZE,
+        timeout=Config.DB_POOL_TIMEOUT,
+        max_lifetime=Config.DB_POOL_MAX_LIFETIME,
+        ping_interval=Config.DB_POOL_PING_INTERVAL,
+        name=name,
+        on_commit=on_commit,
+    )
+
+
+def _remember_write():
+    """Pin this session's reads to the primary for a short window after a commit"""
+    if has_request_context():
+        session['db_written_at'] = time.time()
+
+
+def _reads_pinned_to_primary():
+    written_at = session.get('db_written_at') if has_request_context() else None
+    return written_at is not None and time.time() - written_at < Config.READ_YOUR_WRITES_WINDOW
 
-mysql = MySQL()
 
 def init_db(app):
-    """Initialize MySQL connection with Flask app"""
+    """Create the connection pools used by get_db()"""
+    global _pool, _replica_cycle
     app.config['MYSQL_HOST'] = Config.MYSQL_HOST
     app.config['MYSQL_USER'] = Config.MYSQL_USER
     app.config['MYSQL_PASSWORD'] = Config.MYSQL_PASSWORD
     app.config['MYSQL_DB'] = Config.MYSQL_DB
-    mysql.init_app(app)
+    if _pool is None:
+        _pool = _pool_for(Config.MYSQL_HOST, 'primary', on_commit=_remember_write)
+        for host in Config.MYSQL_REPLICAS:
+            _replicas.append(Replica(_pool_for(host, f'replica:{host}')))
+        _replica_cycle = itertools.cycle(range(len(_replicas))) if _replicas else None
+
+
+def get_pool_stats():
+    """Return usage statistics of this worker's connection pools"""
+    if _pool is None:
+        return []
+    return [_pool.stats()] + [replica.stats() for replica in _replicas]
+
+
+def _borrow_replica():
+    """Borrow a connection from the next usable replica: (pool, connection) or (None, None)"""
+    for _ in range(len(_replicas)):
+        replica = _replicas[next(_replica_cycle)]
+        if not replica.is_usable():
+            continue
+        try:
+            return replica.pool, replica.pool.acquire()
+        except Exception:
+            replica.mark_failed()
+    return None, None
+
 
-def get_db():
-    """Get MySQL cursor for executing queries"""
+def _replica_cursor():
+    """Borrow a cursor from the next usable replica, or None to use the primary"""
+    pool, connection = _borrow_replica()
+    if connection is None:
+        return None
+    g.db_replica_connection = connection
+    g.db_replica_pool = pool
+    return connection.cursor(InstrumentedCursor)
+
+
+def get_db(readonly=False):
+    """
+    Get MySQL cursor for executing queries.
+    readonly=True may route to a replica unless replication lags, this session
+    committed recently, or the request already holds a primary connection.
+    """
+    if readonly and _replicas and 'db' not in g and not _reads_pinned_to_primary():
+        if 'db_replica' not in g:
+            cursor = _replica_cursor()
+            if cursor is None:
+                return get_db()
+            g.db_replica = cursor
+        return g.db_replica
     if 'db' not in g:
-        g.db = mysql.connection.cursor()
+        g.db_connection = _pool.acquire()
+        g.db = g.db_connection.cursor(InstrumentedCursor)
     return g.db
 
+
 def close_db(e=None):
-    """Close database connection"""
-    db = g.pop('db', None)
-    if db is not None:
-        db.close()
+    """Close cursors and return their connections to the pools"""
+    for cursor_key in ('db', 'db_replica'):
+        db = g.pop(cursor_key, None)
+        if db is not None:
+            try:
+                db.close()
+            except Exception:
+                pass
+    connection = g.pop('db_connection', None)
+    if connection is not None:
+        _pool.release(connection)
+    replica_connection = g.pop('db_replica_connection', None)
+    replica_pool = g.pop('db_replica_pool', None)
+    if replica_connection is not None:
+        replica_pool.release(replica_connection)
+
+
+@contextmanager
+def streaming_cursor(readonly=True):
+    """
+    Server-side (unbuffered) cursor on a dedicated pooled connection, for
+    exports that iterate over more rows than should be held in memory.
+    Rows must be read to the end (or the cursor closed) before the
+    connection can run another query, so it never shares g.db.
+    """
+    pool, connection = None, None
+    if readonly and _replicas and not _reads_pinned_to_primary():
+        pool, connection = _borrow_replica()
+    if connection is None:
+        pool, connection = _pool, _pool.acquire()
+
+    discard = False
+    cursor = connection.cursor(InstrumentedSSCursor)
+    try:
+        yield cursor
+    except BaseException:
+        # An unread result set leaves the connection unusable
+        discard = True
+        raise
+    finally:
+        try:
+            cursor.close()
+        except Exception:
+            discard = True
+        pool.release(connection, discard=discard)
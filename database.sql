@@ -36,7 +36,8 @@ CREATE TABLE users (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     INDEX idx_username (username),
     INDEX idx_email (email),
-    INDEX idx_role (role)
+    INDEX idx_role (role),
+    INDEX idx_created_id (created_at, id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- ============================================
@@ -100,7 +101,8 @@ CREATE TABLE teachers (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
     INDEX idx_employee_id (employee_id),
-    INDEX idx_name (first_name, last_name)
+    INDEX idx_name (first_name, last_name),
+    INDEX idx_created_id (created_at, id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- ============================================
@@ -134,7 +136,17 @@ CREATE TABLE students (
     FOREIGN KEY (academic_year_id) REFERENCES academic_years(id) ON DELETE SET NULL,
     INDEX idx_admission_number (admission_number),
     INDEX idx_class_section (class_id, section_id),
-    INDEX idx_name (first_name, last_name)
+    INDEX idx_name (first_name, last_name),
+    INDEX idx_created_id (created_at, id),
+    INDEX idx_class_created_id (class_id, created_at, id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- ============================================
+-- 7a. ADMISSION NUMBER SEQUENCES (next number per ADM<year> prefix)
+-- ============================================
+CREATE TABLE admission_sequences (
+    prefix VARCHAR(20) PRIMARY KEY,
+    next_value INT NOT NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- ============================================
@@ -191,18 +203,54 @@ CREATE TABLE attendance (
     marked_by INT,
     academic_year_id INT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- NULL subject_id (whole-day attendance) as 0 so the unique key also covers it
+    subject_key INT AS (IFNULL(subject_id, 0)) STORED,
     FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE CASCADE,
     FOREIGN KEY (class_id) REFERENCES classes(id) ON DELETE CASCADE,
     FOREIGN KEY (section_id) REFERENCES sections(id) ON DELETE CASCADE,
     FOREIGN KEY (subject_id) REFERENCES subjects(id) ON DELETE SET NULL,
     FOREIGN KEY (marked_by) REFERENCES teachers(id) ON DELETE SET NULL,
     FOREIGN KEY (academic_year_id) REFERENCES academic_years(id) ON DELETE SET NULL,
-    UNIQUE KEY unique_student_date (student_id, attendance_date, subject_id),
+    UNIQUE KEY unique_student_date (student_id, attendance_date, subject_key),
     INDEX idx_student (student_id),
     INDEX idx_date (attendance_date),
     INDEX idx_class_section_date (class_id, section_id, attendance_date)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
+-- ============================================
+-- 10a. ATTENDANCE ROLLUPS (maintained by mark_attendance)
+-- ============================================
+CREATE TABLE attendance_monthly_summary (
+    student_id INT NOT NULL,
+    month_start DATE NOT NULL,
+    class_id INT NOT NULL,
+    section_id INT NOT NULL,
+    present_count INT NOT NULL DEFAULT 0,
+    absent_count INT NOT NULL DEFAULT 0,
+    late_count INT NOT NULL DEFAULT 0,
+    half_day_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (student_id, month_start, class_id, section_id),
+    FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE CASCADE,
+    FOREIGN KEY (class_id) REFERENCES classes(id) ON DELETE CASCADE,
+    FOREIGN KEY (section_id) REFERENCES sections(id) ON DELETE CASCADE,
+    INDEX idx_class_section_month (class_id, section_id, month_start)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE attendance_daily_section_summary (
+    class_id INT NOT NULL,
+    section_id INT NOT NULL,
+    attendance_date DATE NOT NULL,
+    subject_key INT NOT NULL DEFAULT 0,
+    present_count INT NOT NULL DEFAULT 0,
+    absent_count INT NOT NULL DEFAULT 0,
+    late_count INT NOT NULL DEFAULT 0,
+    half_day_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (class_id, section_id, attendance_date, subject_key),
+    FOREIGN KEY (class_id) REFERENCES classes(id) ON DELETE CASCADE,
+    FOREIGN KEY (section_id) REFERENCES sections(id) ON DELETE CASCADE,
+    INDEX idx_date (attendance_date)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
 -- ============================================
 -- 11. NOTES TABLE (Key Feature)
 -- ============================================
@@ -214,6 +262,7 @@ CREATE TABLE notes (
     file_path VARCHAR(1000) NOT NULL,
     file_size INT,
     file_type VARCHAR(50),
+    blob_sha256 CHAR(64),  -- note_blobs.sha256; NULL for files stored before 005
     subject_id INT NOT NULL,
     class_id INT NOT NULL,
     section_id INT,
@@ -230,7 +279,22 @@ CREATE TABLE notes (
     INDEX idx_subject (subject_id),
     INDEX idx_class (class_id),
     INDEX idx_teacher (teacher_id),
-    INDEX idx_upload_date (upload_date)
+    INDEX idx_upload_date (upload_date),
+    INDEX idx_active_upload_id (is_active, upload_date, id),
+    INDEX idx_teacher_active_upload_id (teacher_id, is_active, upload_date, id),
+    INDEX idx_class_active_upload_id (class_id, is_active, upload_date, id),
+    INDEX idx_blob (blob_sha256)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- ============================================
+-- 11a. NOTE FILES (content-addressed, shared by identical uploads)
+-- ============================================
+CREATE TABLE note_blobs (
+    sha256 CHAR(64) PRIMARY KEY,
+    file_path VARCHAR(1000) NOT NULL,
+    file_size BIGINT NOT NULL,
+    ref_count INT NOT NULL DEFAULT 0,  -- active notes using the file
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- ============================================
@@ -0,0 +1,205 @@
+"""
+Move existing note files into the deduplicated blob store (after migrations/005_note_blobs.sql)
+Each note still pointing at its own uploaded copy is hashed, made a reference
+to the blob with that content, and its old copy deleted once no other
+unmigrated note uses it. Old copies are removed a grace period after the
+switch, once downloads that read the old path just before it have opened the
+file. Safe to run while the app is up and to re-run.
+
+    python dedup_notes.py --dry-run
+    python dedup_notes.py
+    python dedup_notes.py --purge-deleted   # also free files of notes deleted before the migration
+"""
+import argparse
+import os
+import shutil
+import time
+from database import connect
+from blob_store import add_reference, drop_new_blob, file_sha256, temp_path
+
+
+def _link_copy(path):
+    """A temp hard link to (or copy of) path that add_reference can consume"""
+    target = temp_path()
+    try:
+        os.link(path, target)
+    except OSError:
+        shutil.copyfile(path, target)
+    return target
+
+
+def _migrate_note(cursor, note_id):
+    """Point one note at its blob; returns (old path to delete or None, bytes freed) or None if skipped"""
+    cursor.execute("""
+        SELECT file_path FROM notes WHERE id = %s AND blob_sha256 IS NULL AND is_active = TRUE FOR UPDATE
+    """, (note_id,))
+    row = cursor.fetchone()
+    if not row or not os.path.exists(row[0]):
+        cursor.connection.rollback()
+        return None
+    old_path = row[0]
+    size = os.path.getsize(old_path)
+    sha256 = file_sha256(old_path)
+
+    source = _link_copy(old_path)
+    blob, created = None, False
+    try:
+        blob, created = add_reference(cursor, source, sha256, size)
+        cursor.execute("UPDATE notes SET blob_sha256 = %s, file_path = %s, file_name = %s WHERE id = %s",
+                       (sha256, blob, os.path.basename(blob), note_id))
+        cursor.execute("SELECT COUNT(*) FROM notes WHERE blob_sha256 IS NULL AND file_path = %s", (old_path,))
+        shared = cursor.fetchone()[0]
+        cursor.connection.commit()
+    except Exception:
+        if created:
+            drop_new_blob(blob)
+        cursor.connection.rollback()
+        if os.path.exists(source):
+            os.remove(source)
+        raise
+
+    if shared or os.path.abspath(old_path) == os.path.abspath(blob):
+        return None, 0
+    return old_path, 0 if created else size
+
+
+def _remove(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def purge_deleted(cursor, batch_size):
+    """Delete the files of soft-deleted, unmigrated notes that no active note uses; returns (files, bytes)"""
+    files, freed = 0, 0
+    last_id = 0
+    while True:
+        cursor.execute("""
+            SELECT id, file_path FROM notes WHERE id > %s AND blob_sha256 IS NULL AND is_active = FALSE
+            ORDER BY id LIMIT %s
+        """, (last_id, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        for note_id, path in rows:
+            last_id = note_id
+            if not os.path.exists(path):
+                continue
+            cursor.execute("SELECT COUNT(*) FROM notes WHERE file_path = %s AND is_active = TRUE", (path,))
+            if cursor.fetchone()[0]:
+                continue
+            freed += os.path.getsize(path)
+            os.remove(path)
+            files += 1
+        cursor.connection.commit()
+    return files, freed
+
+
+def dry_run(cursor, batch_size):
+    seen, notes, duplicate_bytes, missing = set(), 0, 0, 0
+    last_id = 0
+    while True:
+        cursor.execute("""
+            SELECT id, file_path, blob_sha256 FROM notes
+            WHERE id > %s AND is_active = TRUE ORDER BY id LIMIT %s
+        """, (last_id, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        for note_id, path, blob_sha256 in rows:
+            last_id = note_id
+            if blob_sha256:
+                seen.add(blob_sha256)
+                continue
+            if not os.path.exists(path):
+                missing += 1
+                continue
+            sha256 = file_sha256(path)
+            notes += 1
+            if sha256 in seen:
+                duplicate_bytes += os.path.getsize(path)
+            seen.add(sha256)
+    return notes, duplicate_bytes, missing
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move note files into the deduplicated blob store')
+    parser.add_argument('--batch-size', type=int, default=500, help='Notes read per query (default: 500)')
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would be saved')
+    parser.add_argument('--purge-deleted', action='store_true',
+                        help='Also delete the files of notes deleted before the blob store existed')
+    parser.add_argument('--grace', type=float, default=30.0,
+                        help='Seconds before old copies are removed (default: 30)')
+    args = parser.parse_args()
+
+    connection = connect()
+    cursor = connection.cursor()
+    started_at = time.perf_counter()
+    print("Deduplicating note files...")
+    print("-" * 50)
+
+    if args.dry_run:
+        notes, duplicate_bytes, missing = dry_run(cursor, args.batch_size)
+        print(f"[OK] {notes} notes to migrate; {duplicate_bytes / (1024 * 1024):.1f}MB are duplicate copies")
+        if missing:
+            print(f"[INFO] {missing} notes point at files that do not exist")
+        connection.close()
+        raise SystemExit(0)
+
+    migrated, freed, skipped, failed = 0, 0, 0, 0
+    pending = []  # (remove after, old paths)
+    last_id = 0
+    while True:
+        cursor.execute("""
+            SELECT id FROM notes WHERE id > %s AND blob_sha256 IS NULL AND is_active = TRUE ORDER BY id LIMIT %s
+        """, (last_id, args.batch_size))
+        note_ids = [row[0] for row in cursor.fetchall()]
+        connection.commit()  # Don't hold a snapshot across the batch
+        if not note_ids:
+            break
+        removable = []
+        for note_id in note_ids:
+            last_id = note_id
+            try:
+                result = _migrate_note(cursor, note_id)
+            except Exception as e:
+                print(f"[ERROR] Note {note_id}: {str(e)}")
+                failed += 1
+                continue
+            if result is None:
+                skipped += 1
+                continue
+            old_path, saved = result
+            if old_path:
+                removable.append(old_path)
+            migrated += 1
+            freed += saved
+        if removable:
+            pending.append((time.monotonic() + args.grace, removable))
+        while pending and pending[0][0] <= time.monotonic():
+            _remove(pending.pop(0)[1])
+        print(f"[OK] {migrated} notes migrated, {freed / (1024 * 1024):.1f}MB freed "
+              f"({time.perf_counter() - started_at:.1f}s)")
+
+    if args.purge_deleted:
+        files, purged = purge_deleted(cursor, args.batch_size)
+        freed += purged
+        print(f"[OK] {files} files of deleted notes removed, {purged / (1024 * 1024):.1f}MB")
+
+    connection.close()
+    if pending:
+        wait = max(0.0, pending[-1][0] - time.monotonic())
+        print(f"[INFO] Removing old copies in {wait:.0f}s...")
+        time.sleep(wait)
+        for _, paths in pending:
+            _remove(paths)
+
+    print("-" * 50)
+    print(f"[OK] {migrated} notes now share deduplicated files; {freed / (1024 * 1024):.1f}MB freed")
+    if skipped:
+        print(f"[INFO] {skipped} notes were skipped (file missing, or deleted meanwhile)")
+    if failed:
+        print(f"[ERROR] {failed} notes could not be migrated; re-run to retry them")
+        raise SystemExit(1)
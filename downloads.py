@@ -0,0 +1,74 @@
+"""
+Protected file downloads
+Views check access, then hand the file to send_protected_file, which either
+tells the front proxy to send it (X-Accel-Redirect for nginx, X-Sendfile for
+Apache/lighttpd; DOWNLOAD_OFFLOAD) so no worker is tied up for the transfer,
+or serves it with send_file. Either way repeated downloads are answered with
+304 from the ETag / Last-Modified validators, and the send_file path supports
+Range requests and hands the bytes to the server's sendfile-backed
+wsgi.file_wrapper (gunicorn).
+"""
+import mimetypes
+import os
+import unicodedata
+from datetime import datetime, timezone
+from urllib.parse import quote
+from flask import Response, request, send_file
+from config import Config
+from metrics import inc_counter
+
+OFFLOAD_HEADERS = {'x-accel-redirect': 'X-Accel-Redirect', 'x-sendfile': 'X-Sendfile'}
+
+
+def _etag(stat):
+    return f'{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}'
+
+
+def _offload_target(path):
+    """Header value for the configured proxy, or None if this file cannot be offloaded"""
+    if Config.DOWNLOAD_OFFLOAD == 'x-sendfile':
+        return path
+    # X-Accel-Redirect names a URI under an internal nginx location aliasing UPLOAD_FOLDER
+    relative_path = os.path.relpath(path, os.path.abspath(Config.UPLOAD_FOLDER))
+    if relative_path.startswith('..'):
+        return None
+    return Config.DOWNLOAD_ACCEL_PREFIX.rstrip('/') + '/' + quote(relative_path.replace(os.sep, '/'))
+
+
+def _disposition_options(download_name):
+    """Content-Disposition parameters for an attachment, as send_file builds them"""
+    try:
+        download_name.encode('ascii')
+        return {'filename': download_name}
+    except UnicodeEncodeError:
+        fallback = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode() or 'download'
+        return {'filename': fallback, 'filename*': f"UTF-8''{quote(download_name, safe='!#$&+^`|~')}"}
+
+
+def send_protected_file(path, download_name, mimetype=None):
+    """Response for a file the current user may download"""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    header = OFFLOAD_HEADERS.get(Config.DOWNLOAD_OFFLOAD)
+    target = _offload_target(path) if header else None
+
+    if target is None:
+        response = send_file(path, as_attachment=True, download_name=download_name, mimetype=mimetype,
+                             conditional=True, etag=_etag(stat), last_modified=stat.st_mtime, max_age=0)
+        mode = 'worker'
+    else:
+        response = Response(mimetype=mimetype or mimetypes.guess_type(download_name)[0] or 'application/octet-stream')
+        # werkzeug quotes and escapes the (user supplied) name
+        response.headers.set('Content-Disposition', 'attachment', **_disposition_options(download_name))
+        response.set_etag(_etag(stat))
+        response.last_modified = datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+        response.make_conditional(request)
+        if response.status_code != 304:
+            response.headers[header] = target  # The proxy sends the body and handles Range
+        mode = Config.DOWNLOAD_OFFLOAD
+
+    # Private files: browsers may keep them but must revalidate (a cheap 304)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    inc_counter('sms_downloads_total', mode=mode, status=response.status_code)
+    return response
@@ -0,0 +1,362 @@
+"""
+Synthetic large-school dataset generator for load and scale testing
+Builds academic years, classes, sections, teachers, students, daily attendance
+and notes (with dummy files) using bulk loads. The same seed and options always
+produce the same data.
+
+    python generate_dataset.py --students-per-section 40 --years 3
+    python generate_dataset.py --classes 12 --sections 6 --students-per-section 45 \\
+        --years 4 --notes 200000 --method insert
+
+Run it against a database created from database.sql with no other writers:
+row ids are assigned by the generator so every table can be bulk loaded.
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+import numpy as np
+from database import connect
+from attendance_rollup import month_start, rebuild_month
+from blob_store import blob_path
+from reference_data import invalidate_reference_data
+from student_search import reset_student_index
+from note_search import reset_note_index
+from utils import hash_password
+
+FIRST_NAMES = ['Aarav', 'Aditi', 'Alice', 'Amir', 'Ananya', 'Arjun', 'Bella', 'Carlos', 'Chen', 'Daniel',
+               'Diya', 'Elena', 'Ethan', 'Fatima', 'Gabriel', 'Hana', 'Ishaan', 'Jia', 'Kabir', 'Kavya',
+               'Leo', 'Lucia', 'Maya', 'Mohammed', 'Nadia', 'Noah', 'Olivia', 'Omar', 'Priya', 'Rahul',
+               'Riya', 'Samuel', 'Sara', 'Sofia', 'Tariq', 'Uma', 'Vikram', 'Wei', 'Yusuf', 'Zara']
+LAST_NAMES = ['Agarwal', 'Ali', 'Brown', 'Chen', 'Das', 'Fernandes', 'Garcia', 'Gupta', 'Hassan', 'Iyer',
+              'Johnson', 'Kapoor', 'Khan', 'Kim', 'Kumar', 'Lee', 'Lopez', 'Martin', 'Mehta', 'Menon',
+              'Miller', 'Nair', 'Nguyen', 'Patel', 'Rao', 'Reddy', 'Rossi', 'Shah', 'Sharma', 'Singh',
+              'Smith', 'Suzuki', 'Taylor', 'Thomas', 'Verma', 'Wang', 'Williams', 'Wilson', 'Yadav', 'Zhang']
+SECTION_NAMES = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+STATUSES = ('present', 'absent', 'late', 'half_day')
+LATE_RATE = 0.03
+HALF_DAY_RATE = 0.02
+
+TABLE_COLUMNS = {
+    'users': ('id', 'username', 'email', 'password_hash', 'role', 'is_active'),
+    'teachers': ('id', 'user_id', 'first_name', 'last_name', 'employee_id', 'phone', 'qualification',
+                 'specialization', 'hire_date', 'is_active'),
+    'students': ('id', 'user_id', 'admission_number', 'first_name', 'last_name', 'date_of_birth', 'gender',
+                 'phone', 'email', 'parent_name', 'parent_phone', 'class_id', 'section_id',
+                 'academic_year_id', 'admission_date', 'is_active'),
+    'class_teachers': ('teacher_id', 'class_id', 'section_id', 'academic_year_id', 'assigned_date'),
+    'teacher_subjects': ('teacher_id', 'subject_id', 'class_id', 'section_id', 'academic_year_id'),
+    'attendance': ('student_id', 'class_id', 'section_id', 'attendance_date', 'status', 'marked_by',
+                   'academic_year_id'),
+    'notes': ('id', 'title', 'file_name', 'original_file_name', 'file_path', 'file_size', 'file_type',
+              'blob_sha256', 'subject_id', 'class_id', 'section_id', 'teacher_id', 'academic_year_id', 'description',
+              'upload_date'),
+}
+
+
+def _tsv_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    return str(value)
+
+
+class BulkLoader:
+    """
+    Buffers rows per table and writes them in batches, either with
+    LOAD DATA LOCAL INFILE from a temp TSV file or with multi-row INSERTs
+    (MySQLdb turns executemany() into one statement per batch).
+    """
+
+    def __init__(self, connection, method, batch_size):
+        self.connection = connection
+        self.cursor = connection.cursor()
+        self.method = method
+        self.batch_size = batch_size
+        self.rows = {}
+        self.counts = {}
+
+    def add(self, table, row):
+        rows = self.rows.setdefault(table, [])
+        rows.append(row)
+        if len(rows) >= self.batch_size:
+            self.flush(table)
+
+    def flush(self, table=None):
+        tables = [table] if table else list(self.rows)
+        for name in tables:
+            rows = self.rows.get(name)
+            if not rows:
+                continue
+            columns = TABLE_COLUMNS[name]
+            if self.method == 'load-data':
+                self._load_data(name, columns, rows)
+            else:
+                placeholders = ', '.join(['%s'] * len(columns))
+                self.cursor.executemany(
+                    f"INSERT INTO {name} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+            self.connection.commit()
+            self.counts[name] = self.counts.get(name, 0) + len(rows)
+            self.rows[name] = []
+
+    def _load_data(self, table, columns, rows):
+        with tempfile.NamedTemporaryFile('w', suffix='.tsv', encoding='utf-8') as tsv_file:
+            tsv_file.write(''.join('\t'.join(_tsv_value(value) for value in row) + '\n' for row in rows))
+            tsv_file.flush()
+            self.cursor.execute(
+                f"LOAD DATA LOCAL INFILE %s INTO TABLE {table} "
+                f"FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' ({', '.join(columns)})",
+                (tsv_file.name,))
+
+
+def school_days(start_date, end_date):
+    """Monday to Friday dates in the range"""
+    day = start_date
+    while day <= end_date:
+        if day.weekday() < 5:
+            yield day
+        day += timedelta(days=1)
+
+
+def _next_id(cursor, table):
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}")
+    return cursor.fetchone()[0]
+
+
+def _academic_years(cursor, first_year, years):
+    """Create (or reuse by name) April-March academic years; returns [(id, start, end)]"""
+    result = []
+    for year in range(first_year, first_year + years):
+        start_date, end_date = date(year, 4, 1), date(year + 1, 3, 31)
+        cursor.execute("""
+            INSERT INTO academic_years (year_name, start_date, end_date, is_current)
+            VALUES (%s, %s, %s, FALSE)
+            ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id)
+        """, (f'{year}-{year + 1}', start_date, end_date))
+        result.append((cursor.lastrowid, start_date, end_date))
+    cursor.execute("SELECT COUNT(*) FROM academic_years WHERE is_current = TRUE")
+    if not cursor.fetchone()[0]:
+        cursor.execute("UPDATE academic_years SET is_current = TRUE WHERE id = %s", (result[-1][0],))
+    return result
+
+
+def _classes_and_sections(cursor, prefix, classes, sections, academic_year_id):
+    """Create classes with their sections; returns [(class_id, [section_id, ...]), ...]"""
+    result = []
+    for grade in range(1, classes + 1):
+        cursor.execute(
+            "INSERT INTO classes (class_name, class_code, academic_year_id) VALUES (%s, %s, %s)",
+            (f'{prefix} Grade {grade}', f'{prefix}G{grade}', academic_year_id))
+        class_id = cursor.lastrowid
+        section_ids = []
+        for section in SECTION_NAMES[:sections]:
+            cursor.execute(
+                "INSERT INTO sections (section_name, class_id, capacity, academic_year_id) VALUES (%s, %s, %s, %s)",
+                (section, class_id, 45, academic_year_id))
+            section_ids.append(cursor.lastrowid)
+        result.append((class_id, section_ids))
+    return result
+
+
+def generate(args):
+    rng = np.random.default_rng(args.seed)
+    prefix = args.prefix.upper()
+    started_at = time.perf_counter()
+    connection = connect(local_infile=1) if args.method == 'load-data' else connect()
+    cursor = connection.cursor()
+    cursor.execute("SET SESSION unique_checks = 0, foreign_key_checks = 0")
+    loader = BulkLoader(connection, args.method, args.batch_size)
+
+    # Reference data: small, inserted row by row
+    years = _academic_years(cursor, args.first_year, args.years)
+    current_year_id, current_start, _ = years[-1]
+    school = _classes_and_sections(cursor, prefix, args.classes, args.sections, current_year_id)
+    cursor.execute("SELECT id FROM subjects ORDER BY id")
+    subject_ids = [row[0] for row in cursor.fetchall()]
+    if not subject_ids:
+        raise SystemExit('[ERROR] No subjects found; load database.sql first.')
+    connection.commit()
+
+    password_hash = hash_password(args.password)  # One hash shared by every generated account
+    user_id = _next_id(cursor, 'users')
+    teacher_id = _next_id(cursor, 'teachers')
+    student_id = _next_id(cursor, 'students')
+    note_id = _next_id(cursor, 'notes')
+
+    # Teachers: one class teacher per section plus subject teachers
+    sections = [(class_index, class_id, section_id)
+                for class_index, (class_id, section_ids) in enumerate(school) for section_id in section_ids]
+    teacher_count = max(args.teachers, len(sections))
+    teacher_ids = []
+    for n in range(teacher_count):
+        first, last = FIRST_NAMES[rng.integers(len(FIRST_NAMES))], LAST_NAMES[rng.integers(len(LAST_NAMES))]
+        username = f'{prefix.lower()}_t{n + 1:05d}'
+        loader.add('users', (user_id, username, f'{username}@school.test', password_hash, 'teacher', True))
+        loader.add('teachers', (teacher_id, user_id, first, last, f'{prefix}EMP{n + 1:05d}',
+                                f'9{rng.integers(10 ** 8, 10 ** 9)}', 'M.Ed.', None,
+                                current_start - timedelta(days=int(rng.integers(0, 3650))), True))
+        teacher_ids.append(teacher_id)
+        user_id += 1
+        teacher_id += 1
+    class_teacher = {}
+    for i, (_, class_id, section_id) in enumerate(sections):
+        class_teacher[section_id] = teacher_ids[i]
+        loader.add('class_teachers', (teacher_ids[i], class_id, section_id, current_year_id, current_start))
+        for subject_id in subject_ids:
+            loader.add('teacher_subjects', (teacher_ids[int(rng.integers(teacher_count))], subject_id,
+                                            class_id, section_id, current_year_id))
+
+    # Students: current class for this year; in earlier years they were in lower grades
+    roster = []  # (student_id, class_index, section_position)
+    for class_index, class_id, section_id in sections:
+        section_position = school[class_index][1].index(section_id)
+        for _ in range(args.students_per_section):
+            n = student_id
+            first, last = FIRST_NAMES[rng.integers(len(FIRST_NAMES))], LAST_NAMES[rng.integers(len(LAST_NAMES))]
+            admission_number = f'{prefix}{args.first_year}{n:07d}'
+            username = admission_number.lower()
+            birth_year = current_start.year - 6 - class_index
+            loader.add('users', (user_id, username, f'{username}@school.test', password_hash, 'student', True))
+            loader.add('students', (
+                student_id, user_id, admission_number, first, last,
+                date(birth_year, int(rng.integers(1, 13)), int(rng.integers(1, 29))),
+                ('male', 'female')[int(rng.integers(2))], None, None,
+                f'Parent of {first} {last}', f'9{rng.integers(10 ** 8, 10 ** 9)}',
+                class_id, section_id, current_year_id, current_start, True))
+            roster.append((student_id, class_index, section_position))
+            user_id += 1
+            student_id += 1
+    loader.flush()
+    print(f"[OK] {teacher_count} teachers and {len(roster)} students ({time.perf_counter() - started_at:.1f}s)")
+
+    # Attendance: every school day of every year, one whole-day sheet per section
+    roster_ids = np.array([row[0] for row in roster], dtype=np.int64)
+    roster_class = np.array([row[1] for row in roster], dtype=np.int64)
+    roster_section = np.array([row[2] for row in roster], dtype=np.int64)
+    # Per-student absence propensity with mean args.absence_rate
+    shape = 1.5
+    absence = rng.beta(shape, shape * (1 - args.absence_rate) / args.absence_rate, size=len(roster))
+    thresholds = np.stack([absence, absence + LATE_RATE, absence + LATE_RATE + HALF_DAY_RATE], axis=1)
+    attendance_rows = 0
+    months = set()
+    for years_ago, (year_id, start_date, end_date) in enumerate(reversed(years)):
+        class_index = roster_class - years_ago
+        enrolled = class_index >= 0
+        ids = roster_ids[enrolled]
+        if not len(ids):
+            continue
+        section_keys = class_index[enrolled] * len(SECTION_NAMES) + roster_section[enrolled]
+        class_ids = np.array([school[i][0] for i in class_index[enrolled]])
+        section_ids = np.array([school[c][1][s] for c, s in zip(class_index[enrolled], roster_section[enrolled])])
+        year_thresholds = thresholds[enrolled]
+        unique_keys = np.unique(section_keys)
+        for day in school_days(start_date, end_date):
+            # Sections that took the register that day
+            held = unique_keys[rng.random(len(unique_keys)) < args.attendance_density]
+            on_register = np.isin(section_keys, held)
+            draws = rng.random(len(ids))
+            codes = (draws[:, None] >= year_thresholds).sum(axis=1)
+            # Code order: absent, late, half_day, present
+            codes = np.array([1, 2, 3, 0])[codes]
+            day_text = day.isoformat()
+            for i in np.flatnonzero(on_register):
+                section_id = int(section_ids[i])
+                loader.add('attendance', (int(ids[i]), int(class_ids[i]), section_id, day_text,
+                                          STATUSES[codes[i]], class_teacher.get(section_id), year_id))
+            attendance_rows += int(on_register.sum())
+            months.add(month_start(day))
+    loader.flush()
+    print(f"[OK] {attendance_rows} attendance rows ({time.perf_counter() - started_at:.1f}s)")
+
+    for month in sorted(months):
+        rebuild_month(cursor, month)
+        connection.commit()
+    print(f"[OK] Rollups rebuilt for {len(months)} months ({time.perf_counter() - started_at:.1f}s)")
+
+    # Notes with small dummy files, stored as blobs the way uploads are (blob_store.py)
+    shared_payload = rng.bytes(args.note_size)
+    blobs = {}  # sha256 -> [path, size, notes using it]
+    for n in range(args.notes):
+        _, class_id, section_id = sections[int(rng.integers(len(sections)))]
+        subject_id = subject_ids[int(rng.integers(len(subject_ids)))]
+        year_id, start_date, end_date = years[int(rng.integers(len(years)))]
+        uploaded_at = datetime.combine(start_date, datetime.min.time()) + \
+            timedelta(seconds=int(rng.integers(0, (end_date - start_date).days * 86400)))
+        content = b'%PDF-1.4\n' + (shared_payload if args.shared_note_payload else rng.bytes(args.note_size))
+        sha256 = hashlib.sha256(content).hexdigest()
+        blob = blobs.get(sha256)
+        if blob is None:
+            blob = blobs[sha256] = [blob_path(sha256), len(content), 0]
+            if not os.path.exists(blob[0]):
+                os.makedirs(os.path.dirname(blob[0]), exist_ok=True)
+                with open(blob[0], 'wb') as note_file:
+                    note_file.write(content)
+        blob[2] += 1
+        loader.add('notes', (note_id, f'Chapter {n % 20 + 1} notes #{n + 1}', os.path.basename(blob[0]),
+                             f'notes_{n + 1}.pdf', blob[0], len(content), 'pdf', sha256, subject_id, class_id,
+                             section_id if n % 3 else None, class_teacher[section_id], year_id,
+                             'Generated note', uploaded_at))
+        note_id += 1
+    loader.flush()
+    # Blob rows may already exist (an earlier run with the same payloads), so add to their counts
+    blob_rows = [(sha256, path, size, refs) for sha256, (path, size, refs) in blobs.items()]
+    for i in range(0, len(blob_rows), args.batch_size):
+        cursor.executemany("""
+            INSERT INTO note_blobs (sha256, file_path, file_size, ref_count) VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE ref_count = ref_count + VALUES(ref_count)
+        """, blob_rows[i:i + args.batch_size])
+        connection.commit()
+    loader.counts['note_blobs'] = len(blob_rows)
+    print(f"[OK] {args.notes} notes in {len(blobs)} files ({time.perf_counter() - started_at:.1f}s)")
+
+    cursor.execute("SET SESSION unique_checks = 1, foreign_key_checks = 1")
+    connection.close()
+    invalidate_reference_data()  # Running workers pick up the new classes and sections
+    reset_student_index()  # ... and rebuild their student search index
+    reset_note_index()  # ... and re-index the notes
+
+    elapsed = time.perf_counter() - started_at
+    total = sum(loader.counts.values())
+    print(f"\n[OK] Loaded {total} rows in {elapsed:.1f}s ({total / elapsed:.0f} rows/s)")
+    for table, count in sorted(loader.counts.items()):
+        print(f"  {table}: {count}")
+    print(f"\nEvery generated account uses the password '{args.password}'")
+    return True
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description='Generate a synthetic school for load testing')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed (same seed, same data)')
+    parser.add_argument('--prefix', default='GEN', help='Prefix for codes, usernames and admission numbers')
+    parser.add_argument('--first-year', type=int, default=2022, help='Start year of the first academic year')
+    parser.add_argument('--years', type=int, default=3, help='Number of academic years')
+    parser.add_argument('--classes', type=int, default=10, help='Grades per school')
+    parser.add_argument('--sections', type=int, default=3, help='Sections per grade')
+    parser.add_argument('--students-per-section', type=int, default=40)
+    parser.add_argument('--teachers', type=int, default=60, help='At least one per section is created')
+    parser.add_argument('--attendance-density', type=float, default=0.97,
+                        help='Share of school days each section takes the register')
+    parser.add_argument('--absence-rate', type=float, default=0.08, help='Average share of days absent')
+    parser.add_argument('--notes', type=int, default=2000)
+    parser.add_argument('--note-size', type=int, default=2048, help='Bytes of each dummy note file')
+    parser.add_argument('--shared-note-payload', action='store_true',
+                        help='Write the same bytes to every note file (faster, tests deduplication)')
+    parser.add_argument('--method', choices=('load-data', 'insert'), default='load-data',
+                        help='LOAD DATA LOCAL INFILE (server needs local_infile=ON) or multi-row INSERT')
+    parser.add_argument('--batch-size', type=int, default=20000, help='Rows per LOAD DATA / INSERT batch')
+    parser.add_argument('--password', default='password123', help='Password of every generated account')
+    args = parser.parse_args()
+    if len(SECTION_NAMES) < args.sections:
+        parser.error(f'At most {len(SECTION_NAMES)} sections per grade')
+    if not 0 < args.absence_rate < 1:
+        parser.error('--absence-rate must be between 0 and 1')
+    return args
+
+
+if __name__ == '__main__':
+    print("Generating synthetic school dataset...")
+    print("-" * 50)
+    generate(_parse_args())
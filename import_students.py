@@ -0,0 +1,49 @@
+"""
+Bulk-admit students from a CSV or XLSX file
+Same import as the Students > Import page, for files too large to upload or
+for scripted admissions:
+
+    python import_students.py admissions.csv
+    python import_students.py admissions.xlsx --result admissions-result.csv --workers 8
+"""
+import argparse
+import os
+from flask import Flask
+from config import Config
+from database import init_db
+from academic_years import get_current_academic_year_id
+from student_import import import_students
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bulk-admit students from a CSV/XLSX file')
+    parser.add_argument('path', help='CSV or XLSX file with a header row')
+    parser.add_argument('--result', help='Per-row result CSV (default: <file>.result.csv)')
+    parser.add_argument('--batch-size', type=int, help='Students per transaction (default: IMPORT_BATCH_SIZE)')
+    parser.add_argument('--workers', type=int, help='Password hashing processes (default: one per CPU)')
+    args = parser.parse_args()
+
+    result_path = args.result or f'{os.path.splitext(args.path)[0]}.result.csv'
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    init_db(app)
+    with app.app_context():
+        academic_year_id = get_current_academic_year_id()
+    print(f"Importing students from {args.path}...")
+    print("-" * 50)
+
+    def progress(summary):
+        print(f"[OK] {summary['rows']} rows read, {summary['imported']} imported, "
+              f"{summary['failed']} failed ({summary['rate']} students/s)")
+
+    try:
+        summary = import_students(args.path, result_path, academic_year_id, batch_size=args.batch_size,
+                                  workers=args.workers, progress=progress)
+    except Exception as e:
+        print(f"[ERROR] Import failed: {str(e)}")
+        raise SystemExit(1)
+
+    print("-" * 50)
+    print(f"[OK] Imported {summary['imported']} of {summary['rows']} students in {summary['seconds']}s")
+    print(f"[OK] Row results written to {result_path}")
+    if summary['failed']:
+        print(f"[INFO] {summary['failed']} rows were not imported, see the result file")
@@ -0,0 +1,46 @@
+"""
+Build or update the notes full-text search index
+The app indexes uploads in a background thread of one of its workers. Run this
+to catch up from the command line, to rebuild the index, or as the indexer
+service (set NOTE_INDEX_WORKER=0 for the app so text extraction stays out of
+the web workers; otherwise --watch waits while a worker holds the indexer lock):
+
+    python index_notes.py              # index everything queued, then exit
+    python index_notes.py --rebuild    # drop the index and re-index every note
+    python index_notes.py --watch      # keep indexing new uploads (run as a service)
+"""
+import argparse
+import time
+from note_search import reset_note_index, backfill, process_queue, run_indexer
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build or update the notes search index')
+    parser.add_argument('--rebuild', action='store_true', help='Drop the index and re-index every active note')
+    parser.add_argument('--watch', action='store_true', help='Keep running and index new uploads as they arrive')
+    args = parser.parse_args()
+
+    if args.rebuild:
+        reset_note_index()
+        print("[OK] Notes index cleared")
+
+    if args.watch:
+        print("Indexing notes (Ctrl+C to stop)...")
+        try:
+            run_indexer()
+        except KeyboardInterrupt:
+            raise SystemExit(0)
+
+    started_at = time.perf_counter()
+    try:
+        backfill()
+        total = 0
+        while True:
+            processed = process_queue()
+            if not processed:
+                break
+            total += processed
+            print(f"[OK] {total} notes indexed ({time.perf_counter() - started_at:.1f}s)")
+    except Exception as e:
+        print(f"[ERROR] Indexing failed: {str(e)}")
+        raise SystemExit(1)
+    print(f"[OK] Notes index is up to date ({time.perf_counter() - started_at:.1f}s)")
@@ -0,0 +1,374 @@
+"""
+Runtime metrics
+Request latency histograms, in-flight gauges, DB pool, cache and upload
+metrics served at /metrics in Prometheus text exposition format.
+
+Every worker process periodically writes a snapshot of its own metrics to
+METRICS_FOLDER/<pid>-<id>.json; /metrics merges the snapshots of all workers,
+so the numbers are correct whichever gunicorn worker serves the scrape. The
+counters of exited workers are folded into METRICS_FOLDER/retired.json and
+their snapshots deleted, so totals never go backwards and the folder does not
+grow with every worker restart.
+"""
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from flask import Response, abort, g, request
+from config import Config
+from database import get_pool_stats
+from cache import get_cache_stats
+from query_stats import get_request_query_stats
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_HELP = {
+    'sms_http_requests_total': ('counter', 'HTTP requests handled, by endpoint, method and status'),
+    'sms_http_request_duration_seconds': ('histogram', 'HTTP request latency by endpoint'),
+    'sms_http_requests_in_flight': ('gauge', 'HTTP requests currently being handled'),
+    'sms_db_queries_total': ('counter', 'SQL statements issued, by endpoint'),
+    'sms_db_pool_connections': ('gauge', 'Pooled database connections by pool and state'),
+    'sms_db_pool_waiting': ('gauge', 'Requests queued for a pooled connection'),
+    'sms_db_pool_events_total': ('counter', 'Pool events (created, recycled, ping_failures, waits, timeouts, acquired)'),
+    'sms_cache_requests_total': ('counter', 'Cache lookups by cache and result'),
+    'sms_cache_hit_ratio': ('gauge', 'Share of cache lookups served from the cache'),
+    'sms_upload_bytes_total': ('counter', 'Bytes of uploaded files saved, by kind'),
+    'sms_uploads_total': ('counter', 'Uploaded files saved, by kind'),
+    'sms_password_hash_operations_total': ('counter', 'Password hashes computed, by operation and scheme'),
+    'sms_password_hash_seconds_total': ('counter', 'CPU-bound time spent hashing passwords, by operation and scheme'),
+    'sms_password_hash_wait_seconds_total': ('counter', 'Time password hashes spent queued for a hashing process'),
+    'sms_password_hash_rejected_total': ('counter', 'Password hashes refused because the hashing queue was full'),
+    'sms_login_rate_limited_total': ('counter', 'Login attempts rejected by the rate limiter, by scope (ip, user)'),
+    'sms_note_blob_dedup_bytes_total': ('counter', 'Bytes of uploaded note files that were already stored'),
+    'sms_note_blob_freed_bytes_total': ('counter', 'Bytes of note files deleted once no active note used them'),
+    'sms_note_index_updates_total': ('counter', 'Notes (re)indexed or removed by the notes search indexer'),
+    'sms_note_index_seconds_total': ('counter', 'Time spent extracting text and indexing notes'),
+    'sms_note_index_extract_failures_total': ('counter', 'Note files whose text could not be extracted, by file type'),
+    'sms_downloads_total': ('counter', 'Protected file downloads by delivery mode (worker, x-accel-redirect, x-sendfile) and status'),
+    'sms_worker_processes': ('gauge', 'Worker processes reporting metrics'),
+}
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_histograms = {}  # labels -> [bucket counts..., +Inf count, sum]
+_in_flight = 0
+_last_flush = 0.0
+_process = None   # (pid, snapshot id) of this process; renewed after a fork
+RETIRED_FILE = 'retired.json'
+
+
+def _labels(**labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def inc_counter(name, value=1, **labels):
+    key = (name, _labels(**labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe_duration(endpoint, seconds):
+    labels = _labels(endpoint=endpoint)
+    with _lock:
+        histogram = _histograms.get(labels)
+        if histogram is None:
+            histogram = _histograms[labels] = [0] * (len(DURATION_BUCKETS) + 1) + [0.0]
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                histogram[i] += 1
+                break
+        else:
+            histogram[len(DURATION_BUCKETS)] += 1
+        histogram[-1] += seconds
+
+
+def record_upload(folder_path, size):
+    """Count an uploaded file saved under folder_path (e.g. notes, student_photos)"""
+    kind = os.path.basename(os.path.normpath(folder_path))
+    inc_counter('sms_upload_bytes_total', size, kind=kind)
+    inc_counter('sms_uploads_total', kind=kind)
+
+
+def _start_time(pid):
+    """Start time of a process in clock ticks since boot (None where /proc is unavailable)"""
+    try:
+        with open(f'/proc/{pid}/stat') as stat_file:
+            return int(stat_file.read().rsplit(')', 1)[1].split()[19])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _process_info():
+    """(pid, snapshot id, start time) of this process; a forked child gets its own id"""
+    global _process
+    pid = os.getpid()
+    if _process is None or _process[0] != pid:
+        _process = (pid, f'{pid}-{uuid.uuid4().hex[:12]}', _start_time(pid))
+    return _process
+
+
+def _snapshot():
+    """This worker's metrics as JSON-serializable lists"""
+    counters = []
+    gauges = []
+    for pool in get_pool_stats():
+        for state in ('idle', 'borrowed'):
+            gauges.append(['sms_db_pool_connections', {'pool': pool['name'], 'state': state}, pool[state]])
+        gauges.append(['sms_db_pool_waiting', {'pool': pool['name']}, pool['waiting']])
+        for event in ('created', 'recycled', 'ping_failures', 'waits', 'timeouts', 'acquired'):
+            counters.append(['sms_db_pool_events_total', {'pool': pool['name'], 'event': event}, pool[event]])
+    for cache in get_cache_stats():
+        counters.append(['sms_cache_requests_total', {'cache': cache['name'], 'result': 'hit'}, cache['hits']])
+        counters.append(['sms_cache_requests_total', {'cache': cache['name'], 'result': 'miss'}, cache['misses']])
+
+    with _lock:
+        counters += [[name, dict(labels), value] for (name, labels), value in _counters.items()]
+        histograms = [[dict(labels), list(values)] for labels, values in _histograms.items()]
+        gauges.append(['sms_http_requests_in_flight', {}, _in_flight])
+    pid, snapshot_id, started = _process_info()
+    return {'pid': pid, 'id': snapshot_id, 'started': started,
+            'counters': counters, 'histograms': histograms, 'gauges': gauges}
+
+
+def flush(force=False):
+    """Write this worker's snapshot, at most once per METRICS_FLUSH_INTERVAL"""
+    global _last_flush
+    now = time.monotonic()
+    if not force and now - _last_flush < Config.METRICS_FLUSH_INTERVAL:
+        return
+    _last_flush = now
+    snapshot = _snapshot()
+    _write_json(os.path.join(Config.METRICS_FOLDER, f"{snapshot['id']}.json"), snapshot)
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(tmp_path, 'w') as out:
+        json.dump(data, out)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as source:
+            return json.load(source)
+    except (OSError, ValueError):
+        return None
+
+
+def _alive(snapshot):
+    """Whether the process that wrote the snapshot is still running (and its pid not reused)"""
+    pid = snapshot['pid']
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    started = snapshot.get('started')
+    return started is None or _start_time(pid) in (None, started)
+
+
+def _merge(target, snapshot):
+    """Add the counters and histograms of a snapshot into target ({'counters': {}, 'histograms': {}})"""
+    for name, labels, value in snapshot['counters']:
+        key = (name, _labels(**labels))
+        target['counters'][key] = target['counters'].get(key, 0) + value
+    for labels, values in snapshot['histograms']:
+        key = _labels(**labels)
+        merged = target['histograms'].setdefault(key, [0] * len(values))
+        for i, value in enumerate(values):
+            merged[i] += value
+
+
+def _retire(dead_paths):
+    """
+    Fold the snapshots of exited workers into the retired snapshot and delete
+    them. Runs under a file lock since any worker may serve a scrape; the ids
+    folded last time are kept so a crash before the deletes cannot count a
+    snapshot twice.
+    """
+    retired_path = os.path.join(Config.METRICS_FOLDER, RETIRED_FILE)
+    with open(os.path.join(Config.METRICS_FOLDER, 'retired.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        retired = _read_json(retired_path) or {'counters': [], 'histograms': [], 'folded': []}
+        totals = {'counters': {}, 'histograms': {}}
+        _merge(totals, retired)
+        already_folded = set(retired.get('folded', []))
+        folded = []
+        for path in dead_paths:
+            snapshot = _read_json(path)
+            if snapshot is None:
+                continue
+            snapshot_id = snapshot.get('id', str(snapshot['pid']))
+            if snapshot_id not in already_folded:
+                _merge(totals, snapshot)
+            folded.append(snapshot_id)
+        if folded:
+            _write_json(retired_path, {
+                'counters': [[name, dict(labels), value] for (name, labels), value in totals['counters'].items()],
+                'histograms': [[dict(labels), values] for labels, values in totals['histograms'].items()],
+                'folded': folded,
+            })
+        for path in dead_paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def _load_snapshots():
+    """
+    (snapshots to count, snapshots of running workers). Exited workers are
+    retired first, so the first list is the retired snapshot plus the live ones.
+    """
+    live = []
+    dead_paths = []
+    for path in glob.glob(os.path.join(Config.METRICS_FOLDER, '*.json')):
+        if os.path.basename(path) == RETIRED_FILE:
+            continue
+        snapshot = _read_json(path)
+        if snapshot is None:
+            continue
+        if _alive(snapshot):
+            live.append(snapshot)
+        else:
+            dead_paths.append(path)
+    counted = list(live)
+    if dead_paths:
+        try:
+            _retire(dead_paths)
+        except OSError:
+            # Count them unretired this time; the next scrape tries again
+            counted += [snapshot for snapshot in map(_read_json, dead_paths) if snapshot]
+    retired = _read_json(os.path.join(Config.METRICS_FOLDER, RETIRED_FILE))
+    if retired:
+        counted.append(retired)
+    return counted, live
+
+
+def collect():
+    """
+    Merge the snapshots of all running workers with the retired snapshot.
+    Counters and histograms of exited workers are kept so totals never go
+    backwards; their gauges are dropped.
+    """
+    totals = {'counters': {}, 'histograms': {}}
+    gauges = {}
+    counted, live = _load_snapshots()
+    for snapshot in counted:
+        _merge(totals, snapshot)
+    for snapshot in live:
+        for name, labels, value in snapshot['gauges']:
+            key = (name, _labels(**labels))
+            gauges[key] = gauges.get(key, 0) + value
+    gauges[('sms_worker_processes', ())] = len(live)
+    counters, histograms = totals['counters'], totals['histograms']
+
+    cache_requests = {}
+    for (name, labels), value in counters.items():
+        if name == 'sms_cache_requests_total':
+            labels = dict(labels)
+            cache_requests.setdefault(labels['cache'], {})[labels['result']] = value
+    for cache_name, results in cache_requests.items():
+        total = results.get('hit', 0) + results.get('miss', 0)
+        gauges[('sms_cache_hit_ratio', _labels(cache=cache_name))] = results.get('hit', 0) / total if total else 0
+    return counters, gauges, histograms
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def render():
+    """All metrics in Prometheus text exposition format (version 0.0.4)"""
+    counters, gauges, histograms = collect()
+    samples = {}
+    for (name, labels), value in list(counters.items()) + list(gauges.items()):
+        samples.setdefault(name, []).append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+
+    histogram_name = 'sms_http_request_duration_seconds'
+    for labels, values in sorted(histograms.items()):
+        lines = samples.setdefault(histogram_name, [])
+        cumulative = 0
+        for bound, count in zip(DURATION_BUCKETS + ('+Inf',), values):
+            cumulative += count
+            lines.append(f'{histogram_name}_bucket{_format_labels(labels, [("le", str(bound))])} {cumulative}')
+        lines.append(f'{histogram_name}_sum{_format_labels(labels)} {_format_value(float(values[-1]))}')
+        lines.append(f'{histogram_name}_count{_format_labels(labels)} {cumulative}')
+
+    output = []
+    for name in sorted(samples):
+        metric_type, help_text = METRIC_HELP.get(name, ('untyped', name))
+        output.append(f'# HELP {name} {help_text}')
+        output.append(f'# TYPE {name} {metric_type}')
+        output.extend(sorted(samples[name]) if metric_type != 'histogram' else samples[name])
+    return '\n'.join(output) + '\n'
+
+
+def _start_request():
+    global _in_flight
+    with _lock:
+        _in_flight += 1
+    g.metrics_started_at = time.perf_counter()
+
+
+def _record_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def _finish_request(error=None):
+    global _in_flight
+    started_at = g.pop('metrics_started_at', None)
+    if started_at is None:
+        return
+    with _lock:
+        _in_flight -= 1
+    endpoint = request.endpoint or 'unmatched'
+    status = g.pop('metrics_status', 500 if error else 200)
+    observe_duration(endpoint, time.perf_counter() - started_at)
+    inc_counter('sms_http_requests_total', endpoint=endpoint, method=request.method, status=status)
+    stats = get_request_query_stats()
+    if stats is not None and stats.count:
+        inc_counter('sms_db_queries_total', stats.count, endpoint=endpoint)
+    try:
+        flush()
+    except OSError:
+        pass
+
+
+def metrics_view():
+    """Prometheus scrape endpoint; requires a bearer token when METRICS_TOKEN is set"""
+    if Config.METRICS_TOKEN and \
+            request.headers.get('Authorization') != f'Bearer {Config.METRICS_TOKEN}':
+        abort(403)
+    flush(force=True)
+    return Response(render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+def init_metrics(app):
+    """Record request metrics and serve them at /metrics"""
+    if not Config.METRICS_ENABLED:
+        return
+    app.before_request(_start_request)
+    app.after_request(_record_status)
+    app.teardown_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,165 @@
+"""
+Move uploaded files from the flat upload folders into the sharded layout (storage.py)
+Runs while the app is serving. Each batch locks a few hundred rows, hard-links
+their files to the new paths, rewrites the paths and commits, so every stored
+path works at every moment; the old names are removed a grace period later,
+once requests that read a path just before the switch have opened their file.
+Safe to interrupt and re-run.
+
+    python migrate_storage.py --dry-run
+    python migrate_storage.py --batch-size 200 --pause 0.1
+"""
+import argparse
+import os
+import shutil
+import time
+import uuid
+from config import Config
+from database import connect
+from storage import is_sharded, shard_path
+
+# name -> (upload folder, batch query locking (key, path) rows after a key, path updates taking (new, key, old))
+TARGETS = {
+    'note-blobs': (
+        Config.NOTES_FOLDER,
+        "SELECT sha256, file_path FROM note_blobs WHERE sha256 > %s ORDER BY sha256 LIMIT %s FOR UPDATE",
+        ["UPDATE note_blobs SET file_path = %s WHERE sha256 = %s AND file_path = %s",
+         "UPDATE notes SET file_path = %s WHERE blob_sha256 = %s AND file_path = %s"],
+    ),
+    'notes': (
+        Config.NOTES_FOLDER,
+        "SELECT id, file_path FROM notes WHERE id > %s AND blob_sha256 IS NULL ORDER BY id LIMIT %s FOR UPDATE",
+        ["UPDATE notes SET file_path = %s WHERE id = %s AND file_path = %s"],
+    ),
+    'student-photos': (
+        Config.STUDENT_PHOTOS_FOLDER,
+        "SELECT id, photo_path FROM students WHERE id > %s AND photo_path IS NOT NULL ORDER BY id LIMIT %s FOR UPDATE",
+        ["UPDATE students SET photo_path = %s WHERE id = %s AND photo_path = %s"],
+    ),
+}
+FIRST_KEY = {'note-blobs': ''}
+
+
+def _place(old_path, new_path):
+    """Give old_path's file a second name; False if new_path holds a different file"""
+    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+    try:
+        os.link(old_path, new_path)
+    except FileExistsError:
+        return os.path.samefile(old_path, new_path)
+    except OSError:
+        if not os.path.exists(old_path):
+            raise
+        # Hard links not possible here (e.g. another filesystem): copy, then rename into place
+        temp_path = f'{new_path}.{uuid.uuid4().hex}'
+        shutil.copy2(old_path, temp_path)
+        os.replace(temp_path, new_path)
+    return True
+
+
+def migrate_batch(cursor, name, after, batch_size, dry_run, stats):
+    """Move one batch; returns (last key, old paths to remove) or (None, []) when the table is done"""
+    folder, query, updates = TARGETS[name]
+    if dry_run:
+        query = query.replace(' FOR UPDATE', '')
+    cursor.execute(query, (after, batch_size))
+    rows = cursor.fetchall()
+    if not rows:
+        cursor.connection.commit()
+        return None, []
+
+    moved = []
+    for key, old_path in rows:
+        if is_sharded(folder, old_path):
+            continue
+        new_path = shard_path(folder, os.path.basename(old_path))
+        if dry_run:
+            stats['to_move'] += 1
+            continue
+        try:
+            if not _place(old_path, new_path):
+                stats['conflicts'] += 1
+                continue
+        except FileNotFoundError:
+            stats['missing'] += 1
+            continue
+        for update in updates:
+            cursor.execute(update, (new_path, key, old_path))
+        moved.append(old_path)
+    cursor.connection.commit()
+    stats['moved'] += len(moved)
+    return rows[-1][0], moved
+
+
+def _remove(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move uploaded files into hash-prefixed subdirectories')
+    parser.add_argument('--only', choices=sorted(TARGETS), action='append', help='Migrate only these (repeatable)')
+    parser.add_argument('--batch-size', type=int, default=200, help='Rows locked and moved per transaction (default: 200)')
+    parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches (default: 0)')
+    parser.add_argument('--grace', type=float, default=30.0,
+                        help='Seconds before old file names are removed (default: 30)')
+    parser.add_argument('--dry-run', action='store_true', help='Only count the files still in the flat layout')
+    args = parser.parse_args()
+
+    connection = connect()
+    cursor = connection.cursor()
+    started_at = time.perf_counter()
+    pending = []  # (remove after, old paths)
+    print(f"Moving uploads into {Config.UPLOAD_SHARD_DEPTH}-level sharded folders...")
+    print("-" * 50)
+
+    failed = False
+    for name in args.only or TARGETS:
+        stats = {'moved': 0, 'to_move': 0, 'missing': 0, 'conflicts': 0}
+        after = FIRST_KEY.get(name, 0)
+        last_report = time.perf_counter()
+        try:
+            while True:
+                after, moved = migrate_batch(cursor, name, after, args.batch_size, args.dry_run, stats)
+                if after is None:
+                    break
+                if moved:
+                    pending.append((time.monotonic() + args.grace, moved))
+                while pending and pending[0][0] <= time.monotonic():
+                    _remove(pending.pop(0)[1])
+                if time.perf_counter() - last_report >= 5:
+                    print(f"[OK] {name}: {stats['moved']} files moved so far")
+                    last_report = time.perf_counter()
+                if args.pause:
+                    time.sleep(args.pause)
+        except Exception as e:
+            connection.rollback()
+            print(f"[ERROR] {name}: {str(e)}")
+            failed = True
+            continue
+
+        if args.dry_run:
+            print(f"[OK] {name}: {stats['to_move']} files to move")
+        else:
+            print(f"[OK] {name}: {stats['moved']} files moved")
+        if stats['missing']:
+            print(f"[INFO] {name}: {stats['missing']} rows point at files that do not exist (left unchanged)")
+        if stats['conflicts']:
+            print(f"[INFO] {name}: {stats['conflicts']} files not moved, another file already has their new path")
+
+    connection.close()
+    if pending:
+        wait = max(0.0, pending[-1][0] - time.monotonic())
+        print(f"[INFO] Removing old file names in {wait:.0f}s...")
+        time.sleep(wait)
+        for _, paths in pending:
+            _remove(paths)
+
+    print("-" * 50)
+    print(f"[OK] Done in {time.perf_counter() - started_at:.1f}s")
+    if failed:
+        print("[ERROR] Some uploads were not migrated; re-run to continue")
+        raise SystemExit(1)
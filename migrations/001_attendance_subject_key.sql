@@ -0,0 +1,22 @@
+-- ============================================
+-- 001: Unique attendance per student/date/subject, including NULL subjects
+-- ============================================
+-- The old unique key (student_id, attendance_date, subject_id) never matched
+-- rows whose subject_id is NULL, so whole-day attendance could be duplicated
+-- and INSERT ... ON DUPLICATE KEY UPDATE could not upsert it.
+USE school_management;
+
+ALTER TABLE attendance
+    ADD COLUMN subject_key INT AS (IFNULL(subject_id, 0)) STORED;
+
+-- Keep the most recent row of any existing duplicates
+DELETE older FROM attendance older
+JOIN attendance newer
+  ON newer.student_id = older.student_id
+ AND newer.attendance_date = older.attendance_date
+ AND newer.subject_key = older.subject_key
+ AND newer.id > older.id;
+
+ALTER TABLE attendance
+    DROP INDEX unique_student_date,
+    ADD UNIQUE KEY unique_student_date (student_id, attendance_date, subject_key);
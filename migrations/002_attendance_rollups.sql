@@ -0,0 +1,38 @@
+-- ============================================
+-- 002: Attendance rollup tables
+-- ============================================
+-- Per-student-per-month and per-section-per-day status counts, updated by
+-- mark_attendance in the same transaction. Backfill after applying:
+--     python rebuild_rollups.py
+USE school_management;
+
+CREATE TABLE attendance_monthly_summary (
+    student_id INT NOT NULL,
+    month_start DATE NOT NULL,
+    class_id INT NOT NULL,
+    section_id INT NOT NULL,
+    present_count INT NOT NULL DEFAULT 0,
+    absent_count INT NOT NULL DEFAULT 0,
+    late_count INT NOT NULL DEFAULT 0,
+    half_day_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (student_id, month_start, class_id, section_id),
+    FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE CASCADE,
+    FOREIGN KEY (class_id) REFERENCES classes(id) ON DELETE CASCADE,
+    FOREIGN KEY (section_id) REFERENCES sections(id) ON DELETE CASCADE,
+    INDEX idx_class_section_month (class_id, section_id, month_start)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE attendance_daily_section_summary (
+    class_id INT NOT NULL,
+    section_id INT NOT NULL,
+    attendance_date DATE NOT NULL,
+    subject_key INT NOT NULL DEFAULT 0,
+    present_count INT NOT NULL DEFAULT 0,
+    absent_count INT NOT NULL DEFAULT 0,
+    late_count INT NOT NULL DEFAULT 0,
+    half_day_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (class_id, section_id, attendance_date, subject_key),
+    FOREIGN KEY (class_id) REFERENCES classes(id) ON DELETE CASCADE,
+    FOREIGN KEY (section_id) REFERENCES sections(id) ON DELETE CASCADE,
+    INDEX idx_date (attendance_date)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
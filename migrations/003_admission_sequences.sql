@@ -0,0 +1,20 @@
+-- ============================================
+-- 003: Admission number sequences
+-- ============================================
+-- One row per admission prefix (ADM<year>) holding the next number to issue.
+-- admission.allocate_admission_numbers locks the row for the admitting
+-- transaction, replacing the COUNT(*) ... LIKE 'ADM<year>%' scan that handed
+-- the same number to concurrent admissions.
+USE school_management;
+
+CREATE TABLE admission_sequences (
+    prefix VARCHAR(20) PRIMARY KEY,
+    next_value INT NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Continue after the highest number already issued for each year
+INSERT INTO admission_sequences (prefix, next_value)
+SELECT LEFT(admission_number, 7), MAX(CAST(SUBSTRING(admission_number, 8) AS UNSIGNED)) + 1
+FROM students
+WHERE admission_number REGEXP '^ADM[0-9]{5,}$'
+GROUP BY LEFT(admission_number, 7);
@@ -0,0 +1,22 @@
+-- ============================================
+-- 004: Indexes for keyset-paginated listings
+-- ============================================
+-- Listings page newest first by (timestamp, id) and read one page per query
+-- (see pagination.py). Each index matches a listing's filter columns followed
+-- by its sort key, so a page is a short index range scan at any depth.
+USE school_management;
+
+ALTER TABLE users
+    ADD INDEX idx_created_id (created_at, id);
+
+ALTER TABLE teachers
+    ADD INDEX idx_created_id (created_at, id);
+
+ALTER TABLE students
+    ADD INDEX idx_created_id (created_at, id),
+    ADD INDEX idx_class_created_id (class_id, created_at, id);
+
+ALTER TABLE notes
+    ADD INDEX idx_active_upload_id (is_active, upload_date, id),
+    ADD INDEX idx_teacher_active_upload_id (teacher_id, is_active, upload_date, id),
+    ADD INDEX idx_class_active_upload_id (class_id, is_active, upload_date, id);
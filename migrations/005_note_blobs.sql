@@ -0,0 +1,20 @@
+-- ============================================
+-- 005: Content-addressed note files
+-- ============================================
+-- Each distinct note file is stored once, named by its SHA-256 (see
+-- blob_store.py). ref_count is the number of active notes using the blob;
+-- when it drops to zero the file is deleted. Existing files are moved into the
+-- store by `python dedup_notes.py` after this script.
+USE school_management;
+
+CREATE TABLE note_blobs (
+    sha256 CHAR(64) PRIMARY KEY,
+    file_path VARCHAR(1000) NOT NULL,
+    file_size BIGINT NOT NULL,
+    ref_count INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+ALTER TABLE notes
+    ADD COLUMN blob_sha256 CHAR(64) NULL AFTER file_type,
+    ADD INDEX idx_blob (blob_sha256);
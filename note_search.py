@@ -0,0 +1,427 @@
+"""
+Notes full-text search
+An inverted index over note titles, subjects, descriptions and the text of the
+uploaded PDF/DOCX/PPTX files, ranked with BM25. It lives in a SQLite database
+under SEARCH_FOLDER shared by every worker process:
+
+- docs: one row per active note with the columns the role filters need
+  (teacher, subject, class, section) and its weighted length
+- postings: (term, note) -> weighted term frequency
+- queue: notes waiting to be (re)indexed
+
+Uploads and deletes queue the note; a background indexer extracts the file's
+text, which is cached per blob so identical files are read once, and replaces
+the note's postings. Deleted notes also leave the index at once. Only one
+process indexes at a time (it holds SEARCH_FOLDER/indexer.lock): a thread of
+whichever app worker takes the lock first, or `index_notes.py --watch`; the
+others wait to take over if it exits.
+
+A new or reset index is not searched until every note has been indexed once
+(meta 'ready'); until then search_notes returns None.
+"""
+import fcntl
+import math
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from config import Config
+from database import connect
+from metrics import inc_counter
+from student_search import normalize
+from text_extract import extract_text
+
+INDEX_PATH = os.path.join(Config.SEARCH_FOLDER, 'notes.sqlite3')
+INDEXER_LOCK_PATH = os.path.join(Config.SEARCH_FOLDER, 'indexer.lock')
+MAX_RESULTS = 100  # Ranked matches shown on the notes page
+BATCH_SIZE = 20  # Notes claimed per indexing round
+CLAIM_SECONDS = 600  # A claimed note not indexed within this time is handed out again
+K1, B = 1.2, 0.75  # BM25 parameters
+FIELD_WEIGHTS = {'title': 3, 'subject': 2, 'description': 1, 'body': 1}
+MAX_TERM_LENGTH = 40
+STOPWORDS = frozenset("""
+    a an and are as at be but by for from has have in is it its of on or that the this to was were will with
+""".split())
+
+NOTE_COLUMNS = """
+    n.id, n.title, n.description, s.subject_name, n.file_path, n.file_type, n.blob_sha256,
+    n.teacher_id, n.subject_id, n.class_id, n.section_id, n.is_active
+"""
+
+_local = threading.local()
+
+
+def _connection():
+    """This thread's connection to the index (reopened after a fork)"""
+    connection = getattr(_local, 'connection', None)
+    if connection is None or _local.pid != os.getpid():
+        os.makedirs(Config.SEARCH_FOLDER, exist_ok=True)
+        connection = sqlite3.connect(INDEX_PATH, timeout=10, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (
+                note_id INTEGER PRIMARY KEY,
+                teacher_id INTEGER, subject_id INTEGER, class_id INTEGER, section_id INTEGER,
+                length REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                note_id INTEGER NOT NULL,
+                tf REAL NOT NULL,
+                PRIMARY KEY (term, note_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_note ON postings (note_id);
+            CREATE TABLE IF NOT EXISTS queue (
+                note_id INTEGER PRIMARY KEY,
+                queued_at REAL NOT NULL,
+                claimed_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS texts (
+                sha256 TEXT PRIMARY KEY,
+                body BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value REAL NOT NULL
+            );
+        """)
+        _local.connection = connection
+        _local.pid = os.getpid()
+    return connection
+
+
+@contextmanager
+def _transaction(connection):
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        yield connection
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+    connection.execute('COMMIT')
+
+
+def tokenize(text):
+    return [token for token in normalize(text)
+            if len(token) > 1 and len(token) <= MAX_TERM_LENGTH and token not in STOPWORDS]
+
+
+def _meta(connection, key, default=0.0):
+    row = connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else default
+
+
+def _bump(connection, key, delta):
+    connection.execute("""
+        INSERT INTO meta (key, value) VALUES (?, ?)
+        ON CONFLICT (key) DO UPDATE SET value = value + excluded.value
+    """, (key, delta))
+
+
+# ============================================
+# QUEUE
+# ============================================
+
+def _enqueue(connection, note_ids):
+    now = time.time()
+    connection.executemany("""
+        INSERT INTO queue (note_id, queued_at, claimed_at) VALUES (?, ?, NULL)
+        ON CONFLICT (note_id) DO UPDATE SET queued_at = excluded.queued_at, claimed_at = NULL
+    """, [(note_id, now) for note_id in note_ids])
+
+
+def note_changed(*note_ids):
+    """Queue uploaded or edited notes (after commit) for indexing"""
+    try:
+        _enqueue(_connection(), note_ids)
+    except sqlite3.Error as e:
+        print(f"Notes index unavailable: {str(e)}")
+        return
+    ensure_indexer()
+    _wake.set()
+
+
+def note_removed(note_id):
+    """Take a soft-deleted note (after commit) out of the index"""
+    try:
+        with _transaction(_connection()) as connection:
+            _remove(connection, note_id)
+            # Re-checked by the indexer, in case it was indexing this note right now
+            _enqueue(connection, [note_id])
+    except sqlite3.Error as e:
+        print(f"Notes index unavailable: {str(e)}")
+
+
+def _claim(connection, limit):
+    """Up to limit queued note ids, claimed until CLAIM_SECONDS from now"""
+    now = time.time()
+    with _transaction(connection):
+        rows = connection.execute("""
+            SELECT note_id FROM queue WHERE claimed_at IS NULL OR claimed_at < ?
+            ORDER BY queued_at LIMIT ?
+        """, (now - CLAIM_SECONDS, limit)).fetchall()
+        note_ids = [row[0] for row in rows]
+        connection.executemany('UPDATE queue SET claimed_at = ? WHERE note_id = ?',
+                               [(now, note_id) for note_id in note_ids])
+    return note_ids, now
+
+
+# ============================================
+# INDEXING
+# ============================================
+
+def _remove(connection, note_id):
+    row = connection.execute('SELECT length FROM docs WHERE note_id = ?', (note_id,)).fetchone()
+    if row is None:
+        return
+    connection.execute('DELETE FROM postings WHERE note_id = ?', (note_id,))
+    connection.execute('DELETE FROM docs WHERE note_id = ?', (note_id,))
+    _bump(connection, 'docs', -1)
+    _bump(connection, 'length', -row[0])
+
+
+def _body_text(connection, note):
+    """The note file's text, from the per-blob cache when another note has the same file"""
+    file_path, file_type, blob_sha256 = note[4], note[5], note[6]
+    if blob_sha256:
+        row = connection.execute('SELECT body FROM texts WHERE sha256 = ?', (blob_sha256,)).fetchone()
+        if row:
+            return zlib.decompress(row[0]).decode()
+    try:
+        text = extract_text(file_path, file_type, Config.NOTE_TEXT_MAX_CHARS)
+    except Exception as e:
+        # Still indexed by title, subject and description
+        print(f"Could not extract text from note {note[0]} ({file_path}): {str(e)}")
+        inc_counter('sms_note_index_extract_failures_total', file_type=file_type or '')
+        return ''
+    if blob_sha256:
+        connection.execute('INSERT OR REPLACE INTO texts (sha256, body) VALUES (?, ?)',
+                           (blob_sha256, zlib.compress(text.encode())))
+    return text
+
+
+def _term_counts(note, body):
+    fields = {'title': note[1], 'description': note[2], 'subject': note[3], 'body': body}
+    counts = Counter()
+    for field, text in fields.items():
+        for term in tokenize(text):
+            counts[term] += FIELD_WEIGHTS[field]
+    return counts
+
+
+def _index_note(connection, note, body):
+    counts = _term_counts(note, body)
+    length = sum(counts.values())
+    with _transaction(connection):
+        _remove(connection, note[0])
+        connection.execute("""
+            INSERT INTO docs (note_id, teacher_id, subject_id, class_id, section_id, length)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (note[0], note[7], note[8], note[9], note[10], length))
+        connection.executemany('INSERT INTO postings (term, note_id, tf) VALUES (?, ?, ?)',
+                               [(term, note[0], tf) for term, tf in counts.items()])
+        _bump(connection, 'docs', 1)
+        _bump(connection, 'length', length)
+
+
+def process_queue(limit=BATCH_SIZE):
+    """Index one batch of queued notes; returns how many were processed"""
+    connection = _connection()
+    note_ids, claimed_at = _claim(connection, limit)
+    if not note_ids:
+        _mark_ready(connection)
+        return 0
+
+    db = connect()
+    try:
+        cursor = db.cursor()
+        cursor.execute(f"""
+            SELECT {NOTE_COLUMNS} FROM notes n JOIN subjects s ON n.subject_id = s.id
+            WHERE n.id IN ({', '.join(['%s'] * len(note_ids))})
+        """, note_ids)
+        notes = {row[0]: row for row in cursor.fetchall()}
+    finally:
+        db.close()
+
+    for note_id in note_ids:
+        note = notes.get(note_id)
+        if note is None or not note[11]:
+            with _transaction(connection):
+                _remove(connection, note_id)
+        else:
+            started_at = time.perf_counter()
+            _index_note(connection, note, _body_text(connection, note))
+            inc_counter('sms_note_index_seconds_total', time.perf_counter() - started_at)
+        # Unless it was queued again meanwhile
+        connection.execute('DELETE FROM queue WHERE note_id = ? AND claimed_at = ?', (note_id, claimed_at))
+    inc_counter('sms_note_index_updates_total', len(note_ids))
+    return len(note_ids)
+
+
+def backfill():
+    """Queue every active note once: the first time any indexer starts, and after reset_note_index"""
+    connection = _connection()
+    if _meta(connection, 'backfilled', None) is not None:
+        return
+
+    db = connect()
+    try:
+        cursor = db.cursor()
+        last_id = 0
+        while True:
+            cursor.execute("SELECT id FROM notes WHERE id > %s AND is_active = TRUE ORDER BY id LIMIT 1000",
+                           (last_id,))
+            note_ids = [row[0] for row in cursor.fetchall()]
+            if not note_ids:
+                break
+            _enqueue(connection, note_ids)
+            last_id = note_ids[-1]
+    finally:
+        db.close()
+    # Only once everything is queued, so an interrupted backfill starts over
+    connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('backfilled', ?)", (time.time(),))
+
+
+def _mark_ready(connection):
+    """Open the index to searches once every note queued by the backfill has been indexed"""
+    if _meta(connection, 'ready', None) is not None:
+        return
+    with _transaction(connection):
+        backfilled_at = _meta(connection, 'backfilled', None)
+        if backfilled_at is None:
+            return
+        if connection.execute('SELECT 1 FROM queue WHERE queued_at <= ? LIMIT 1', (backfilled_at,)).fetchone():
+            return
+        connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('ready', ?)", (time.time(),))
+
+
+def reset_note_index():
+    """Drop the index; it is rebuilt from the notes table by the next indexer round"""
+    with _transaction(_connection()) as connection:
+        for table in ('docs', 'postings', 'queue', 'meta'):
+            connection.execute(f'DELETE FROM {table}')
+    _wake.set()
+
+
+# ============================================
+# BACKGROUND INDEXER
+# ============================================
+
+_wake = threading.Event()
+_indexer = None
+_indexer_lock = threading.Lock()
+_lock_file = None  # (pid, open INDEXER_LOCK_PATH) while this process is the indexer
+
+
+def _take_indexer_lock():
+    """Make this process the indexer; False while another process is"""
+    global _lock_file
+    if _lock_file is not None:
+        if _lock_file[0] == os.getpid():
+            return True
+        _lock_file[1].close()  # Inherited across a fork; the parent still holds the lock
+        _lock_file = None
+    os.makedirs(Config.SEARCH_FOLDER, exist_ok=True)
+    lock_file = open(INDEXER_LOCK_PATH, 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return False
+    _lock_file = (os.getpid(), lock_file)  # Held until the process exits
+    return True
+
+
+def run_indexer(poll_interval=None):
+    """
+    Index queued notes forever, sleeping poll_interval seconds when the queue
+    is empty. Waits while another process is the indexer.
+    """
+    poll_interval = poll_interval or Config.NOTE_INDEX_POLL
+    while not _take_indexer_lock():
+        time.sleep(poll_interval)
+    while True:
+        try:
+            backfill()
+            processed = process_queue()
+        except Exception as e:
+            print(f"Notes indexer error: {str(e)}")
+            processed = 0
+        if not processed:
+            _wake.wait(poll_interval)
+            _wake.clear()
+
+
+def ensure_indexer():
+    """
+    Start this process's indexer thread (if NOTE_INDEX_WORKER is on and it isn't
+    running); it only indexes while this process holds the indexer lock
+    """
+    global _indexer
+    if not Config.NOTE_INDEX_WORKER:
+        return
+    with _indexer_lock:
+        if _indexer is None or not _indexer.is_alive() or _indexer.pid != os.getpid():
+            _indexer = threading.Thread(target=run_indexer, name='notes-indexer', daemon=True)
+            _indexer.pid = os.getpid()
+            _indexer.start()
+
+
+# ============================================
+# SEARCH
+# ============================================
+
+def search_notes(query, limit=MAX_RESULTS, teacher_id=None, student_class=None,
+                 subject_id=None, class_id=None, section_id=None):
+    """
+    Ids of the best matching active notes, best first, or None until the index
+    has been built (callers fall back to a plain LIKE search).
+    teacher_id limits to a teacher's notes; student_class=(class_id, section_id)
+    to the notes a student of that section may see.
+    """
+    ensure_indexer()
+    terms = set(tokenize(query))
+    try:
+        connection = _connection()
+        if _meta(connection, 'ready', None) is None:
+            return None
+        if not terms:
+            return []
+
+        filters, params = [], []
+        if teacher_id is not None:
+            filters.append('d.teacher_id = ?')
+            params.append(teacher_id)
+        if student_class is not None:
+            filters.append('d.class_id = ? AND (d.section_id = ? OR d.section_id IS NULL)')
+            params.extend(student_class)
+        for column, value in (('subject_id', subject_id), ('class_id', class_id), ('section_id', section_id)):
+            if value:
+                filters.append(f'd.{column} = ?')
+                params.append(value)
+        where = ''.join(f' AND {condition}' for condition in filters)
+
+        total_docs = _meta(connection, 'docs')
+        average_length = _meta(connection, 'length') / total_docs if total_docs else 1.0
+        scores = Counter()
+        for term in terms:
+            df = connection.execute('SELECT COUNT(*) FROM postings WHERE term = ?', (term,)).fetchone()[0]
+            if not df:
+                continue
+            idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+            rows = connection.execute(f"""
+                SELECT p.note_id, p.tf, d.length FROM postings p JOIN docs d ON d.note_id = p.note_id
+                WHERE p.term = ?{where}
+            """, [term] + params)
+            for note_id, tf, length in rows:
+                scores[note_id] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / average_length))
+    except sqlite3.Error as e:
+        print(f"Notes index unavailable: {str(e)}")
+        return None
+
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+    return [note_id for note_id, _ in ranked[:limit]]
@@ -2,10 +2,18 @@
 Notes Management Blueprint
 Handles note upload, view, and download with role-based access
 """
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, session, abort
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, abort, jsonify
 from database import get_db
-from utils import require_login, require_role, secure_file_save, delete_file, allowed_file
+from pagination import fetch_page
+from reference_data import get_classes, get_sections, get_subjects, get_academic_years
+from academic_years import get_current_academic_year_id
+from utils import require_login, require_role, allowed_file, get_current_user
+from upload_sessions import UploadError, create_session, load_session, append_chunk, finish_session, discard_session
+from blob_store import save_stream, temp_path, add_reference, drop_new_blob, release_reference, collect_blob
+from metrics import record_upload
+from note_search import search_notes, note_changed, note_removed
 from config import Config
+from downloads import send_protected_file
 from datetime import datetime
 import os
 
@@ -15,21 +23,68 @@ notes_bp = Blueprint('notes', __name__, url_prefix='/notes')
 # NOTES UPLOAD (Teacher only)
 # ============================================
 
+def _note_fields():
+    """Note metadata from the upload form, or None when a required field is missing"""
+    fields = {
+        'title': request.form.get('title', '').strip(),
+        'subject_id': request.form.get('subject_id'),
+        'class_id': request.form.get('class_id'),
+        'section_id': request.form.get('section_id') or None,
+        'description': request.form.get('description', '').strip(),
+        'academic_year_id': request.form.get('academic_year_id'),
+    }
+    if not fields['title'] or not fields['subject_id'] or not fields['class_id']:
+        return None
+    return fields
+
+
+def _insert_note(cursor, fields, teacher_id, file_path, original_filename, file_size, blob_sha256):
+    """Save note metadata for a file already stored at file_path; returns the note id"""
+    file_type = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else ''
+    
+    # Get current academic year if not specified
+    academic_year_id = fields['academic_year_id'] or get_current_academic_year_id()
+    
+    cursor.execute("""
+        INSERT INTO notes 
+        (title, file_name, original_file_name, file_path, file_size, file_type, blob_sha256,
+         subject_id, class_id, section_id, teacher_id, academic_year_id, description)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, (fields['title'], os.path.basename(file_path), original_filename, file_path, file_size, file_type,
+          blob_sha256, fields['subject_id'], fields['class_id'], fields['section_id'], teacher_id,
+          academic_year_id, fields['description'] or None))
+    return cursor.lastrowid
+
+
+def _save_note(cursor, fields, teacher_id, temp_file, sha256, file_size, original_filename):
+    """Store an uploaded file as a (deduplicated) blob and add its note in one transaction; returns the note id"""
+    file_path, created = None, False
+    try:
+        file_path, created = add_reference(cursor, temp_file, sha256, file_size)
+        note_id = _insert_note(cursor, fields, teacher_id, file_path, original_filename, file_size, sha256)
+        cursor.connection.commit()
+    except Exception:
+        if created:
+            drop_new_blob(file_path)  # While the blob row is still locked by this transaction
+        cursor.connection.rollback()
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    record_upload(Config.NOTES_FOLDER, file_size)
+    note_changed(note_id)
+    return note_id
+
+
 @notes_bp.route('/upload', methods=['GET', 'POST'])
 @require_login
 @require_role('teacher')
 def upload_notes():
     """Upload study notes (PDF, DOC, DOCX, PPT) - Teacher only"""
     if request.method == 'POST':
-        title = request.form.get('title', '').strip()
-        subject_id = request.form.get('subject_id')
-        class_id = request.form.get('class_id')
-        section_id = request.form.get('section_id') or None
-        description = request.form.get('description', '').strip()
+        fields = _note_fields()
         file = request.files.get('file')
-        academic_year_id = request.form.get('academic_year_id')
         
-        if not title or not subject_id or not class_id or not file:
+        if not fields or not file:
             flash('Title, subject, class, and file are required.', 'danger')
             return redirect(url_for('notes.upload_notes'))
         
@@ -45,74 +100,133 @@ def upload_notes():
         try:
             cursor = get_db()
             
-            # Get teacher_id from user_id
-            user_id = session.get('user_id')
-            cursor.execute("SELECT id FROM teachers WHERE user_id = %s", (user_id,))
-            teacher = cursor.fetchone()
+            # teacher_id is resolved at login
+            teacher_id = get_current_user()['teacher_id']
             
-            if not teacher:
+            if not teacher_id:
                 flash('Teacher profile not found.', 'danger')
                 return redirect(url_for('auth.logout'))
             
-            teacher_id = teacher[0]
-            
-            # Get current academic year if not specified
-            if not academic_year_id:
-                cursor.execute("SELECT id FROM academic_years WHERE is_current = TRUE LIMIT 1")
-                academic_year = cursor.fetchone()
-                academic_year_id = academic_year[0] if academic_year else None
+            # Stream the file to disk, hashing it on the way; identical files are stored once
+            temp_file, sha256, file_size = save_stream(file.stream)
+            _save_note(cursor, fields, teacher_id, temp_file, sha256, file_size, file.filename)
             
-            # Save file securely
-            success, file_path, error = secure_file_save(file, Config.NOTES_FOLDER)
-            if not success:
-                flash(f'Error uploading file: {error}', 'danger')
-                return redirect(url_for('notes.upload_notes'))
-            
-            # Get file metadata
-            file_size = os.path.getsize(file_path)
-            original_filename = file.filename
-            file_type = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else ''
-            
-            # Save note metadata to database
-            cursor.execute("""
-                INSERT INTO notes 
-                (title, file_name, original_file_name, file_path, file_size, file_type,
-                 subject_id, class_id, section_id, teacher_id, academic_year_id, description)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (title, os.path.basename(file_path), original_filename, file_path, file_size, file_type,
-                  subject_id, class_id, section_id, teacher_id, academic_year_id, description or None))
-            
-            cursor.connection.commit()
             flash('Notes uploaded successfully!', 'success')
             return redirect(url_for('notes.list_notes'))
         
         except Exception as e:
-            cursor.connection.rollback()
             flash(f'Error uploading notes: {str(e)}', 'danger')
-            if 'file_path' in locals() and os.path.exists(file_path):
-                delete_file(file_path)
             return redirect(url_for('notes.upload_notes'))
     
     # GET request - show upload form
     try:
-        cursor = get_db()
-        cursor.execute("SELECT id, subject_name FROM subjects ORDER BY subject_name")
-        subjects = cursor.fetchall()
-        
-        cursor.execute("SELECT id, class_name FROM classes ORDER BY class_name")
-        classes = cursor.fetchall()
-        
-        cursor.execute("SELECT id, section_name, class_id FROM sections ORDER BY class_id, section_name")
-        sections = cursor.fetchall()
-        
-        cursor.execute("SELECT id, year_name FROM academic_years ORDER BY start_date DESC")
-        academic_years = cursor.fetchall()
+        subjects = get_subjects()
+        classes = get_classes()
+        sections = get_sections()
+        academic_years = get_academic_years()
         
         return render_template('notes/upload.html',
-                             subjects=subjects, classes=classes, sections=sections, academic_years=academic_years)
+                             subjects=subjects, classes=classes, sections=sections, academic_years=academic_years,
+                             max_upload_mb=Config.MAX_CHUNKED_UPLOAD_SIZE // (1024 * 1024))
     except Exception as e:
         flash(f'Error loading form: {str(e)}', 'danger')
-        return render_template('notes/upload.html', subjects=[], classes=[], sections=[], academic_years=[])
+        return render_template('notes/upload.html', subjects=[], classes=[], sections=[], academic_years=[],
+                             max_upload_mb=Config.MAX_CHUNKED_UPLOAD_SIZE // (1024 * 1024))
+
+# ============================================
+# CHUNKED UPLOADS (Teacher only)
+# Large files are sent in chunks through an upload session (see upload_sessions.py):
+# POST /upload/sessions, then PUT /upload/sessions/<id>?offset=N per chunk,
+# then POST /upload/sessions/<id>/complete with the note form fields.
+# GET /upload/sessions/<id> tells a client where to resume after a dropped connection.
+# ============================================
+
+def _upload_error(error):
+    body = {'error': str(error)}
+    if error.offset is not None:
+        body['offset'] = error.offset
+    return jsonify(body), error.status
+
+
+def _session_status(meta):
+    return {'id': meta['id'], 'offset': meta['offset'], 'size': meta['size'], 'chunk_size': meta['chunk_size']}
+
+
+@notes_bp.route('/upload/sessions', methods=['POST'])
+@require_login
+@require_role('teacher')
+def start_upload():
+    """Start a chunked upload: filename and size (bytes) as JSON or form fields"""
+    data = request.get_json(silent=True) or request.form
+    try:
+        size = int(data.get('size') or 0)
+        meta = create_session(session['user_id'], data.get('filename', ''), size)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'The file size is required.'}), 400
+    except UploadError as e:
+        return _upload_error(e)
+    return jsonify(_session_status(meta)), 201
+
+
+@notes_bp.route('/upload/sessions/<upload_id>', methods=['GET'])
+@require_login
+@require_role('teacher')
+def upload_status(upload_id):
+    """How much of an upload the server has (where to resume)"""
+    try:
+        return jsonify(_session_status(load_session(upload_id, session['user_id'])))
+    except UploadError as e:
+        return _upload_error(e)
+
+
+@notes_bp.route('/upload/sessions/<upload_id>', methods=['PUT'])
+@require_login
+@require_role('teacher')
+def upload_chunk(upload_id):
+    """Append the request body (raw bytes) at ?offset="""
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'error': 'The chunk offset is required.'}), 400
+    try:
+        new_offset = append_chunk(upload_id, session['user_id'], offset, request.stream, request.content_length)
+    except UploadError as e:
+        return _upload_error(e)
+    return jsonify({'id': upload_id, 'offset': new_offset})
+
+
+@notes_bp.route('/upload/sessions/<upload_id>', methods=['DELETE'])
+@require_login
+@require_role('teacher')
+def cancel_upload(upload_id):
+    try:
+        discard_session(upload_id, session['user_id'])
+    except UploadError as e:
+        return _upload_error(e)
+    return '', 204
+
+
+@notes_bp.route('/upload/sessions/<upload_id>/complete', methods=['POST'])
+@require_login
+@require_role('teacher')
+def complete_upload(upload_id):
+    """Turn a fully received upload into a note (form fields as for /upload, plus optional sha256)"""
+    fields = _note_fields()
+    if not fields:
+        return jsonify({'error': 'Title, subject, class, and file are required.'}), 400
+    teacher_id = get_current_user()['teacher_id']
+    if not teacher_id:
+        return jsonify({'error': 'Teacher profile not found.'}), 403
+
+    try:
+        meta, sha256 = finish_session(upload_id, session['user_id'], temp_path(), request.form.get('sha256'))
+        note_id = _save_note(get_db(), fields, teacher_id, meta['path'], sha256, meta['size'], meta['filename'])
+    except UploadError as e:
+        return _upload_error(e)
+    except Exception as e:
+        return jsonify({'error': f'Error uploading notes: {str(e)}'}), 500
+
+    flash('Notes uploaded successfully!', 'success')
+    return jsonify({'id': note_id, 'sha256': sha256, 'redirect': url_for('notes.list_notes')}), 201
 
 # ============================================
 # NOTES LISTING
@@ -123,9 +237,9 @@ def upload_notes():
 def list_notes():
     """List notes based on user role"""
     try:
-        cursor = get_db()
-        user_role = session.get('role')
-        user_id = session.get('user_id')
+        cursor = get_db(readonly=True)
+        current_user = get_current_user()
+        user_role = current_user['role']
         
         # Filter options
         subject_id = request.args.get('subject_id', type=int)
@@ -135,14 +249,11 @@ def list_notes():
         
         if user_role == 'teacher':
             # Teachers can see their own notes
-            cursor.execute("SELECT id FROM teachers WHERE user_id = %s", (user_id,))
-            teacher = cursor.fetchone()
-            if not teacher:
+            teacher_id = current_user['teacher_id']
+            if not teacher_id:
                 flash('Teacher profile not found.', 'danger')
                 return redirect(url_for('auth.logout'))
             
-            teacher_id = teacher[0]
-            
             query = """
                 SELECT n.id, n.title, n.original_file_name, n.file_size, n.file_type, n.upload_date,
                        s.subject_name, c.class_name, sec.section_name, t.first_name, t.last_name
@@ -154,20 +265,16 @@ def list_notes():
                 WHERE n.teacher_id = %s AND n.is_active = TRUE
             """
             params = [teacher_id]
+            scope = {'teacher_id': teacher_id}
             
         elif user_role == 'student':
             # Students can see notes for their class
-            cursor.execute("""
-                SELECT s.class_id, s.section_id FROM students s WHERE s.user_id = %s
-            """, (user_id,))
-            student = cursor.fetchone()
-            
-            if not student:
+            if not current_user['student_id']:
                 flash('Student profile not found.', 'danger')
                 return redirect(url_for('auth.logout'))
             
-            student_class_id = student[0]
-            student_section_id = student[1]
+            student_class_id = current_user['class_id']
+            student_section_id = current_user['section_id']
             
             query = """
                 SELECT n.id, n.title, n.original_file_name, n.file_size, n.file_type, n.upload_date,
@@ -180,6 +287,7 @@ def list_notes():
                 WHERE n.class_id = %s AND (n.section_id = %s OR n.section_id IS NULL) AND n.is_active = TRUE
             """
             params = [student_class_id, student_section_id]
+            scope = {'student_class': (student_class_id, student_section_id)}
             
         else:  # admin
             # Admin can see all notes
@@ -194,6 +302,7 @@ def list_notes():
                 WHERE n.is_active = TRUE
             """
             params = []
+            scope = {}
         
         # Apply filters
         if subject_id:
@@ -208,28 +317,35 @@ def list_notes():
             query += " AND n.section_id = %s"
             params.append(section_id)
         
-        if search:
-            query += " AND (n.title LIKE %s OR s.subject_name LIKE %s)"
-            search_param = f"%{search}%"
-            params.extend([search_param, search_param])
-        
-        query += " ORDER BY n.upload_date DESC"
-        
-        cursor.execute(query, params)
-        notes_list = cursor.fetchall()
+        # Full-text search: best matches first (no pages), re-checked against the same filters
+        ranked_ids = search_notes(search, subject_id=subject_id, class_id=class_id, section_id=section_id,
+                                  **scope) if search else None
+        if ranked_ids is not None:
+            notes = []
+            if ranked_ids:
+                query += f" AND n.id IN ({', '.join(['%s'] * len(ranked_ids))})"
+                cursor.execute(query, params + ranked_ids)
+                rank = {note_id: position for position, note_id in enumerate(ranked_ids)}
+                notes = sorted(cursor.fetchall(), key=lambda row: rank[row[0]])
+            page = None
+        else:
+            if search:
+                # The search index is still being built
+                query += " AND (n.title LIKE %s OR s.subject_name LIKE %s)"
+                search_param = f"%{search}%"
+                params.extend([search_param, search_param])
+            
+            page = fetch_page(cursor, query, params, 'n.upload_date', 'n.id', sort_index=5, id_index=0)
+            notes = page.rows
         
         # Get filter options
-        cursor.execute("SELECT id, subject_name FROM subjects ORDER BY subject_name")
-        subjects = cursor.fetchall()
-        
-        cursor.execute("SELECT id, class_name FROM classes ORDER BY class_name")
-        classes = cursor.fetchall()
-        
-        cursor.execute("SELECT id, section_name, class_id FROM sections ORDER BY class_id, section_name")
-        sections = cursor.fetchall()
+        subjects = get_subjects()
+        classes = get_classes()
+        sections = get_sections()
         
         return render_template('notes/list.html',
-                             notes=notes_list,
+                             notes=notes,
+                             page=page,
                              subjects=subjects,
                              classes=classes,
                              sections=sections,
@@ -252,8 +368,8 @@ def download_notes(note_id):
     """Download notes file - Role-based access"""
     try:
         cursor = get_db()
-        user_role = session.get('role')
-        user_id = session.get('user_id')
+        current_user = get_current_user()
+        user_role = current_user['role']
         
         # Get note details
         cursor.execute("""
@@ -276,27 +392,23 @@ def download_notes(note_id):
         # Role-based access control
         if user_role == 'student':
             # Students can only download notes for their class
-            cursor.execute("SELECT class_id, section_id FROM students WHERE user_id = %s", (user_id,))
-            student = cursor.fetchone()
-            if not student or student[0] != note_class_id:
+            if not current_user['student_id'] or current_user['class_id'] != note_class_id:
                 abort(403)  # Forbidden
-            if note_section_id and student[1] != note_section_id:
+            if note_section_id and current_user['section_id'] != note_section_id:
                 abort(403)
         
         elif user_role == 'teacher':
             # Teachers can only download their own notes
-            cursor.execute("SELECT id FROM teachers WHERE user_id = %s", (user_id,))
-            teacher = cursor.fetchone()
-            if not teacher or teacher[0] != note_teacher_id:
+            if not current_user['teacher_id'] or current_user['teacher_id'] != note_teacher_id:
                 abort(403)
         
         # Admin can download any note
         
-        if not os.path.exists(file_path):
+        try:
+            return send_protected_file(file_path, original_filename)
+        except FileNotFoundError:
             flash('File not found on server.', 'danger')
             return redirect(url_for('notes.list_notes'))
-        
-        return send_file(file_path, as_attachment=True, download_name=original_filename)
     
     except Exception as e:
         flash(f'Error downloading file: {str(e)}', 'danger')
@@ -309,34 +421,36 @@ def delete_notes(note_id):
     """Delete notes - Teacher can only delete their own"""
     try:
         cursor = get_db()
-        user_role = session.get('role')
-        user_id = session.get('user_id')
+        current_user = get_current_user()
+        user_role = current_user['role']
         
         # Get note details
-        cursor.execute("SELECT file_path, teacher_id FROM notes WHERE id = %s", (note_id,))
+        cursor.execute("SELECT blob_sha256, teacher_id FROM notes WHERE id = %s", (note_id,))
         note = cursor.fetchone()
         
         if not note:
             flash('Note not found.', 'danger')
             return redirect(url_for('notes.list_notes'))
         
-        file_path = note[0]
+        blob_sha256 = note[0]
         note_teacher_id = note[1]
         
         # Teachers can only delete their own notes
         if user_role == 'teacher':
-            cursor.execute("SELECT id FROM teachers WHERE user_id = %s", (user_id,))
-            teacher = cursor.fetchone()
-            if not teacher or teacher[0] != note_teacher_id:
+            if not current_user['teacher_id'] or current_user['teacher_id'] != note_teacher_id:
                 flash('You can only delete your own notes.', 'danger')
                 return redirect(url_for('notes.list_notes'))
         
-        # Soft delete (set is_active = FALSE) instead of hard delete
-        cursor.execute("UPDATE notes SET is_active = FALSE WHERE id = %s", (note_id,))
+        # Soft delete (set is_active = FALSE) instead of hard delete; the file goes
+        # once no active note references its blob
+        cursor.execute("UPDATE notes SET is_active = FALSE WHERE id = %s AND is_active = TRUE", (note_id,))
+        released = cursor.rowcount == 1 and blob_sha256
+        if released:
+            release_reference(cursor, blob_sha256)
         cursor.connection.commit()
-        
-        # Optionally delete physical file
-        # delete_file(file_path)
+        if released:
+            collect_blob(cursor, blob_sha256)
+        note_removed(note_id)
         
         flash('Note deleted successfully!', 'success')
     except Exception as e:
@@ -0,0 +1,106 @@
+"""
+Keyset (cursor) pagination for the big listings
+Pages are read newest first by (timestamp, id): the next page asks for rows
+strictly older than the last row shown, so every page is one index range read
+of page_size + 1 rows no matter how deep the user has scrolled. Ties on the
+timestamp are broken by id, which keeps the order stable while rows are added.
+"""
+import base64
+from datetime import datetime
+from flask import request, url_for
+from config import Config
+
+
+def _encode(key):
+    value, row_id = key
+    return base64.urlsafe_b64encode(f'{value.isoformat()}|{row_id}'.encode()).decode().rstrip('=')
+
+
+def _decode(token):
+    """(datetime, id) from a cursor token, or None if it is missing or malformed"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        value, row_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(value), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def page_size_arg():
+    """?per_page=, clamped to 1..MAX_PAGE_SIZE"""
+    size = request.args.get('per_page', type=int) or Config.PAGE_SIZE
+    return max(1, min(size, Config.MAX_PAGE_SIZE))
+
+
+class KeysetPage:
+    """One page of rows plus the cursors for its neighbours"""
+
+    def __init__(self, rows, page_size, is_first, next_key=None, prev_key=None):
+        self.rows = rows
+        self.page_size = page_size
+        self.is_first = is_first
+        self.next_cursor = _encode(next_key) if next_key else None
+        self.prev_cursor = _encode(prev_key) if prev_key else None
+
+    def _url(self, **cursor):
+        args = request.args.to_dict()
+        args.pop('after', None)
+        args.pop('before', None)
+        args.update(cursor)
+        return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+    @property
+    def next_url(self):
+        return self._url(after=self.next_cursor) if self.next_cursor else None
+
+    @property
+    def prev_url(self):
+        return self._url(before=self.prev_cursor) if self.prev_cursor else None
+
+    @property
+    def first_url(self):
+        return None if self.is_first else self._url()
+
+
+def fetch_page(cursor, query, params, sort_column, id_column, sort_index, id_index):
+    """
+    Run query (SELECT ... WHERE ..., without ORDER BY or LIMIT) for the page
+    selected by ?after= / ?before= and ?per_page=.
+    sort_index and id_index locate sort_column and id_column in each row.
+    """
+    page_size = page_size_arg()
+    after = _decode(request.args.get('after'))
+    before = None if after else _decode(request.args.get('before'))
+    params = list(params)
+
+    if before:
+        # Rows just newer than the page after it, read in ascending order then flipped
+        query += f" AND ({sort_column} > %s OR ({sort_column} = %s AND {id_column} > %s))"
+        params += [before[0], before[0], before[1]]
+        query += f" ORDER BY {sort_column} ASC, {id_column} ASC LIMIT %s"
+    else:
+        if after:
+            query += f" AND ({sort_column} < %s OR ({sort_column} = %s AND {id_column} < %s))"
+            params += [after[0], after[0], after[1]]
+        query += f" ORDER BY {sort_column} DESC, {id_column} DESC LIMIT %s"
+    params.append(page_size + 1)
+
+    cursor.execute(query, params)
+    rows = list(cursor.fetchall())
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if before:
+        rows.reverse()
+
+    def key(row):
+        return row[sort_index], row[id_index]
+
+    # A 'newer' page that reached the newest row is the first page again
+    is_first = not (after or before) or (before is not None and not has_more and bool(rows))
+    if not rows:
+        return KeysetPage(rows, page_size, is_first)
+    next_key = key(rows[-1]) if (has_more or before) else None
+    prev_key = key(rows[0]) if not is_first else None
+    return KeysetPage(rows, page_size, is_first, next_key, prev_key)
@@ -0,0 +1,161 @@
+"""
+Per-request sampling profiler
+Admins can profile a single request by adding ?_profile=1 (or the header
+X-Profile: 1). A background thread samples the request thread's stack every
+PROFILE_INTERVAL seconds and the result is saved under PROFILE_FOLDER as a
+collapsed-stack file ready for flamegraph.pl or speedscope.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from flask import g, request, session
+from config import Config
+
+PROFILE_NAME = re.compile(r'^[\w.-]+$')
+
+
+class StackSampler:
+    """Samples one thread's Python stack from a daemon thread"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}')
+                frame = frame.f_back
+            stack.reverse()
+            self.stacks[';'.join(stack)] += 1
+            self.samples += 1
+
+    def top_frames(self, limit=10):
+        """
+        Most sampled frames as (frame, self samples, total samples); self counts
+        samples where the frame was running, total those where it was on the stack
+        """
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        return [(frame, count, total[frame]) for frame, count in own.most_common(limit)]
+
+
+def _requested():
+    return request.args.get('_profile') == '1' or request.headers.get('X-Profile') == '1'
+
+
+def _start_request():
+    if session.get('role') != 'admin' or not _requested():
+        return
+    sampler = StackSampler(threading.get_ident(), Config.PROFILE_INTERVAL)
+    sampler.start()
+    g.profiler = sampler
+
+
+def _finish_request(error=None):
+    sampler = g.pop('profiler', None)
+    if sampler is None:
+        return
+    sampler.stop()
+    try:
+        save_profile(sampler, request.endpoint or 'unmatched', request.method, request.full_path)
+    except OSError:
+        pass
+
+
+def save_profile(sampler, endpoint, method, path):
+    """Write <name>.folded (collapsed stacks) and <name>.json (summary)"""
+    os.makedirs(Config.PROFILE_FOLDER, exist_ok=True)
+    created_at = datetime.now()
+    name = f"{created_at.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{uuid.uuid4().hex[:8]}"
+    base_path = os.path.join(Config.PROFILE_FOLDER, name)
+
+    with open(f'{base_path}.folded', 'w') as folded_file:
+        for stack, count in sampler.stacks.most_common():
+            folded_file.write(f'{stack} {count}\n')
+    with open(f'{base_path}.json', 'w') as summary_file:
+        json.dump({
+            'name': name,
+            'endpoint': endpoint,
+            'method': method,
+            'path': path,
+            'created_at': created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'duration_ms': round(sampler.duration * 1000, 1),
+            'samples': sampler.samples,
+            'interval_ms': sampler.interval * 1000,
+            'top_frames': sampler.top_frames(),
+        }, summary_file)
+
+    _prune()
+    return name
+
+
+def _prune():
+    """Keep only the newest PROFILE_KEEP captures"""
+    summaries = sorted(f for f in os.listdir(Config.PROFILE_FOLDER) if f.endswith('.json'))
+    for summary in summaries[:max(len(summaries) - Config.PROFILE_KEEP, 0)]:
+        base_path = os.path.join(Config.PROFILE_FOLDER, summary[:-len('.json')])
+        for extension in ('.json', '.folded'):
+            try:
+                os.remove(base_path + extension)
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles():
+    """Summaries of saved captures, newest first"""
+    if not os.path.isdir(Config.PROFILE_FOLDER):
+        return []
+    profiles = []
+    for summary in sorted(os.listdir(Config.PROFILE_FOLDER), reverse=True):
+        if not summary.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(Config.PROFILE_FOLDER, summary)) as summary_file:
+                profiles.append(json.load(summary_file))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+def profile_path(name):
+    """Path of a capture's collapsed-stack file, or None for unknown/unsafe names"""
+    if not PROFILE_NAME.match(name):
+        return None
+    path = os.path.join(Config.PROFILE_FOLDER, f'{name}.folded')
+    return path if os.path.isfile(path) else None
+
+
+def init_profiler(app):
+    """Let admin sessions profile single requests"""
+    app.before_request(_start_request)
+    app.teardown_request(_finish_request)
@@ -0,0 +1,151 @@
+"""
+Query instrumentation
+Cursor classes that record every statement's fingerprint, duration and row
+count for the current request, log slow queries, flag N+1 suspects and report
+totals in a Server-Timing header outside production
+"""
+import re
+import time
+from collections import Counter
+from flask import g, request, current_app, has_app_context
+from MySQLdb.cursors import Cursor, SSCursor
+from config import Config
+
+_COMMENTS = re.compile(r'/\*.*?\*/|--[^\n]*|#[^\n]*', re.S)
+_STRINGS = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBERS = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_VALUE_LISTS = re.compile(r'(VALUES\s*\(\?\+\))(?:\s*,\s*\(\?\+\))+', re.I)
+_WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(query):
+    """
+    Normalize a statement so repeats with different values compare equal:
+    literals and %s become ?, IN lists and multi-row VALUES collapse.
+    """
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    query = _STRINGS.sub('?', query)
+    query = _COMMENTS.sub(' ', query)
+    query = query.replace('%s', '?')
+    query = _NUMBERS.sub('?', query)
+    query = _PLACEHOLDER_LISTS.sub('(?+)', query)
+    query = _VALUE_LISTS.sub(r'\1', query)
+    return _WHITESPACE.sub(' ', query).strip()
+
+
+class QueryStats:
+    """Statements issued while handling one request"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.queries = []  # (fingerprint, duration in seconds, rows)
+        self.counts = Counter()
+
+    def record(self, query, duration, rows):
+        query_fingerprint = fingerprint(query)
+        self.queries.append((query_fingerprint, duration, rows))
+        self.counts[query_fingerprint] += 1
+        return query_fingerprint
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_time(self):
+        return sum(duration for _, duration, _ in self.queries)
+
+    def n_plus_one_suspects(self, threshold=None):
+        """Fingerprints repeated at least `threshold` times, most repeated first"""
+        threshold = threshold or Config.N_PLUS_ONE_THRESHOLD
+        return [(query_fingerprint, count) for query_fingerprint, count in self.counts.most_common()
+                if count >= threshold]
+
+
+def get_request_query_stats():
+    """QueryStats of the current request, or None outside a request"""
+    return g.get('query_stats') if has_app_context() else None
+
+
+def _record(query, started_at, rows):
+    duration = time.perf_counter() - started_at
+    stats = get_request_query_stats()
+    if stats is None:
+        return
+    query_fingerprint = stats.record(query, duration, rows)
+    if duration * 1000 >= Config.SLOW_QUERY_MS:
+        current_app.logger.warning('Slow query (%.1f ms, %s rows): %s',
+                                   duration * 1000, rows, query_fingerprint)
+
+
+class InstrumentedCursorMixin:
+    """Times execute()/executemany() and records them in the request's QueryStats"""
+
+    _execute_calls = 0
+
+    def execute(self, query, args=None):
+        self._execute_calls += 1
+        started_at = time.perf_counter()
+        result = None
+        try:
+            result = super().execute(query, args)
+            return result
+        finally:
+            _record(query, started_at, self.rowcount if result is not None else 0)
+
+    def executemany(self, query, args):
+        calls_before = self._execute_calls
+        started_at = time.perf_counter()
+        result = None
+        try:
+            result = super().executemany(query, args)
+            return result
+        finally:
+            # Only multi-row INSERTs are sent as one statement; for anything else
+            # MySQLdb calls execute() per row, which has recorded each of them
+            if self._execute_calls == calls_before:
+                _record(query, started_at, self.rowcount if result is not None else 0)
+
+
+class InstrumentedCursor(InstrumentedCursorMixin, Cursor):
+    pass
+
+
+class InstrumentedSSCursor(InstrumentedCursorMixin, SSCursor):
+    """Unbuffered variant; durations cover execute() only, not the streamed fetches"""
+
+
+def _start_request():
+    g.query_stats = QueryStats()
+
+
+def _finish_request(response):
+    stats = g.get('query_stats')
+    if stats is None:
+        return response
+
+    for query_fingerprint, count in stats.n_plus_one_suspects():
+        current_app.logger.warning('Possible N+1 in %s %s: %d x %s',
+                                   request.method, request.path, count, query_fingerprint)
+
+    if Config.APP_ENV != 'production':
+        elapsed = (time.perf_counter() - stats.started_at) * 1000
+        timings = [
+            f'db;dur={stats.total_time * 1000:.1f};desc="{stats.count} queries"',
+            f'app;dur={elapsed:.1f}',
+        ]
+        suspects = len(stats.n_plus_one_suspects())
+        if suspects:
+            timings.append(f'n1;desc="{suspects} N+1 suspects"')
+        response.headers.add('Server-Timing', ', '.join(timings))
+    return response
+
+
+def init_query_stats(app):
+    """Collect QueryStats for every request of the app"""
+    if not Config.QUERY_STATS_ENABLED:
+        return
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
@@ -0,0 +1,101 @@
+"""
+Login rate limiting
+Token buckets keyed by client IP and by username, kept in a small SQLite
+database under RUNTIME_FOLDER so every worker process shares the same counts.
+A bucket holds up to `burst` attempts and refills at `per_minute` attempts per
+minute; an attempt against an empty bucket is rejected before any database
+or password hashing work is done.
+"""
+import os
+import random
+import sqlite3
+import threading
+import time
+from config import Config
+
+RATE_LIMIT_DB = os.path.join(Config.RUNTIME_FOLDER, 'ratelimit.sqlite3')
+IDLE_SECONDS = 3600  # Buckets untouched this long are full again and can be dropped
+
+_local = threading.local()
+
+
+def _connection():
+    """This thread's connection (reopened after a fork)"""
+    connection = getattr(_local, 'connection', None)
+    if connection is None or _local.pid != os.getpid():
+        os.makedirs(Config.RUNTIME_FOLDER, exist_ok=True)
+        connection = sqlite3.connect(RATE_LIMIT_DB, timeout=1, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=OFF')
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        _local.connection = connection
+        _local.pid = os.getpid()
+    return connection
+
+
+def take(key, burst, per_minute):
+    """
+    Take one token from the bucket for key.
+    Returns (allowed, retry_after_seconds). Fails open if the store is unavailable.
+    """
+    now = time.time()
+    rate = per_minute / 60.0
+    try:
+        connection = _connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT tokens, updated_at FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            connection.execute('INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)',
+                               (key, tokens, now))
+            if random.random() < 0.01:
+                connection.execute('DELETE FROM buckets WHERE updated_at < ?', (now - IDLE_SECONDS,))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+    except sqlite3.Error as e:
+        print(f"Rate limiter unavailable: {str(e)}")
+        return True, 0
+    if allowed:
+        return True, 0
+    return False, int((1 - tokens) / rate) + 1 if rate else IDLE_SECONDS
+
+
+def reset(key):
+    """Refill a bucket, e.g. a username's after a successful login"""
+    try:
+        _connection().execute('DELETE FROM buckets WHERE key = ?', (key,))
+    except sqlite3.Error:
+        pass
+
+
+def check_login_attempt(client_ip, username):
+    """
+    Charge a login attempt to the client IP and the username.
+    Returns (allowed, retry_after_seconds, scope) where scope is 'ip' or 'user' when rejected.
+    """
+    if not Config.LOGIN_RATE_LIMIT_ENABLED:
+        return True, 0, None
+    allowed, retry_after = take(f'ip:{client_ip}', Config.LOGIN_IP_BURST, Config.LOGIN_IP_PER_MINUTE)
+    if not allowed:
+        return False, retry_after, 'ip'
+    allowed, retry_after = take(f'user:{username.lower()}', Config.LOGIN_USER_BURST, Config.LOGIN_USER_PER_MINUTE)
+    if not allowed:
+        return False, retry_after, 'user'
+    return True, 0, None
+
+
+def login_succeeded(username):
+    """A correct password clears the username's bucket"""
+    if Config.LOGIN_RATE_LIMIT_ENABLED:
+        reset(f'user:{username.lower()}')
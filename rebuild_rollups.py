@@ -0,0 +1,62 @@
+"""
+Rebuild the attendance rollup tables from the attendance table
+Run once after applying migrations/002_attendance_rollups.sql, or any time the
+rollups need a backfill:
+
+    python rebuild_rollups.py                       # every month with attendance
+    python rebuild_rollups.py --from 2024-04 --to 2025-03
+"""
+import argparse
+from datetime import datetime
+from flask import Flask
+from config import Config
+from database import init_db, get_db
+from attendance_rollup import month_start, next_month, rebuild_month
+
+def rebuild_rollups(from_month=None, to_month=None):
+    """Rebuild rollups month by month, committing after each month"""
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    init_db(app)
+
+    with app.app_context():
+        try:
+            cursor = get_db()
+
+            if not from_month or not to_month:
+                cursor.execute("SELECT MIN(attendance_date), MAX(attendance_date) FROM attendance")
+                first_date, last_date = cursor.fetchone()
+                if not first_date:
+                    print("[INFO] No attendance rows found, nothing to rebuild.")
+                    return True
+                from_month = from_month or month_start(first_date)
+                to_month = to_month or month_start(last_date)
+
+            month = month_start(from_month)
+            while month <= month_start(to_month):
+                rebuild_month(cursor, month)
+                cursor.connection.commit()
+                print(f"[OK] Rebuilt rollups for {month.strftime('%Y-%m')}")
+                month = next_month(month)
+
+            print("\n[OK] Attendance rollups rebuilt successfully!")
+            return True
+
+        except Exception as e:
+            print(f"[ERROR] Error rebuilding rollups: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+def _parse_month(value):
+    return datetime.strptime(value, '%Y-%m').date()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebuild attendance rollup tables')
+    parser.add_argument('--from', dest='from_month', type=_parse_month, help='First month (YYYY-MM)')
+    parser.add_argument('--to', dest='to_month', type=_parse_month, help='Last month (YYYY-MM)')
+    args = parser.parse_args()
+
+    print("Rebuilding attendance rollups...")
+    print("-" * 50)
+    rebuild_rollups(args.from_month, args.to_month)
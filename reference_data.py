@@ -0,0 +1,66 @@
+"""
+Reference data cache
+Classes, sections, subjects and academic years used by forms and filters
+"""
+from cache import VersionedCache
+from config import Config
+from database import get_db
+
+reference_cache = VersionedCache('reference', ttl=Config.REFERENCE_CACHE_TTL)
+
+_QUERIES = {
+    'classes': "SELECT id, class_name FROM classes ORDER BY class_name",
+    'sections': "SELECT id, section_name, class_id FROM sections ORDER BY class_id, section_name",
+    'subjects': "SELECT id, subject_name, subject_code FROM subjects ORDER BY subject_name",
+    'academic_years': "SELECT id, year_name, is_current, start_date, end_date FROM academic_years ORDER BY start_date DESC",
+}
+
+
+def _load(name):
+    """Fetch one reference table from the primary (so a fresh write is never missed)"""
+    def loader():
+        cursor = get_db()
+        cursor.execute(_QUERIES[name])
+        return tuple(cursor.fetchall())
+    return reference_cache.get(name, loader)
+
+
+def get_classes():
+    """(id, class_name) rows ordered by name"""
+    return _load('classes')
+
+
+def get_sections():
+    """(id, section_name, class_id) rows ordered by class and name"""
+    return _load('sections')
+
+
+def get_subjects():
+    """(id, subject_name, subject_code) rows ordered by name"""
+    return _load('subjects')
+
+
+def get_academic_years():
+    """(id, year_name, is_current, start_date, end_date) rows, newest first"""
+    return _load('academic_years')
+
+
+def get_class_name(class_id, default='Unknown'):
+    """Look up a class name without a query"""
+    for row in get_classes():
+        if row[0] == class_id:
+            return row[1]
+    return default
+
+
+def get_section_name(section_id, default='Unknown'):
+    """Look up a section name without a query"""
+    for row in get_sections():
+        if row[0] == section_id:
+            return row[1]
+    return default
+
+
+def invalidate_reference_data():
+    """Call after any write to classes, sections, subjects or academic years"""
+    reference_cache.invalidate()
@@ -0,0 +1,184 @@
+"""
+Attendance report exports
+Streams report rows from a server-side cursor to CSV or XLSX responses, so
+exporting a whole academic year for the entire school runs in flat memory
+"""
+import csv
+import io
+import tempfile
+from flask import Response, stream_with_context
+import xlsxwriter
+from database import streaming_cursor
+from attendance_rollup import split_range
+from reference_data import get_class_name, get_section_name
+
+EXPORT_FORMATS = ('csv', 'xlsx')
+FETCH_SIZE = 1000
+CSV_FLUSH_ROWS = 500
+XLSX_CHUNK_SIZE = 64 * 1024
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def _stream_rows(query, params):
+    """Yield rows of a query in FETCH_SIZE batches from an unbuffered cursor"""
+    with streaming_cursor() as cursor:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            yield from rows
+
+
+def _percentage(present, total):
+    return round(present / total * 100, 2) if total else 0
+
+
+def _csv_chunks(header, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % CSV_FLUSH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _xlsx_chunks(header, rows, sheet_name):
+    """
+    XLSX is a zip archive, so it cannot be sent before it is complete.
+    XlsxWriter's constant_memory mode flushes each row to a temp file as it
+    is written; the finished workbook is then streamed from disk.
+    """
+    with tempfile.TemporaryFile() as spool:
+        workbook = xlsxwriter.Workbook(spool, {'constant_memory': True, 'default_date_format': 'yyyy-mm-dd'})
+        worksheet = workbook.add_worksheet(sheet_name[:31])
+        bold = workbook.add_format({'bold': True})
+        worksheet.write_row(0, 0, header, bold)
+        for row_number, row in enumerate(rows, 1):
+            worksheet.write_row(row_number, 0, row)
+        workbook.close()
+
+        spool.seek(0)
+        while True:
+            chunk = spool.read(XLSX_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def export_response(filename, header, rows, fmt, sheet_name='Report'):
+    """Streaming download of rows (any iterable, consumed lazily) as CSV or XLSX"""
+    if fmt == 'xlsx':
+        body = _xlsx_chunks(header, rows, sheet_name)
+        mimetype = XLSX_MIMETYPE
+    else:
+        body = _csv_chunks(header, rows)
+        mimetype = 'text/csv'
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}.{fmt}"'},
+    )
+
+
+DAILY_HEADER = ['Date', 'Class', 'Section', 'Total Students', 'Present', 'Absent',
+                'Late', 'Half Day', 'Attendance %']
+
+
+def daily_rows(start_date, end_date, class_id=None, section_id=None):
+    """Per-section daily totals from the daily rollup, one row per date and section"""
+    query = """
+        SELECT attendance_date, class_id, section_id,
+               MAX(present_count + absent_count + late_count + half_day_count),
+               SUM(present_count), SUM(absent_count), SUM(late_count), SUM(half_day_count)
+        FROM attendance_daily_section_summary
+        WHERE attendance_date BETWEEN %s AND %s
+    """
+    params = [start_date, end_date]
+    if class_id:
+        query += " AND class_id = %s"
+        params.append(class_id)
+    if section_id:
+        query += " AND section_id = %s"
+        params.append(section_id)
+    query += " GROUP BY attendance_date, class_id, section_id ORDER BY attendance_date, class_id, section_id"
+
+    for day, row_class_id, row_section_id, total, present, absent, late, half_day in _stream_rows(query, params):
+        yield [day, get_class_name(row_class_id), get_section_name(row_section_id), int(total),
+               int(present), int(absent), int(late), int(half_day), _percentage(present, total)]
+
+
+CLASS_WISE_HEADER = ['Class', 'Section', 'Admission No.', 'Student Name', 'Total Days', 'Present',
+                     'Absent', 'Late', 'Half Day', 'Attendance %']
+
+
+def class_wise_rows(start_date, end_date, class_id=None, section_id=None):
+    """
+    Per-student status totals for one section, one class or (with neither)
+    the whole school. Whole months are read from the monthly rollup and only
+    the partial edge months from raw attendance; MySQL does the aggregation.
+    """
+    months, edges = split_range(start_date, end_date)
+    filters = ""
+    filter_params = []
+    if class_id:
+        filters += " AND class_id = %s"
+        filter_params.append(class_id)
+    if section_id:
+        filters += " AND section_id = %s"
+        filter_params.append(section_id)
+
+    parts = []
+    params = []
+    if months:
+        parts.append("""
+            SELECT student_id, class_id, section_id, present_count AS present, absent_count AS absent,
+                   late_count AS late, half_day_count AS half_day
+            FROM attendance_monthly_summary
+            WHERE month_start BETWEEN %s AND %s""" + filters)
+        params += [*months, *filter_params]
+    for edge_start, edge_end in edges:
+        parts.append("""
+            SELECT student_id, class_id, section_id, status = 'present', status = 'absent',
+                   status = 'late', status = 'half_day'
+            FROM attendance
+            WHERE attendance_date BETWEEN %s AND %s""" + filters)
+        params += [edge_start, edge_end, *filter_params]
+    if not parts:
+        return
+
+    query = """
+        SELECT x.class_id, x.section_id, s.admission_number, s.first_name, s.last_name,
+               SUM(x.present), SUM(x.absent), SUM(x.late), SUM(x.half_day)
+        FROM (""" + " UNION ALL ".join(parts) + """) x
+        JOIN students s ON s.id = x.student_id
+        GROUP BY x.class_id, x.section_id, x.student_id, s.admission_number, s.first_name, s.last_name
+        ORDER BY x.class_id, x.section_id, s.first_name, s.last_name
+    """
+    for row_class_id, row_section_id, admission_number, first_name, last_name, *counts in _stream_rows(query, params):
+        present, absent, late, half_day = (int(count or 0) for count in counts)
+        total = present + absent + late + half_day
+        yield [get_class_name(row_class_id), get_section_name(row_section_id), admission_number,
+               f'{first_name} {last_name}', total, present, absent, late, half_day,
+               _percentage(present, total)]
+
+
+STUDENT_HEADER = ['Date', 'Subject', 'Status', 'Remarks']
+
+
+def student_rows(student_id, start_date, end_date):
+    """Every attendance record of one student in the range, oldest first"""
+    query = """
+        SELECT a.attendance_date, s.subject_name, a.status, a.remarks
+        FROM attendance a
+        LEFT JOIN subjects s ON a.subject_id = s.id
+        WHERE a.student_id = %s AND a.attendance_date BETWEEN %s AND %s
+        ORDER BY a.attendance_date
+    """
+    for day, subject_name, status, remarks in _stream_rows(query, (student_id, start_date, end_date)):
+        yield [day, subject_name or 'General', status.replace('_', ' ').title(), remarks or '']
@@ -0,0 +1,30 @@
+"""
+Upload directory layout
+Uploaded files are fanned out over hash-prefixed subdirectories
+(uploads/notes/3f/a2/<name>) instead of one flat folder, so no directory grows
+beyond a few hundred entries however many files there are. The subdirectory
+comes from a hash of the file name alone, so a stored path can always be
+recomputed from its name. migrate_storage.py moves files saved in the flat
+layout.
+"""
+import hashlib
+import os
+from config import Config
+
+
+def shard_path(folder, filename):
+    """Where filename lives under folder: UPLOAD_SHARD_DEPTH levels of two hex digits"""
+    digest = hashlib.sha1(filename.encode()).hexdigest()
+    levels = [digest[2 * level:2 * level + 2] for level in range(Config.UPLOAD_SHARD_DEPTH)]
+    return os.path.join(folder, *levels, filename)
+
+
+def is_sharded(folder, path):
+    return os.path.normpath(path) == os.path.normpath(shard_path(folder, os.path.basename(path)))
+
+
+def new_file_path(folder, filename):
+    """shard_path, with its directory created"""
+    path = shard_path(folder, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
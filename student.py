@@ -2,9 +2,16 @@
 Student Blueprint
 Handles student operations: CRUD, admission, photo upload, search
 """
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, session, abort, jsonify
 from database import get_db
-from utils import require_login, require_role, secure_file_save, delete_file, hash_password
+from reference_data import get_classes, get_sections, get_class_name
+from pagination import fetch_page
+from student_search import search_students, student_changed, MAX_RESULTS, MIN_QUERY_LENGTH
+from academic_years import get_current_academic_year_id
+from admission import allocate_admission_number, peek_admission_numbers
+from student_import import (start_import_job, list_import_jobs, import_result_path, IMPORT_COLUMNS,
+                            StudentImportError)
+from utils import require_login, require_role, secure_file_save, delete_file, hash_password, get_current_user, invalidate_principals
 from config import Config
 from datetime import datetime
 import os
@@ -17,7 +24,7 @@ student_bp = Blueprint('student', __name__, url_prefix='/student')
 def dashboard():
     """Student dashboard"""
     try:
-        user_id = session.get('user_id')
+        student_id = get_current_user()['student_id']
         cursor = get_db()
         
         # Get student info
@@ -27,21 +34,21 @@ def dashboard():
             FROM students s
             LEFT JOIN classes c ON s.class_id = c.id
             LEFT JOIN sections sec ON s.section_id = sec.id
-            WHERE s.user_id = %s
-        """, (user_id,))
+            WHERE s.id = %s
+        """, (student_id,))
         student = cursor.fetchone()
         
         if not student:
             flash('Student profile not found.', 'danger')
             return redirect(url_for('auth.logout'))
         
-        # Get attendance statistics
+        # Get attendance statistics (one rollup row per month)
         cursor.execute("""
             SELECT 
-                COUNT(*) as total_days,
-                SUM(CASE WHEN status = 'present' THEN 1 ELSE 0 END) as present_days,
-                SUM(CASE WHEN status = 'absent' THEN 1 ELSE 0 END) as absent_days
-            FROM attendance
+                COALESCE(SUM(present_count + absent_count + late_count + half_day_count), 0) as total_days,
+                COALESCE(SUM(present_count), 0) as present_days,
+                COALESCE(SUM(absent_count), 0) as absent_days
+            FROM attendance_monthly_summary
             WHERE student_id = %s
         """, (student[0],))
         attendance_stats = cursor.fetchone()
@@ -87,7 +94,7 @@ def list_students():
         
         query = """
             SELECT s.id, s.admission_number, s.first_name, s.last_name, s.phone, s.email,
-                   c.class_name, sec.section_name, s.is_active
+                   c.class_name, sec.section_name, s.is_active, s.created_at
             FROM students s
             LEFT JOIN classes c ON s.class_id = c.id
             LEFT JOIN sections sec ON s.section_id = sec.id
@@ -99,22 +106,32 @@ def list_students():
             query += " AND s.class_id = %s"
             params.append(class_id)
         
-        if search:
-            query += " AND (s.first_name LIKE %s OR s.last_name LIKE %s OR s.admission_number LIKE %s)"
-            search_param = f"%{search}%"
-            params.extend([search_param, search_param, search_param])
-        
-        query += " ORDER BY s.created_at DESC"
-        
-        cursor.execute(query, params)
-        students_list = cursor.fetchall()
+        matches = search_students(search, MAX_RESULTS, class_id) if search else None
+        if matches is not None:
+            # Ranked matches from the search index, shown best first without paging
+            page = None
+            matches = [match['id'] for match in matches]
+            students_list = []
+            if matches:
+                query += f" AND s.id IN ({', '.join(['%s'] * len(matches))})"
+                cursor.execute(query, params + matches)
+                rows = {row[0]: row for row in cursor.fetchall()}
+                students_list = [rows[student_id] for student_id in matches if student_id in rows]
+        else:
+            if search:
+                # Search index still being built in this worker
+                query += " AND (s.first_name LIKE %s OR s.last_name LIKE %s OR s.admission_number LIKE %s)"
+                search_param = f"%{search}%"
+                params.extend([search_param, search_param, search_param])
+            page = fetch_page(cursor, query, params, 's.created_at', 's.id', sort_index=9, id_index=0)
+            students_list = page.rows
         
         # Get classes for filter
-        cursor.execute("SELECT id, class_name FROM classes ORDER BY class_name")
-        classes_list = cursor.fetchall()
+        classes_list = get_classes()
         
         return render_template('student/list.html',
                              students=students_list,
+                             page=page,
                              classes=classes_list,
                              selected_class=class_id,
                              search_query=search)
@@ -122,6 +139,41 @@ def list_students():
         flash(f'Error loading students: {str(e)}', 'danger')
         return render_template('student/list.html', students=[], classes=[])
 
+def _like_search(query, limit, class_id=None):
+    """Plain LIKE search in the shape search_students returns, for while the index is built"""
+    if len(query) < MIN_QUERY_LENGTH:
+        return []
+    sql = """
+        SELECT id, admission_number, first_name, last_name, class_id, is_active FROM students
+        WHERE (first_name LIKE %s OR last_name LIKE %s OR admission_number LIKE %s)
+    """
+    search_param = f"%{query}%"
+    params = [search_param, search_param, search_param]
+    if class_id:
+        sql += " AND class_id = %s"
+        params.append(class_id)
+    sql += " ORDER BY is_active DESC, last_name, first_name LIMIT %s"
+    cursor = get_db(readonly=True)
+    cursor.execute(sql, params + [limit])
+    return [{'id': row[0], 'admission_number': row[1], 'first_name': row[2], 'last_name': row[3],
+             'class_id': row[4], 'is_active': bool(row[5])} for row in cursor.fetchall()]
+
+@student_bp.route('/search')
+@require_login
+@require_role('admin', 'teacher')
+def search():
+    """Typeahead: best matching students for ?q= as JSON"""
+    query = request.args.get('q', '').strip()
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    class_id = request.args.get('class_id', type=int)
+    results = search_students(query, limit, class_id)
+    if results is None:
+        results = _like_search(query, limit, class_id)  # Search index still being built
+    for student in results:
+        student['class_name'] = get_class_name(student['class_id'], None) if student['class_id'] else None
+        student['url'] = url_for('student.edit_student', student_id=student['id'])
+    return jsonify({'query': query, 'results': results})
+
 @student_bp.route('/add', methods=['GET', 'POST'])
 @require_login
 @require_role('admin', 'teacher')
@@ -151,15 +203,28 @@ def add_student():
         try:
             cursor = get_db()
             
-            # Generate unique admission number
-            year = datetime.now().year
-            cursor.execute("SELECT COUNT(*) FROM students WHERE admission_number LIKE %s", (f'ADM{year}%',))
-            count = cursor.fetchone()[0]
-            admission_number = f'ADM{year}{str(count + 1).zfill(4)}'
+            # Handle photo upload (before the admission number row lock is taken)
+            photo_path = None
+            if photo and photo.filename:
+                success, file_path, error = secure_file_save(photo, Config.STUDENT_PHOTOS_FOLDER)
+                if success:
+                    photo_path = file_path
+                else:
+                    flash(f'Photo upload failed: {error}', 'warning')
+            
+            # Default password is the admission number. Hash the number this admission
+            # should get before taking the sequence row lock, so other admissions never
+            # wait behind the hash; re-hash only if another admission took it meanwhile.
+            expected_number = peek_admission_numbers(cursor)[0]
+            password = hash_password(expected_number)
+            
+            # Reserve the next admission number (held until commit/rollback)
+            admission_number = allocate_admission_number(cursor)
+            if admission_number != expected_number:
+                password = hash_password(admission_number)
             
             # Create user account for student
             username = admission_number.lower()
-            password = hash_password(admission_number)  # Default password is admission number
             
             cursor.execute(
                 "INSERT INTO users (username, email, password_hash, role) VALUES (%s, %s, %s, %s)",
@@ -167,19 +232,8 @@ def add_student():
             )
             user_id = cursor.lastrowid
             
-            # Handle photo upload
-            photo_path = None
-            if photo and photo.filename:
-                success, file_path, error = secure_file_save(photo, Config.STUDENT_PHOTOS_FOLDER)
-                if success:
-                    photo_path = file_path
-                else:
-                    flash(f'Photo upload failed: {error}', 'warning')
-            
             # Get current academic year
-            cursor.execute("SELECT id FROM academic_years WHERE is_current = TRUE LIMIT 1")
-            academic_year = cursor.fetchone()
-            academic_year_id = academic_year[0] if academic_year else None
+            academic_year_id = get_current_academic_year_id()
             
             # Create student record
             cursor.execute("""
@@ -192,8 +246,10 @@ def add_student():
                   phone or None, email or None, address or None, parent_name or None,
                   parent_phone or None, parent_email or None, class_id or None, section_id or None,
                   academic_year_id, photo_path, admission_date))
+            student_id = cursor.lastrowid
             
             cursor.connection.commit()
+            student_changed(student_id)
             flash(f'Student added successfully! Admission Number: {admission_number}', 'success')
             return redirect(url_for('student.list_students'))
         
@@ -204,18 +260,46 @@ def add_student():
     
     # GET request - show form
     try:
-        cursor = get_db()
-        cursor.execute("SELECT id, class_name FROM classes ORDER BY class_name")
-        classes_list = cursor.fetchall()
-        
-        cursor.execute("SELECT id, section_name, class_id FROM sections ORDER BY class_id, section_name")
-        sections_list = cursor.fetchall()
+        classes_list = get_classes()
+        sections_list = get_sections()
         
         return render_template('student/add.html', classes=classes_list, sections=sections_list)
     except Exception as e:
         flash(f'Error loading form: {str(e)}', 'danger')
         return render_template('student/add.html', classes=[], sections=[])
 
+@student_bp.route('/import', methods=['GET', 'POST'])
+@require_login
+@require_role('admin')
+def import_students():
+    """Bulk admission from a CSV/XLSX file, imported in the background"""
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Choose a CSV or XLSX file to import.', 'danger')
+            return redirect(url_for('student.import_students'))
+        try:
+            start_import_job(upload, session.get('username'))
+            flash('Import started. Refresh this page to follow its progress.', 'success')
+        except StudentImportError as e:
+            flash(str(e), 'danger')
+        except Exception as e:
+            flash(f'Error starting import: {str(e)}', 'danger')
+        return redirect(url_for('student.import_students'))
+    
+    return render_template('student/import.html', jobs=list_import_jobs(), columns=IMPORT_COLUMNS)
+
+@student_bp.route('/import/<job_id>/results')
+@require_login
+@require_role('admin')
+def import_results(job_id):
+    """Download the per-row result file of an import"""
+    path = import_result_path(job_id)
+    if path is None:
+        abort(404)
+    return send_file(os.path.abspath(path), as_attachment=True, download_name=f'student-import-{job_id}.csv',
+                     mimetype='text/csv')
+
 @student_bp.route('/edit/<int:student_id>', methods=['GET', 'POST'])
 @require_login
 @require_role('admin', 'teacher')
@@ -292,6 +376,8 @@ def edit_student(student_id):
                       is_active, student_id))
             
             cursor.connection.commit()
+            invalidate_principals()
+            student_changed(student_id)
             flash('Student updated successfully!', 'success')
             return redirect(url_for('student.list_students'))
         
@@ -305,11 +391,8 @@ def edit_student(student_id):
             flash('Student not found.', 'danger')
             return redirect(url_for('student.list_students'))
         
-        cursor.execute("SELECT id, class_name FROM classes ORDER BY class_name")
-        classes_list = cursor.fetchall()
-        
-        cursor.execute("SELECT id, section_name, class_id FROM sections ORDER BY class_id, section_name")
-        sections_list = cursor.fetchall()
+        classes_list = get_classes()
+        sections_list = get_sections()
         
         return render_template('student/edit.html', student=student, classes=classes_list, sections=sections_list)
     
@@ -336,6 +419,8 @@ def delete_student(student_id):
             # Delete student (cascades to user via foreign key)
             cursor.execute("DELETE FROM students WHERE id = %s", (student_id,))
             cursor.connection.commit()
+            invalidate_principals()
+            student_changed(student_id)
             flash('Student deleted successfully!', 'success')
         else:
             flash('Student not found.', 'danger')
@@ -0,0 +1,391 @@
+"""
+Bulk student admission import
+Reads a CSV or XLSX file of students in one streaming pass: each row is
+validated as it is read, valid rows are admitted in batches (default passwords
+hashed across a process pool, then one block of admission numbers and
+multi-row users/students inserts in one transaction), and every input row gets
+a line in the result CSV saying what happened to it.
+
+Used by the /student/import page (as a background job) and import_students.py.
+"""
+import csv
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import date, datetime
+import MySQLdb
+from config import Config
+from database import connect
+from academic_years import get_current_academic_year_id
+from admission import allocate_admission_numbers, peek_admission_numbers
+from utils import bulk_hash_pool, hash_passwords
+from student_search import student_changed
+
+IMPORT_FORMATS = ('csv', 'xlsx')
+IMPORT_COLUMNS = ('first_name', 'last_name', 'date_of_birth', 'gender', 'phone', 'email', 'address',
+                  'parent_name', 'parent_phone', 'parent_email', 'class', 'section', 'admission_date')
+RESULT_HEADER = ['Row', 'Status', 'Admission Number', 'Username', 'Message']
+GENDERS = {'m': 'male', 'male': 'male', 'f': 'female', 'female': 'female', 'o': 'other', 'other': 'other'}
+EMAIL = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+JOB_ID = re.compile(r'^[\w-]+$')
+
+
+class StudentImportError(Exception):
+    """An upload that cannot be imported at all (wrong file type)"""
+
+
+def _column(name):
+    return re.sub(r'[^a-z0-9]+', '_', str(name or '').strip().lower()).strip('_')
+
+
+def _read_csv(path):
+    with open(path, newline='', encoding='utf-8-sig') as csv_file:
+        reader = csv.reader(csv_file)
+        header = [_column(name) for name in next(reader, [])]
+        for row_number, values in enumerate(reader, start=2):
+            if any(value.strip() for value in values):
+                yield row_number, dict(zip(header, values))
+
+
+def _read_xlsx(path):
+    from openpyxl import load_workbook  # Only needed for XLSX uploads
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [_column(name) for name in next(rows, ())]
+        for row_number, values in enumerate(rows, start=2):
+            if any(value not in (None, '') for value in values):
+                yield row_number, dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def read_rows(path):
+    """(row number, {column: value}) for every non-empty data row"""
+    if path.lower().endswith('.xlsx'):
+        return _read_xlsx(path)
+    return _read_csv(path)
+
+
+def _text(row, column, max_length=None):
+    value = row.get(column)
+    if value is None:
+        return ''
+    value = str(value).strip()
+    if max_length and len(value) > max_length:
+        raise ValueError(f'{column} is longer than {max_length} characters')
+    return value
+
+
+def _date(row, column):
+    value = row.get(column)
+    if value in (None, ''):
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(str(value).strip(), '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f'{column} must be YYYY-MM-DD')
+
+
+class RowValidator:
+    """Validates rows one at a time against classes/sections loaded once"""
+
+    def __init__(self, cursor, academic_year_id):
+        cursor.execute("SELECT id, class_name, class_code FROM classes")
+        self.classes = {}
+        for class_id, class_name, class_code in cursor.fetchall():
+            for key in (class_name, class_code):
+                if key:
+                    self.classes.setdefault(key.strip().lower(), set()).add(class_id)
+        cursor.execute("SELECT id, section_name, class_id FROM sections")
+        self.sections = {}
+        for section_id, section_name, class_id in cursor.fetchall():
+            self.sections.setdefault((class_id, section_name.strip().lower()), section_id)
+        self.academic_year_id = academic_year_id
+        self.emails = set()
+
+    def validate(self, row):
+        """Student values ready for insertion; raises ValueError with a readable message"""
+        first_name = _text(row, 'first_name', 100)
+        last_name = _text(row, 'last_name', 100)
+        if not first_name or not last_name:
+            raise ValueError('first_name and last_name are required')
+
+        gender = _text(row, 'gender').lower()
+        if gender and gender not in GENDERS:
+            raise ValueError('gender must be male, female or other')
+
+        email = _text(row, 'email', 255).lower()
+        for column in ('email', 'parent_email'):
+            value = _text(row, column, 255)
+            if value and not EMAIL.match(value):
+                raise ValueError(f'{column} is not a valid email address')
+        if email:
+            if email in self.emails:
+                raise ValueError('email appears more than once in this file')
+            self.emails.add(email)
+
+        class_id = section_id = None
+        class_name = _text(row, 'class').lower()
+        section_name = _text(row, 'section').lower()
+        if class_name:
+            class_ids = self.classes.get(class_name)
+            if not class_ids:
+                raise ValueError(f'unknown class "{_text(row, "class")}"')
+            if len(class_ids) > 1:
+                raise ValueError(f'class "{_text(row, "class")}" is ambiguous, use its class code')
+            class_id = next(iter(class_ids))
+            if section_name:
+                section_id = self.sections.get((class_id, section_name))
+                if section_id is None:
+                    raise ValueError(f'class has no section "{_text(row, "section")}"')
+        elif section_name:
+            raise ValueError('section given without a class')
+
+        return {
+            'first_name': first_name,
+            'last_name': last_name,
+            'date_of_birth': _date(row, 'date_of_birth'),
+            'gender': GENDERS.get(gender),
+            'phone': _text(row, 'phone', 20) or None,
+            'email': email or None,
+            'address': _text(row, 'address') or None,
+            'parent_name': _text(row, 'parent_name', 200) or None,
+            'parent_phone': _text(row, 'parent_phone', 20) or None,
+            'parent_email': _text(row, 'parent_email', 255) or None,
+            'class_id': class_id,
+            'section_id': section_id,
+            'academic_year_id': self.academic_year_id,
+            'admission_date': _date(row, 'admission_date') or date.today(),
+        }
+
+
+def _insert_students(cursor, students):
+    """Multi-row insert of users and students for already numbered and hashed rows"""
+    cursor.executemany(
+        "INSERT INTO users (username, email, password_hash, role) VALUES (%s, %s, %s, 'student')",
+        [(s['username'], s['email'] or f"{s['username']}@school.com", s['password_hash']) for s in students]
+    )
+    usernames = [s['username'] for s in students]
+    cursor.execute(f"SELECT username, id FROM users WHERE username IN ({', '.join(['%s'] * len(usernames))})",
+                   usernames)
+    user_ids = dict(cursor.fetchall())
+    cursor.executemany("""
+        INSERT INTO students
+        (user_id, admission_number, first_name, last_name, date_of_birth, gender,
+         phone, email, address, parent_name, parent_phone, parent_email,
+         class_id, section_id, academic_year_id, admission_date)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, [(user_ids[s['username']], s['admission_number'], s['first_name'], s['last_name'],
+           s['date_of_birth'], s['gender'], s['phone'], s['email'], s['address'], s['parent_name'],
+           s['parent_phone'], s['parent_email'], s['class_id'], s['section_id'], s['academic_year_id'],
+           s['admission_date']) for s in students])
+
+
+def _admit_batch(connection, pool, batch):
+    """
+    Admit a batch of (row number, student) pairs; returns {row number: (status, message)}.
+    Admission numbers are allocated in the transaction that inserts the rows, so a
+    rejected row or a crash hands its number back. The default password is the
+    admission number, and hashing is too slow to do while holding the sequence
+    row, so the numbers the batch will get are hashed first; only numbers that
+    another admission took in the meantime are hashed under the lock.
+    A batch that fails is retried row by row to pinpoint the bad rows.
+    """
+    cursor = connection.cursor()
+    expected = peek_admission_numbers(cursor, len(batch))
+    connection.commit()
+    hashes = dict(zip(expected, hash_passwords(pool, expected)))
+
+    def admit(rows):
+        numbers = allocate_admission_numbers(cursor, len(rows))
+        missing = [number for number in numbers if number not in hashes]
+        if missing:
+            hashes.update(zip(missing, hash_passwords(pool, missing)))
+        for (_, student), admission_number in zip(rows, numbers):
+            student.update(admission_number=admission_number, username=admission_number.lower(),
+                           password_hash=hashes[admission_number])
+        _insert_students(cursor, [student for _, student in rows])
+        connection.commit()
+
+    try:
+        admit(batch)
+        results = {row_number: ('imported', '') for row_number, _ in batch}
+    except MySQLdb.Error:
+        connection.rollback()
+        results = {}
+        for row_number, student in batch:
+            try:
+                admit([(row_number, student)])
+                results[row_number] = ('imported', '')
+            except MySQLdb.Error as e:
+                connection.rollback()
+                student['admission_number'] = student['username'] = ''
+                results[row_number] = ('error', f'database rejected the row: {e.args[-1] if e.args else e}')
+
+    admitted = [student['admission_number'] for _, student in batch if student['admission_number']]
+    if admitted:
+        cursor.execute(f"SELECT id FROM students WHERE admission_number IN ({', '.join(['%s'] * len(admitted))})",
+                       admitted)
+        student_changed(*[row[0] for row in cursor.fetchall()])
+    return results
+
+
+def import_students(path, result_path, academic_year_id, batch_size=None, workers=None, progress=None):
+    """
+    Import the students in path into academic_year_id, writing one result line
+    per row to result_path. progress(summary) is called after every batch.
+    Returns the final summary.
+    """
+    batch_size = batch_size or Config.IMPORT_BATCH_SIZE
+    summary = {'rows': 0, 'imported': 0, 'failed': 0, 'seconds': 0.0, 'rate': 0.0}
+    started_at = time.perf_counter()
+    connection = connect()
+    pool = bulk_hash_pool(workers or Config.IMPORT_HASH_WORKERS)
+    try:
+        validator = RowValidator(connection.cursor(), academic_year_id)
+        with open(result_path, 'w', newline='') as result_file:
+            writer = csv.writer(result_file)
+            writer.writerow(RESULT_HEADER)
+            pending = []  # Rows read since the last batch, valid or not, in file order
+            batch = []
+
+            def flush():
+                results = _admit_batch(connection, pool, batch) if batch else {}
+                students = dict(batch)
+                for row_number, error in pending:
+                    status, message = ('error', error) if error else results[row_number]
+                    student = students.get(row_number, {})
+                    writer.writerow([row_number, status, student.get('admission_number', ''),
+                                     student.get('username', ''), message])
+                    summary['imported' if status == 'imported' else 'failed'] += 1
+                result_file.flush()
+                pending.clear()
+                batch.clear()
+                summary['seconds'] = round(time.perf_counter() - started_at, 2)
+                summary['rate'] = round(summary['imported'] / summary['seconds'], 1) if summary['seconds'] else 0.0
+                if progress:
+                    progress(dict(summary))
+
+            for row_number, row in read_rows(path):
+                summary['rows'] += 1
+                try:
+                    batch.append((row_number, validator.validate(row)))
+                    pending.append((row_number, None))
+                except ValueError as e:
+                    pending.append((row_number, str(e)))
+                if len(batch) >= batch_size or len(pending) >= batch_size * 4:
+                    flush()
+            flush()
+    finally:
+        pool.shutdown()
+        connection.close()
+    return summary
+
+
+# ---------------------------------------------------------------------------
+# Background jobs for the web upload (state lives in IMPORT_FOLDER)
+# ---------------------------------------------------------------------------
+
+def _job_path(job_id, suffix):
+    return os.path.join(Config.IMPORT_FOLDER, f'{job_id}{suffix}')
+
+
+def _write_status(job_id, status):
+    tmp_path = _job_path(job_id, f'.json.{uuid.uuid4().hex}')
+    with open(tmp_path, 'w') as status_file:
+        json.dump(status, status_file)
+    os.replace(tmp_path, _job_path(job_id, '.json'))
+
+
+def _run_job(job_id, upload_path, academic_year_id, status):
+    def progress(summary):
+        status.update(summary)
+        _write_status(job_id, status)
+
+    try:
+        progress(import_students(upload_path, _job_path(job_id, '.results.csv'), academic_year_id,
+                                 progress=progress))
+        status['state'] = 'done'
+    except Exception as e:
+        status.update(state='failed', error=str(e))
+        print(f"Student import {job_id} failed: {str(e)}")
+    finally:
+        status['finished_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        _write_status(job_id, status)
+        os.remove(upload_path)  # The upload holds personal data; the results file is enough
+
+
+def start_import_job(upload, started_by):
+    """
+    Save an uploaded CSV/XLSX and import it into the current academic year on
+    a background thread; returns the job id
+    """
+    extension = upload.filename.rsplit('.', 1)[-1].lower() if '.' in upload.filename else ''
+    if extension not in IMPORT_FORMATS:
+        raise StudentImportError('Upload a .csv or .xlsx file.')
+    os.makedirs(Config.IMPORT_FOLDER, exist_ok=True)
+    job_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    upload_path = _job_path(job_id, f'.upload.{extension}')
+    upload.save(upload_path)
+    status = {
+        'id': job_id,
+        'filename': upload.filename,
+        'started_by': started_by,
+        'started_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'pid': os.getpid(),
+        'state': 'running',
+        'rows': 0, 'imported': 0, 'failed': 0, 'seconds': 0.0, 'rate': 0.0,
+    }
+    _write_status(job_id, status)
+    # Resolved here, in the request: the import thread has no app context
+    academic_year_id = get_current_academic_year_id()
+    threading.Thread(target=_run_job, args=(job_id, upload_path, academic_year_id, status),
+                     name=f'student-import-{job_id}', daemon=True).start()
+    return job_id
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def list_import_jobs(limit=20):
+    """Recent import jobs, newest first"""
+    if not os.path.isdir(Config.IMPORT_FOLDER):
+        return []
+    jobs = []
+    for name in sorted(os.listdir(Config.IMPORT_FOLDER), reverse=True):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(Config.IMPORT_FOLDER, name)) as status_file:
+                job = json.load(status_file)
+        except (OSError, ValueError):
+            continue
+        if job['state'] == 'running' and not _process_alive(job['pid']):
+            job['state'] = 'interrupted'  # The worker running it was restarted
+        jobs.append(job)
+        if len(jobs) >= limit:
+            break
+    return jobs
+
+
+def import_result_path(job_id):
+    """Path of a job's result CSV, or None for unknown/unsafe ids"""
+    if not JOB_ID.match(job_id):
+        return None
+    path = _job_path(job_id, '.results.csv')
+    return path if os.path.isfile(path) else None
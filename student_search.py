@@ -0,0 +1,229 @@
+"""
+Student search index
+An in-process trigram index over student names and admission numbers, so
+search boxes never run leading-wildcard LIKE scans. Each worker builds the
+index in a background thread, started by its first search, and keeps it
+current from a shared change journal: writers append the ids of students they
+added, edited or deleted to SEARCH_FOLDER/students.journal, and every worker
+re-reads just those students before its next search (one stat call when
+nothing changed). Until the index is built, and while it is rebuilt after the
+journal is rotated, search_students returns None and callers search with SQL.
+"""
+import os
+import re
+import threading
+import unicodedata
+from config import Config
+from database import get_db, streaming_cursor
+
+JOURNAL_PATH = os.path.join(Config.SEARCH_FOLDER, 'students.journal')
+JOURNAL_MAX_BYTES = 4 * 1024 * 1024  # Rotated (forcing a rebuild everywhere) beyond this size
+MIN_QUERY_LENGTH = 2
+MAX_RESULTS = 100  # Ranked matches shown on the students page
+STUDENT_COLUMNS = "id, admission_number, first_name, last_name, class_id, is_active"
+
+# Score per query term by where it matched; an exact admission number wins outright
+EXACT_ADMISSION, EXACT_NAME, PREFIX, SUBSTRING = 100, 50, 30, 10
+
+
+def normalize(text):
+    """Lowercase ASCII-folded alphanumeric tokens"""
+    text = unicodedata.normalize('NFKD', str(text or '')).encode('ascii', 'ignore').decode().lower()
+    return re.findall(r'[a-z0-9]+', text)
+
+
+def _grams(token):
+    """Trigrams of ^token; the ^ marks the start so 2-letter prefixes are indexed too"""
+    padded = f'^{token}'
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class StudentIndex:
+    """Trigram -> student ids, plus the searchable fields of every student"""
+
+    def __init__(self):
+        self.docs = {}    # id -> (admission_number, first_name, last_name, class_id, is_active,
+                          #       admission tokens, name tokens)
+        self.grams = {}   # trigram -> set of ids
+        self.lock = threading.Lock()
+        self.built = False
+        self.journal_inode = None
+        self.journal_offset = 0
+        self.builder = None
+
+    def _add(self, row):
+        student_id, admission_number, first_name, last_name, class_id, is_active = row
+        name_tokens = normalize(first_name) + normalize(last_name)
+        admission_tokens = normalize(admission_number)
+        self.docs[student_id] = (admission_number, first_name, last_name, class_id, bool(is_active),
+                                 admission_tokens, name_tokens)
+        for token in admission_tokens + name_tokens:
+            for gram in _grams(token):
+                self.grams.setdefault(gram, set()).add(student_id)
+
+    def _remove(self, student_id):
+        doc = self.docs.pop(student_id, None)
+        if doc is None:
+            return
+        for token in doc[5] + doc[6]:
+            for gram in _grams(token):
+                ids = self.grams.get(gram)
+                if ids is not None:
+                    ids.discard(student_id)
+                    if not ids:
+                        del self.grams[gram]
+
+    def rebuild(self):
+        self.docs = {}
+        self.grams = {}
+        with streaming_cursor(readonly=False) as cursor:
+            cursor.execute(f"SELECT {STUDENT_COLUMNS} FROM students")
+            while True:
+                rows = cursor.fetchmany(1000)
+                if not rows:
+                    break
+                for row in rows:
+                    self._add(row)
+
+    def refresh(self, student_ids):
+        """Re-read changed students; ids no longer in the table are dropped"""
+        student_ids = list(student_ids)
+        cursor = get_db()
+        for start in range(0, len(student_ids), 1000):
+            chunk = student_ids[start:start + 1000]
+            cursor.execute(f"SELECT {STUDENT_COLUMNS} FROM students WHERE id IN ({', '.join(['%s'] * len(chunk))})",
+                           chunk)
+            rows = {row[0]: row for row in cursor.fetchall()}
+            for student_id in chunk:
+                self._remove(student_id)
+                if student_id in rows:
+                    self._add(rows[student_id])
+
+    def _build(self, inode, size):
+        """Background thread: load every student into a new index, then swap it in"""
+        fresh = StudentIndex()
+        try:
+            fresh.rebuild()
+        except Exception as e:
+            print(f"Student search index build failed: {str(e)}")  # The next search tries again
+            return
+        with self.lock:
+            self.docs, self.grams = fresh.docs, fresh.grams
+            # Entries written since the build started are replayed, so nothing is missed
+            self.journal_inode, self.journal_offset = inode, size
+            self.built = True
+
+    def _start_build(self, inode, size):
+        if self.builder is not None and self.builder.is_alive() and self.builder.pid == os.getpid():
+            return
+        self.builder = threading.Thread(target=self._build, args=(inode, size),
+                                        name='student-index-build', daemon=True)
+        self.builder.pid = os.getpid()
+        self.builder.start()
+
+    def sync(self):
+        """
+        Catch up with the journal: replay new entries, or start a background
+        rebuild after a rotation. False until the index is usable.
+        """
+        try:
+            stat = os.stat(JOURNAL_PATH)
+            inode, size = stat.st_ino, stat.st_size
+        except FileNotFoundError:
+            inode, size = None, 0
+        if self.built and inode == self.journal_inode and size == self.journal_offset:
+            return True
+        if not self.built or inode != self.journal_inode or size < self.journal_offset:
+            self.built = False
+            self._start_build(inode, size)
+            return False
+        with open(JOURNAL_PATH, 'rb') as journal:
+            journal.seek(self.journal_offset)
+            data = journal.read(size - self.journal_offset)
+        complete = data[:data.rfind(b'\n') + 1]  # A line still being appended is read next time
+        self.journal_offset += len(complete)
+        changed = {int(line) for line in complete.split() if line.isdigit()}
+        if changed:
+            self.refresh(changed)
+        return True
+
+    def _score(self, doc, term):
+        admission_tokens, name_tokens = doc[5], doc[6]
+        if term in admission_tokens:
+            return EXACT_ADMISSION
+        if term in name_tokens:
+            return EXACT_NAME
+        tokens = admission_tokens + name_tokens
+        if any(token.startswith(term) for token in tokens):
+            return PREFIX
+        if any(term in token for token in tokens):
+            return SUBSTRING
+        return 0
+
+    def search(self, query, limit, class_id=None):
+        """Ids of the best matches; every query term must match some name or admission token"""
+        terms = [term for term in normalize(query) if len(term) >= MIN_QUERY_LENGTH]
+        if not terms:
+            return []
+        candidates = None
+        for term in terms:
+            if len(term) == 2:
+                ids = self.grams.get(f'^{term}', set())  # Two letters: tokens starting with them
+            else:
+                # Every trigram of the term must occur in the token (verified by _score)
+                ids = set.intersection(*[self.grams.get(term[i:i + 3], set()) for i in range(len(term) - 2)])
+            candidates = set(ids) if candidates is None else candidates & ids
+            if not candidates:
+                return []
+
+        ranked = []
+        for student_id in candidates:
+            doc = self.docs[student_id]
+            if class_id and doc[3] != class_id:
+                continue
+            scores = [self._score(doc, term) for term in terms]
+            if all(scores):
+                ranked.append((-sum(scores), not doc[4], doc[2].lower(), doc[1].lower(), student_id))
+        ranked.sort()
+        return [entry[-1] for entry in ranked[:limit]]
+
+    def describe(self, student_id):
+        admission_number, first_name, last_name, class_id, is_active = self.docs[student_id][:5]
+        return {'id': student_id, 'admission_number': admission_number, 'first_name': first_name,
+                'last_name': last_name, 'class_id': class_id, 'is_active': is_active}
+
+
+_index = StudentIndex()
+
+
+def search_students(query, limit=20, class_id=None):
+    """
+    Matching students, best first, as dicts (id, admission_number, names,
+    class_id, is_active), or None while this worker's index is being built
+    (callers fall back to a plain LIKE search)
+    """
+    with _index.lock:
+        if not _index.sync():
+            return None
+        return [_index.describe(student_id) for student_id in _index.search(query, limit, class_id)]
+
+
+def student_changed(*student_ids):
+    """Record students added, edited or deleted (after commit) for every worker's index"""
+    if not student_ids:
+        return
+    os.makedirs(Config.SEARCH_FOLDER, exist_ok=True)
+    # Appends this small are atomic with O_APPEND, so concurrent writers never interleave
+    with open(JOURNAL_PATH, 'a') as journal:
+        journal.write(''.join(f'{student_id}\n' for student_id in student_ids))
+        size = journal.tell()
+    if size > JOURNAL_MAX_BYTES:
+        reset_student_index()
+
+
+def reset_student_index():
+    """Make every worker rebuild its index (e.g. after bulk loads outside the app)"""
+    os.makedirs(Config.SEARCH_FOLDER, exist_ok=True)
+    tmp_path = f'{JOURNAL_PATH}.{os.getpid()}'
+    open(tmp_path, 'w').close()
+    os.replace(tmp_path, JOURNAL_PATH)
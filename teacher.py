@@ -4,7 +4,10 @@ Handles teacher operations: CRUD, subject assignment, class assignment
 """
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 from database import get_db
-from utils import require_login, require_role, hash_password
+from pagination import fetch_page
+from reference_data import get_classes, get_sections, get_subjects, get_academic_years
+from academic_years import get_current_academic_year_id
+from utils import require_login, require_role, hash_password, get_current_user, invalidate_principals
 from config import Config
 from datetime import datetime
 
@@ -16,23 +19,21 @@ teacher_bp = Blueprint('teacher', __name__, url_prefix='/teacher')
 def dashboard():
     """Teacher dashboard"""
     try:
-        user_id = session.get('user_id')
+        teacher_id = get_current_user()['teacher_id']
         cursor = get_db()
         
         # Get teacher info
         cursor.execute("""
             SELECT t.id, t.first_name, t.last_name, t.employee_id, t.phone, t.email
             FROM teachers t
-            WHERE t.user_id = %s
-        """, (user_id,))
+            WHERE t.id = %s
+        """, (teacher_id,))
         teacher = cursor.fetchone()
         
         if not teacher:
             flash('Teacher profile not found.', 'danger')
             return redirect(url_for('auth.logout'))
         
-        teacher_id = teacher[0]
-        
         # Get assigned classes
         cursor.execute("""
             SELECT DISTINCT c.id, c.class_name, sec.section_name
@@ -78,14 +79,13 @@ def list_teachers():
     """List all teachers"""
     try:
         cursor = get_db()
-        cursor.execute("""
+        page = fetch_page(cursor, """
             SELECT t.id, t.employee_id, t.first_name, t.last_name, t.phone, t.email,
-                   t.qualification, t.is_active
+                   t.qualification, t.is_active, t.created_at
             FROM teachers t
-            ORDER BY t.created_at DESC
-        """)
-        teachers_list = cursor.fetchall()
-        return render_template('teacher/list.html', teachers=teachers_list)
+            WHERE 1=1
+        """, [], 't.created_at', 't.id', sort_index=8, id_index=0)
+        return render_template('teacher/list.html', teachers=page.rows, page=page)
     except Exception as e:
         flash(f'Error loading teachers: {str(e)}', 'danger')
         return render_template('teacher/list.html', teachers=[])
@@ -208,6 +208,7 @@ def edit_teacher(teacher_id):
                 cursor.execute("UPDATE users SET is_active = %s WHERE id = %s", (is_active, teacher[0]))
             
             cursor.connection.commit()
+            invalidate_principals()
             flash('Teacher updated successfully!', 'success')
             return redirect(url_for('teacher.list_teachers'))
         
@@ -240,6 +241,7 @@ def delete_teacher(teacher_id):
         # Delete teacher (cascades to user via foreign key)
         cursor.execute("DELETE FROM teachers WHERE id = %s", (teacher_id,))
         cursor.connection.commit()
+        invalidate_principals()
         flash('Teacher deleted successfully!', 'success')
     except Exception as e:
         cursor.connection.rollback()
@@ -270,9 +272,7 @@ def assign_class():
             
             # Get current academic year if not specified
             if not academic_year_id:
-                cursor.execute("SELECT id FROM academic_years WHERE is_current = TRUE LIMIT 1")
-                academic_year = cursor.fetchone()
-                academic_year_id = academic_year[0] if academic_year else None
+                academic_year_id = get_current_academic_year_id()
             
             cursor.execute("""
                 INSERT INTO class_teachers (teacher_id, class_id, section_id, academic_year_id, assigned_date)
@@ -293,14 +293,9 @@ def assign_class():
         cursor.execute("SELECT id, employee_id, first_name, last_name FROM teachers WHERE is_active = TRUE")
         teachers = cursor.fetchall()
         
-        cursor.execute("SELECT id, class_name FROM classes ORDER BY class_name")
-        classes = cursor.fetchall()
-        
-        cursor.execute("SELECT id, section_name, class_id FROM sections ORDER BY class_id, section_name")
-        sections = cursor.fetchall()
-        
-        cursor.execute("SELECT id, year_name FROM academic_years ORDER BY start_date DESC")
-        academic_years = cursor.fetchall()
+        classes = get_classes()
+        sections = get_sections()
+        academic_years = get_academic_years()
         
         return render_template('teacher/assign_class.html',
                              teachers=teachers, classes=classes, sections=sections, academic_years=academic_years)
@@ -329,9 +324,7 @@ def assign_subject():
             
             # Get current academic year if not specified
             if not academic_year_id:
-                cursor.execute("SELECT id FROM academic_years WHERE is_current = TRUE LIMIT 1")
-                academic_year = cursor.fetchone()
-                academic_year_id = academic_year[0] if academic_year else None
+                academic_year_id = get_current_academic_year_id()
             
             cursor.execute("""
                 INSERT INTO teacher_subjects (teacher_id, subject_id, class_id, section_id, academic_year_id)
@@ -350,17 +343,10 @@ def assign_subject():
         cursor.execute("SELECT id, employee_id, first_name, last_name FROM teachers WHERE is_active = TRUE")
         teachers = cursor.fetchall()
         
-        cursor.execute("SELECT id, subject_name, subject_code FROM subjects ORDER BY subject_name")
-        subjects = cursor.fetchall()
-        
-        cursor.execute("SELECT id, class_name FROM classes ORDER BY class_name")
-        classes = cursor.fetchall()
-        
-        cursor.execute("SELECT id, section_name, class_id FROM sections ORDER BY class_id, section_name")
-        sections = cursor.fetchall()
-        
-        cursor.execute("SELECT id, year_name FROM academic_years ORDER BY start_date DESC")
-        academic_years = cursor.fetchall()
+        subjects = get_subjects()
+        classes = get_classes()
+        sections = get_sections()
+        academic_years = get_academic_years()
         
         return render_template('teacher/assign_subject.html',
                              teachers=teachers, subjects=subjects, classes=classes, sections=sections, academic_years=academic_years)
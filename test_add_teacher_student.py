@@ -1,9 +1,12 @@
 """
 Test script to verify adding teacher and student works
 """
+from datetime import datetime
 from flask import Flask
 from config import Config
 from database import init_db, get_db
+from academic_years import get_current_academic_year_id
+from admission import allocate_admission_number
 from werkzeug.security import generate_password_hash
 
 def test_teacher_add():
@@ -87,17 +90,14 @@ def test_student_add():
             first_name = "Test"
             last_name = "Student"
             
-            # Generate admission number
-            from datetime import datetime
-            year = datetime.now().year
-            cursor.execute("SELECT COUNT(*) FROM students WHERE admission_number LIKE %s", (f'ADM{year}%',))
-            count = cursor.fetchone()[0]
-            admission_number = f'ADM{year}{str(count + 1).zfill(4)}'
+            # Reserve an admission number (released again if anything below fails)
+            admission_number = allocate_admission_number(cursor)
             username = admission_number.lower()
             
             # Check if already exists
             cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
             if cursor.fetchone():
+                cursor.connection.rollback()
                 print(f"[SKIP] User '{username}' already exists")
                 return True
             
@@ -111,9 +111,7 @@ def test_student_add():
             section_id = section_result[0] if section_result else None
             
             # Get current academic year
-            cursor.execute("SELECT id FROM academic_years WHERE is_current = TRUE LIMIT 1")
-            academic_year_result = cursor.fetchone()
-            academic_year_id = academic_year_result[0] if academic_year_result else None
+            academic_year_id = get_current_academic_year_id()
             
             print(f"[INFO] Admission Number: {admission_number}")
             print(f"[INFO] Class ID: {class_id}")
@@ -0,0 +1,8 @@
+"""
+Unit tests for the app's pure-Python helpers
+Run from the project root with: python -m pytest
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
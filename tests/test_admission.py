@@ -0,0 +1,62 @@
+import pytest
+from admission import (allocate_admission_number, allocate_admission_numbers, format_admission_number,
+                       peek_admission_numbers)
+
+
+class SequenceCursor:
+    """Plays the admission_sequences table for the allocator's three statements"""
+
+    def __init__(self, sequences=None):
+        self.sequences = dict(sequences or {})
+        self.locked = []
+        self._row = None
+
+    def execute(self, sql, params):
+        if 'FROM admission_sequences' in sql and 'FOR UPDATE' not in sql:
+            self._row = (self.sequences[params[0]],) if params[0] in self.sequences else None
+        elif sql.lstrip().startswith('INSERT INTO admission_sequences'):
+            self.sequences.setdefault(params[0], 1)
+        elif 'FOR UPDATE' in sql:
+            self.locked.append(params[0])
+            self._row = (self.sequences[params[0]],)
+        elif sql.lstrip().startswith('UPDATE admission_sequences'):
+            count, prefix = params
+            self.sequences[prefix] += count
+        else:
+            raise AssertionError(f'unexpected statement: {sql}')
+
+    def fetchone(self):
+        return self._row
+
+
+def test_first_number_of_a_year_creates_its_sequence():
+    cursor = SequenceCursor()
+    assert allocate_admission_number(cursor, year=2026) == 'ADM20260001'
+    assert cursor.sequences == {'ADM2026': 2}
+    assert cursor.locked == ['ADM2026']
+
+
+def test_block_allocation_is_consecutive_and_advances_once():
+    cursor = SequenceCursor({'ADM2026': 41})
+    assert allocate_admission_numbers(cursor, 3, year=2026) == ['ADM20260041', 'ADM20260042', 'ADM20260043']
+    assert allocate_admission_number(cursor, year=2026) == 'ADM20260044'
+    assert cursor.locked == ['ADM2026', 'ADM2026']
+
+
+def test_years_have_separate_sequences():
+    cursor = SequenceCursor({'ADM2025': 900})
+    assert allocate_admission_number(cursor, year=2026) == 'ADM20260001'
+    assert allocate_admission_number(cursor, year=2025) == 'ADM20250900'
+
+
+def test_peek_reserves_nothing():
+    cursor = SequenceCursor({'ADM2026': 8})
+    assert peek_admission_numbers(cursor, 2, year=2026) == ['ADM20260008', 'ADM20260009']
+    assert peek_admission_numbers(cursor, 1, year=2027) == ['ADM20270001']
+    assert cursor.sequences == {'ADM2026': 8}
+    assert cursor.locked == []
+
+
+@pytest.mark.parametrize('value, expected', [(7, 'ADM20260007'), (12345, 'ADM202612345')])
+def test_format_pads_to_four_digits(value, expected):
+    assert format_admission_number('ADM2026', value) == expected
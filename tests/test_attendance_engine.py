@@ -0,0 +1,38 @@
+from datetime import date
+import numpy as np
+from attendance_engine import compute_class_report
+
+PRESENT, ABSENT, LATE, HALF_DAY = range(4)
+
+
+def _records(rows):
+    return np.array(rows, dtype=np.int32).reshape(-1, 3)
+
+
+def test_counts_percentages_and_unknown_students():
+    # 2026-03-02 is a Monday
+    records = _records([
+        (10, PRESENT, 0), (10, ABSENT, 1), (10, LATE, 2), (10, PRESENT, 3),
+        (20, PRESENT, 0), (20, PRESENT, 1),
+        (99, ABSENT, 0),  # Left the section: ignored
+    ])
+    report = compute_class_report([20, 10, 30], records, date(2026, 3, 2), date(2026, 3, 6))
+    assert report['counts'].tolist() == [[2, 0, 0, 0], [2, 1, 1, 0], [0, 0, 0, 0]]
+    assert report['total_days'].tolist() == [2, 4, 0]
+    assert report['percentages'].tolist() == [100.0, 50.0, 0.0]
+    assert report['weekdays'][0].tolist() == [2, 0, 0, 0]  # Mondays
+    assert report['weekdays'][1].tolist() == [1, 1, 0, 0]  # Tuesdays
+    assert report['weekdays'][5:].sum() == 0
+
+
+def test_streaks_use_the_worst_status_of_each_day():
+    records = _records([
+        (1, ABSENT, 0), (1, ABSENT, 1), (1, PRESENT, 2), (1, ABSENT, 3), (1, ABSENT, 4), (1, ABSENT, 5),
+        (1, PRESENT, 6), (1, PRESENT, 7),
+        # Two sheets on one day: absent from one subject makes the day absent
+        (2, PRESENT, 0), (2, PRESENT, 1), (2, ABSENT, 1), (2, PRESENT, 2),
+        (3, PRESENT, 0), (3, LATE, 1),
+    ])
+    report = compute_class_report([1, 2, 3], records, date(2026, 3, 2), date(2026, 3, 11))
+    assert report['longest_absence'].tolist() == [3, 1, 0]
+    assert report['present_streak'].tolist() == [2, 1, 0]
@@ -0,0 +1,20 @@
+import pytest
+from flask import Flask
+from werkzeug.http import parse_options_header
+
+pytest.importorskip('MySQLdb')  # downloads imports metrics, which reads the database pool
+import downloads
+from config import Config
+
+
+@pytest.mark.parametrize('download_name', ['notes "final" v2\\draft.pdf', 'Résumé "x".pdf'])
+def test_offloaded_download_quotes_the_file_name(tmp_path, monkeypatch, download_name):
+    monkeypatch.setattr(Config, 'DOWNLOAD_OFFLOAD', 'x-sendfile')
+    path = tmp_path / 'blob'
+    path.write_bytes(b'%PDF-1.4\n')
+    with Flask(__name__).test_request_context('/'):
+        response = downloads.send_protected_file(str(path), download_name)
+    value, options = parse_options_header(response.headers['Content-Disposition'])
+    assert value == 'attachment'
+    assert options['filename'] == download_name  # filename* (RFC 2231) wins when present
+    assert response.headers['X-Sendfile'] == str(path)
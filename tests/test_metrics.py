@@ -0,0 +1,84 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+
+pytest.importorskip('MySQLdb')  # metrics imports the database pool
+import metrics
+from config import Config
+
+
+@pytest.fixture
+def metrics_folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'METRICS_FOLDER', str(tmp_path))
+    monkeypatch.setattr(metrics, '_counters', {})
+    monkeypatch.setattr(metrics, '_histograms', {})
+    return tmp_path
+
+
+def _dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def _write_snapshot(folder, snapshot_id, pid, started=None, requests=0):
+    snapshot = {
+        'pid': pid, 'id': snapshot_id, 'started': started,
+        'counters': [['sms_http_requests_total', {'endpoint': 'index'}, requests]],
+        'histograms': [[{'endpoint': 'index'}, [requests] + [0] * len(metrics.DURATION_BUCKETS) + [0.5]]],
+        'gauges': [['sms_http_requests_in_flight', {}, 3]],
+    }
+    with open(os.path.join(folder, f'{snapshot_id}.json'), 'w') as out:
+        json.dump(snapshot, out)
+
+
+def _requests(counters):
+    return counters.get(('sms_http_requests_total', (('endpoint', 'index'),)), 0)
+
+
+def test_exited_workers_are_folded_into_retired_snapshot(metrics_folder):
+    metrics.inc_counter('sms_http_requests_total', 2, endpoint='index')
+    metrics.flush(force=True)
+    _write_snapshot(metrics_folder, 'dead-1', _dead_pid(), requests=5)
+    _write_snapshot(metrics_folder, 'dead-2', _dead_pid(), requests=7)
+
+    counters, gauges, histograms = metrics.collect()
+    assert _requests(counters) == 14
+    assert histograms[(('endpoint', 'index'),)][0] == 12
+    assert gauges[('sms_worker_processes', ())] == 1
+    assert ('sms_http_requests_in_flight', ()) in gauges
+    assert gauges[('sms_http_requests_in_flight', ())] == 0  # dead workers' gauges are dropped
+    assert sorted(os.listdir(metrics_folder)) == sorted(
+        [f'{metrics._process_info()[1]}.json', 'retired.json', 'retired.lock'])
+
+    # Totals are stable across scrapes once retired
+    counters, _, _ = metrics.collect()
+    assert _requests(counters) == 14
+
+
+def test_reused_pid_is_treated_as_exited(metrics_folder):
+    pid, _, started = metrics._process_info()
+    if started is None:
+        pytest.skip('process start times need /proc')
+    _write_snapshot(metrics_folder, 'old-worker', pid, started=started - 1, requests=4)
+    metrics.inc_counter('sms_http_requests_total', 1, endpoint='index')
+    metrics.flush(force=True)
+
+    counters, gauges, _ = metrics.collect()
+    assert _requests(counters) == 5
+    assert gauges[('sms_worker_processes', ())] == 1
+    assert not os.path.exists(os.path.join(metrics_folder, 'old-worker.json'))
+
+
+def test_snapshot_already_folded_is_not_counted_twice(metrics_folder):
+    # A scrape crashed after writing retired.json but before deleting the snapshot
+    _write_snapshot(metrics_folder, 'dead-1', _dead_pid(), requests=5)
+    with open(os.path.join(metrics_folder, 'retired.json'), 'w') as out:
+        json.dump({'counters': [['sms_http_requests_total', {'endpoint': 'index'}, 5]],
+                   'histograms': [], 'folded': ['dead-1']}, out)
+
+    counters, _, _ = metrics.collect()
+    assert _requests(counters) == 5
+    assert not os.path.exists(os.path.join(metrics_folder, 'dead-1.json'))
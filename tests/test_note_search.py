@@ -0,0 +1,109 @@
+import os
+import threading
+import pytest
+
+pytest.importorskip('MySQLdb')  # note_search reads notes through the database module
+import note_search
+from config import Config
+
+NOTES = {
+    1: (1, 'Photosynthesis basics', 'Light reactions in plants', 'Biology', '/x/1.txt', 'txt', None, 7, 1, 10, 100, 1),
+    2: (2, 'Cell division', 'Mitosis and meiosis', 'Biology', '/x/2.txt', 'txt', None, 7, 1, 10, None, 1),
+    3: (3, 'Plants and photosynthesis revision', 'Photosynthesis photosynthesis', 'Biology', '/x/3.txt', 'txt',
+        None, 8, 1, 11, 110, 1),
+}
+
+
+class FakeNotesDb:
+    def __init__(self, notes):
+        self.notes = notes
+        self.rows = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params):
+        if 'is_active = TRUE' in sql:
+            self.rows = [(note_id,) for note_id in sorted(self.notes) if note_id > params[0]]
+        else:
+            self.rows = [self.notes[note_id] for note_id in params if note_id in self.notes]
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'SEARCH_FOLDER', str(tmp_path))
+    monkeypatch.setattr(Config, 'NOTE_INDEX_WORKER', False)
+    monkeypatch.setattr(note_search, 'INDEX_PATH', str(tmp_path / 'notes.sqlite3'))
+    monkeypatch.setattr(note_search, 'INDEXER_LOCK_PATH', str(tmp_path / 'indexer.lock'))
+    monkeypatch.setattr(note_search, '_local', threading.local())
+    notes = dict(NOTES)
+    monkeypatch.setattr(note_search, 'connect', lambda: FakeNotesDb(notes))
+    return notes
+
+
+def _build():
+    note_search.backfill()
+    while note_search.process_queue():
+        pass
+
+
+def test_tokenize_drops_stopwords_and_single_letters():
+    assert note_search.tokenize('The Theory of a Cell, and X-rays!') == ['theory', 'cell', 'rays']
+
+
+def test_search_waits_until_backfilled_notes_are_indexed(index):
+    assert note_search.search_notes('photosynthesis') is None
+    note_search.backfill()
+    assert note_search.search_notes('photosynthesis') is None  # Queued, not indexed yet
+    note_search.process_queue(limit=1)
+    assert note_search.search_notes('photosynthesis') is None
+    while note_search.process_queue():
+        pass
+    assert note_search.search_notes('photosynthesis') == [3, 1]
+
+    note_search.reset_note_index()
+    assert note_search.search_notes('photosynthesis') is None
+
+
+def test_bm25_ranking_and_scopes(index):
+    _build()
+    assert note_search.search_notes('mitosis') == [2]
+    assert note_search.search_notes('plants photosynthesis')[0] == 3
+    assert note_search.search_notes('photosynthesis', teacher_id=7) == [1]
+    # Students see their section's notes and notes for the whole class
+    assert sorted(note_search.search_notes('biology', student_class=(10, 100))) == [1, 2]
+    assert note_search.search_notes('biology', student_class=(10, 101)) == [2]
+    assert note_search.search_notes('the of') == []
+
+
+def test_deleted_note_leaves_the_index(index):
+    _build()
+    note_search.note_removed(3)
+    assert note_search.search_notes('photosynthesis') == [1]
+    del index[3]
+    while note_search.process_queue():
+        pass
+    assert note_search.search_notes('photosynthesis') == [1]
+
+
+def test_only_one_process_holds_the_indexer_lock(index, monkeypatch):
+    monkeypatch.setattr(note_search, '_lock_file', None)
+    assert note_search._take_indexer_lock()
+    read_end, write_end = os.pipe()
+    child = os.fork()
+    if child == 0:
+        # A forked worker inherits the lock file but must not count as the indexer
+        os.close(read_end)
+        os.write(write_end, b'1' if note_search._take_indexer_lock() else b'0')
+        os._exit(0)
+    os.close(write_end)
+    os.waitpid(child, 0)
+    assert os.read(read_end, 1) == b'0'
+    assert note_search._take_indexer_lock()
+    note_search._lock_file[1].close()
@@ -0,0 +1,68 @@
+from datetime import datetime
+import pytest
+from flask import Flask
+from pagination import _decode, _encode, fetch_page
+
+
+@pytest.mark.parametrize('key', [
+    (datetime(2026, 3, 1, 8, 30, 15), 42),
+    (datetime(2026, 3, 1, 8, 30, 15, 123456), 7),
+])
+def test_cursor_round_trip(key):
+    token = _encode(key)
+    assert '=' not in token and '/' not in token and '+' not in token
+    assert _decode(token) == key
+
+
+@pytest.mark.parametrize('token', [None, '', 'not-a-cursor', '!!!', _encode((datetime(2026, 1, 1), 1))[:-3]])
+def test_bad_cursors_mean_first_page(token):
+    assert _decode(token) is None
+
+
+class RowsCursor:
+    """Runs the keyset query in Python over rows of (created_at, id)"""
+
+    def __init__(self, rows):
+        self.table = rows
+        self.rows = []
+
+    def execute(self, query, params):
+        *bounds, limit = params
+        rows = self.table
+        if 'AND (created_at >' in query:
+            value, _, row_id = bounds
+            rows = sorted(row for row in rows if (row[0], row[1]) > (value, row_id))
+        else:
+            if bounds:
+                value, _, row_id = bounds
+                rows = [row for row in rows if (row[0], row[1]) < (value, row_id)]
+            rows = sorted(rows, reverse=True)
+        self.rows = rows[:limit]
+
+    def fetchall(self):
+        return self.rows
+
+
+def _page(app, cursor, query_string):
+    with app.test_request_context(f'/items?per_page=2&{query_string}'):
+        return fetch_page(cursor, 'SELECT created_at, id FROM items WHERE 1 = 1', [],
+                          'created_at', 'id', 0, 1)
+
+
+def test_pages_walk_forward_and_back():
+    app = Flask(__name__)
+    app.add_url_rule('/items', 'items')
+    same_time = datetime(2026, 1, 5)
+    cursor = RowsCursor([(datetime(2026, 1, day), day) for day in range(1, 5)] + [(same_time, 5), (same_time, 6)])
+
+    first = _page(app, cursor, '')
+    assert [row[1] for row in first.rows] == [6, 5] and first.is_first and first.prev_cursor is None
+    second = _page(app, cursor, f'after={first.next_cursor}')
+    assert [row[1] for row in second.rows] == [4, 3]
+    last = _page(app, cursor, f'after={second.next_cursor}')
+    assert [row[1] for row in last.rows] == [2, 1] and last.next_cursor is None
+
+    back = _page(app, cursor, f'before={last.prev_cursor}')
+    assert [row[1] for row in back.rows] == [4, 3] and not back.is_first
+    home = _page(app, cursor, f'before={back.prev_cursor}')
+    assert [row[1] for row in home.rows] == [6, 5] and home.is_first
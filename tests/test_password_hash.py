@@ -0,0 +1,35 @@
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import pytest
+
+pytest.importorskip('MySQLdb')  # utils imports the database pool
+import utils
+from config import Config
+
+
+@pytest.mark.parametrize('method, stored, needs_rehash', [
+    ('scrypt', 'scrypt:32768:8:1', False),
+    ('scrypt:32768:8:1', 'scrypt:32768:8:1', False),
+    ('scrypt:65536:8:1', 'scrypt:32768:8:1', True),
+    ('pbkdf2', f'pbkdf2:sha256:{utils.DEFAULT_PBKDF2_ITERATIONS}', False),
+    ('pbkdf2:sha256', 'pbkdf2:sha256:1000', True),
+    ('scrypt', 'pbkdf2:sha256:600000', True),
+])
+def test_password_needs_rehash(monkeypatch, method, stored, needs_rehash):
+    monkeypatch.setattr(Config, 'PASSWORD_HASH_METHOD', method)
+    assert utils.password_needs_rehash(f'{stored}$salt$hash') is needs_rehash
+
+
+def test_timed_out_hash_keeps_its_slot_until_done(monkeypatch):
+    monkeypatch.setattr(Config, 'PASSWORD_HASH_WORKERS', 1)
+    monkeypatch.setattr(utils, '_hash_slots', utils.threading.BoundedSemaphore(1))
+    utils._run_hash('verify', 'test', time.sleep, 0)  # Start the pool before shortening the timeout
+    monkeypatch.setattr(Config, 'PASSWORD_HASH_TIMEOUT', 0.2)
+
+    with pytest.raises(FutureTimeoutError):
+        utils._run_hash('verify', 'test', time.sleep, 1.0)
+    with pytest.raises(utils.PasswordHasherBusy):
+        utils._run_hash('verify', 'test', time.sleep, 0)
+
+    time.sleep(1.2)
+    utils._run_hash('verify', 'test', time.sleep, 0)
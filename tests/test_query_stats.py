@@ -0,0 +1,56 @@
+import pytest
+pytest.importorskip('MySQLdb')  # query_stats subclasses MySQLdb's cursors
+
+from flask import Flask, g
+
+from query_stats import InstrumentedCursorMixin, QueryStats
+
+
+class _LoopingCursor:
+    """Stands in for MySQLdb's Cursor: executemany() falls back to execute() per row"""
+    rowcount = 0
+
+    def execute(self, query, args=None):
+        self.rowcount = 1
+        return 1
+
+    def executemany(self, query, args):
+        self.rowcount = sum(self.execute(query, arg) for arg in args)
+        return self.rowcount
+
+
+class _BulkCursor(_LoopingCursor):
+    """executemany() sends one multi-row statement without going through execute()"""
+
+    def executemany(self, query, args):
+        self.rowcount = len(args)
+        return self.rowcount
+
+
+class LoopingCursor(InstrumentedCursorMixin, _LoopingCursor):
+    pass
+
+
+class BulkCursor(InstrumentedCursorMixin, _BulkCursor):
+    pass
+
+
+@pytest.fixture
+def stats():
+    app = Flask(__name__)
+    with app.app_context():
+        g.query_stats = QueryStats()
+        yield g.query_stats
+
+
+def test_looped_executemany_records_each_row_once(stats):
+    LoopingCursor().executemany('UPDATE students SET class_id = %s WHERE id = %s',
+                                [(1, 1), (1, 2), (1, 3)])
+    assert len(stats.queries) == 3
+    assert sum(rows for _, _, rows in stats.queries) == 3
+
+
+def test_bulk_executemany_records_one_statement(stats):
+    BulkCursor().executemany('INSERT INTO notes (title) VALUES (%s)', [('a',), ('b',)])
+    assert len(stats.queries) == 1
+    assert stats.queries[0][2] == 2
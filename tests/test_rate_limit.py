@@ -0,0 +1,37 @@
+import threading
+from types import SimpleNamespace
+import pytest
+import rate_limit
+
+
+@pytest.fixture
+def clock(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_DB', str(tmp_path / 'ratelimit.sqlite3'))
+    monkeypatch.setattr(rate_limit, '_local', threading.local())
+    monkeypatch.setattr(rate_limit, 'time', SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def test_burst_then_reject_with_retry_after(clock):
+    assert [rate_limit.take('ip:1', 3, 6)[0] for _ in range(3)] == [True, True, True]
+    assert rate_limit.take('ip:1', 3, 6) == (False, 11)  # One token per 10s
+    assert rate_limit.take('ip:2', 3, 6) == (True, 0)  # Buckets are independent
+
+
+def test_bucket_refills_over_time(clock):
+    for _ in range(2):
+        rate_limit.take('user:a', 2, 6)
+    assert not rate_limit.take('user:a', 2, 6)[0]
+    clock[0] += 10
+    assert rate_limit.take('user:a', 2, 6) == (True, 0)
+    assert not rate_limit.take('user:a', 2, 6)[0]
+    clock[0] += 3600
+    assert [rate_limit.take('user:a', 2, 6)[0] for _ in range(3)] == [True, True, False]  # Capped at burst
+
+
+def test_reset_refills(clock):
+    rate_limit.take('user:b', 1, 1)
+    assert not rate_limit.take('user:b', 1, 1)[0]
+    rate_limit.reset('user:b')
+    assert rate_limit.take('user:b', 1, 1) == (True, 0)
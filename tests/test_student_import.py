@@ -0,0 +1,131 @@
+import pytest
+
+MySQLdb = pytest.importorskip('MySQLdb')
+import student_import
+
+
+class FakeSchool:
+    """Just enough of admission_sequences, users and students, with transactions"""
+
+    def __init__(self, next_value=1, reject_emails=()):
+        self.committed = {'next': next_value, 'users': [], 'students': []}
+        self.reject_emails = set(reject_emails)
+        self.steal_before_allocation = 0
+        self.rollback()
+
+    def commit(self):
+        self.committed = {key: list(value) if isinstance(value, list) else value
+                          for key, value in self.state.items()}
+
+    def rollback(self):
+        self.state = {key: list(value) if isinstance(value, list) else value
+                      for key, value in self.committed.items()}
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+class FakeCursor:
+    def __init__(self, school):
+        self.school = school
+        self.connection = school
+        self.rows = []
+
+    def execute(self, sql, params=()):
+        state = self.school.state
+        if 'FOR UPDATE' in sql:
+            # Another admission that commits just before this batch locks the row
+            state['next'] += self.school.steal_before_allocation
+            self.school.steal_before_allocation = 0
+            self.rows = [(state['next'],)]
+        elif 'FROM admission_sequences' in sql:
+            self.rows = [(self.school.committed['next'],)]
+        elif sql.lstrip().startswith('INSERT INTO admission_sequences'):
+            pass
+        elif sql.lstrip().startswith('UPDATE admission_sequences'):
+            state['next'] += params[0]
+        elif 'FROM users' in sql:
+            self.rows = [(username, i) for i, (username, _, _) in enumerate(state['users'])
+                         if username in params]
+        elif 'FROM students' in sql:
+            self.rows = [(i,) for i, student in enumerate(state['students']) if student[1] in params]
+        else:
+            raise AssertionError(sql)
+
+    def executemany(self, sql, rows):
+        if 'INTO users' in sql:
+            self.school.state['users'] += rows
+        else:
+            for row in rows:
+                if row[7] in self.school.reject_emails:
+                    raise MySQLdb.IntegrityError(1062, 'Duplicate entry')
+            self.school.state['students'] += rows
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+
+@pytest.fixture(autouse=True)
+def fast_hashes(monkeypatch):
+    hashed = []
+
+    def hash_passwords(pool, passwords):
+        hashed.extend(passwords)
+        return [f'hash:{password}' for password in passwords]
+    monkeypatch.setattr(student_import, 'hash_passwords', hash_passwords)
+    monkeypatch.setattr(student_import, 'student_changed', lambda *ids: None)
+    return hashed
+
+
+def _batch(*emails):
+    return [(row_number, {'email': email, 'first_name': 'A', 'last_name': 'B', 'date_of_birth': None,
+                          'gender': None, 'phone': None, 'address': None, 'parent_name': None,
+                          'parent_phone': None, 'parent_email': None, 'class_id': None, 'section_id': None,
+                          'academic_year_id': 1, 'admission_date': None})
+            for row_number, email in enumerate(emails, start=2)]
+
+
+def _numbers(school):
+    return [student[1] for student in school.committed['students']]
+
+
+def test_batch_gets_consecutive_numbers_and_hashes_once(fast_hashes):
+    school = FakeSchool(next_value=5)
+    batch = _batch('a@x.io', 'b@x.io', 'c@x.io')
+    results = student_import._admit_batch(school, None, batch)
+
+    prefix = student_import.peek_admission_numbers(school.cursor(), 1)[0][:-4]
+    assert set(results.values()) == {('imported', '')}
+    assert _numbers(school) == [f'{prefix}0005', f'{prefix}0006', f'{prefix}0007']
+    assert school.committed['next'] == 8
+    assert fast_hashes == _numbers(school)
+    assert batch[0][1]['password_hash'] == f'hash:{prefix}0005'
+
+
+def test_rejected_rows_hand_their_numbers_back(fast_hashes):
+    school = FakeSchool(next_value=1, reject_emails={'bad@x.io'})
+    batch = _batch('a@x.io', 'bad@x.io', 'c@x.io')
+    results = student_import._admit_batch(school, None, batch)
+
+    assert results[3][0] == 'error'
+    assert batch[1][1]['admission_number'] == ''
+    numbers = _numbers(school)
+    assert [number[-4:] for number in numbers] == ['0001', '0002']  # No gap for the rejected row
+    assert school.committed['next'] == 3
+    assert batch[2][1]['password_hash'] == f'hash:{numbers[1]}'
+    assert len(fast_hashes) == 3  # The retry reused the hashes computed up front
+
+
+def test_numbers_taken_meanwhile_are_hashed_under_the_lock(fast_hashes):
+    school = FakeSchool(next_value=1)
+    school.steal_before_allocation = 1
+    batch = _batch('a@x.io', 'b@x.io')
+    student_import._admit_batch(school, None, batch)
+
+    numbers = _numbers(school)
+    assert [number[-4:] for number in numbers] == ['0002', '0003']
+    assert batch[1][1]['password_hash'] == f'hash:{numbers[1]}'
+    assert fast_hashes[-1] == numbers[1]
@@ -0,0 +1,88 @@
+from contextlib import contextmanager
+import pytest
+
+pytest.importorskip('MySQLdb')  # student_search reads students through the database module
+import student_search
+from student_search import StudentIndex, _grams, normalize
+
+STUDENTS = [
+    (1, 'ADM20260001', 'Ananya', 'Sharma', 10, True),
+    (2, 'ADM20260002', 'Anand', 'Iyer', 10, True),
+    (3, 'ADM20250417', 'José', 'Fernandes', 11, True),
+    (4, 'ADM20250418', 'Ana', 'Shah', 11, False),
+]
+
+
+@pytest.fixture
+def index():
+    index = StudentIndex()
+    for row in STUDENTS:
+        index._add(row)
+    return index
+
+
+def test_normalize_folds_accents_and_splits():
+    assert normalize('José  Fernandes-Núñez') == ['jose', 'fernandes', 'nunez']
+    assert _grams('ana') == {'^an', 'ana'}
+
+
+def test_exact_admission_number_wins(index):
+    assert index.search('ADM20260002', 10) == [2]
+
+
+def test_prefix_and_substring_matches(index):
+    assert index.search('anan', 10) == [2, 1]       # Prefix of both; ties by last name
+    assert index.search('nand', 10) == [3, 2]       # Substring of Fernandes and Anand
+    assert index.search('nanya', 10) == [1]
+    assert index.search('jose', 10) == [3]          # Accent-folded
+    assert index.search('an sh', 10) == [1, 4]      # Every term must match; inactive last
+
+
+def test_two_letter_terms_match_token_starts_only(index):
+    assert set(index.search('sh', 10)) == {1, 4}
+    assert index.search('ar', 10) == []
+
+
+def test_class_filter_and_limit(index):
+    assert index.search('an', 10, class_id=11) == [4]
+    assert len(index.search('adm', 2)) == 2
+    assert index.search('a', 10) == []  # Shorter than MIN_QUERY_LENGTH
+
+
+def test_remove_drops_grams(index):
+    index._remove(2)
+    assert index.search('anand', 10) == []
+    assert not any(2 in ids for ids in index.grams.values())
+    index._remove(2)  # Already gone
+
+
+class StudentsCursor:
+    def __init__(self, rows):
+        self.rows = list(rows)
+
+    def execute(self, sql):
+        pass
+
+    def fetchmany(self, size):
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+
+def test_index_is_built_off_the_request_path(tmp_path, monkeypatch):
+    @contextmanager
+    def streaming_cursor(readonly=True):
+        yield StudentsCursor(STUDENTS)
+    monkeypatch.setattr(student_search, 'streaming_cursor', streaming_cursor)
+    monkeypatch.setattr(student_search, 'JOURNAL_PATH', str(tmp_path / 'students.journal'))
+
+    index = StudentIndex()
+    assert index.sync() is False  # Callers fall back to SQL meanwhile
+    index.builder.join()
+    assert index.sync() is True
+    assert index.search('ADM20260002', 10) == [2]
+
+    # A rotated journal rebuilds in the background too
+    (tmp_path / 'students.journal').write_text('')
+    assert index.sync() is False
+    index.builder.join()
+    assert index.sync() is True
@@ -0,0 +1,89 @@
+"""
+Text extraction for uploaded notes
+Plain text of PDF, DOCX and PPTX files for the notes search index. DOCX and
+PPTX are zipped XML and are read with the standard library; PDFs need pypdf.
+Other types (old binary .doc/.ppt, images) have no extractable text here.
+Extraction stops after max_chars so one huge deck cannot bloat the index.
+"""
+import re
+import zipfile
+from xml.etree import ElementTree
+
+WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+DRAWING_NS = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+EXTRACTABLE_TYPES = ('pdf', 'docx', 'pptx')
+
+
+class _Collector:
+    def __init__(self, max_chars):
+        self.parts = []
+        self.size = 0
+        self.max_chars = max_chars
+
+    @property
+    def full(self):
+        return self.size >= self.max_chars
+
+    def add(self, text):
+        if text and not self.full:
+            text = text[:self.max_chars - self.size]
+            self.parts.append(text)
+            self.size += len(text)
+
+    def text(self):
+        return ''.join(self.parts)
+
+
+def _xml_text(archive, member, text_tag, break_tag, collector):
+    """Stream the text runs of one XML part, with a newline after each paragraph"""
+    with archive.open(member) as xml_file:
+        for _, element in ElementTree.iterparse(xml_file):
+            if element.tag == text_tag:
+                collector.add(element.text)
+            elif element.tag == break_tag:
+                collector.add('\n')
+                element.clear()
+            if collector.full:
+                return
+
+
+def _docx_text(path, collector):
+    with zipfile.ZipFile(path) as archive:
+        _xml_text(archive, 'word/document.xml', f'{WORD_NS}t', f'{WORD_NS}p', collector)
+
+
+def _slide_number(name):
+    return int(re.search(r'(\d+)\.xml$', name).group(1))
+
+
+def _pptx_text(path, collector):
+    with zipfile.ZipFile(path) as archive:
+        names = archive.namelist()
+        # Slides in order, then the speaker notes
+        for pattern in (r'^ppt/slides/slide\d+\.xml$', r'^ppt/notesSlides/notesSlide\d+\.xml$'):
+            for member in sorted((name for name in names if re.match(pattern, name)), key=_slide_number):
+                _xml_text(archive, member, f'{DRAWING_NS}t', f'{DRAWING_NS}p', collector)
+                if collector.full:
+                    return
+
+
+def _pdf_text(path, collector):
+    from pypdf import PdfReader  # Only needed for PDF notes
+    for page in PdfReader(path).pages:
+        collector.add(page.extract_text() or '')
+        collector.add('\n')
+        if collector.full:
+            return
+
+
+def extract_text(path, file_type, max_chars):
+    """Text of the file at path (file_type is its extension); '' for types without extractable text"""
+    collector = _Collector(max_chars)
+    file_type = (file_type or '').lower()
+    if file_type == 'pdf':
+        _pdf_text(path, collector)
+    elif file_type == 'docx':
+        _docx_text(path, collector)
+    elif file_type == 'pptx':
+        _pptx_text(path, collector)
+    return collector.text()
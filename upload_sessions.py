@@ -0,0 +1,189 @@
+"""
+Chunked, resumable uploads
+Large files (lecture decks) are sent as a series of chunks instead of one
+multipart body: init creates a session, each append streams one chunk straight
+into the session's part file at the offset the server has acknowledged, and
+complete checks the size and moves the file into place. Memory use is one
+read buffer whatever the file size, every request stays under
+MAX_CONTENT_LENGTH, and after a dropped connection the client asks for the
+acknowledged offset and carries on from there.
+
+The SHA-256 of the file is computed as chunks are written. A worker keeps the
+running hash of the sessions it appended to last; if chunks were spread over
+several workers, complete hashes the part file once instead.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from config import Config
+from blob_store import file_sha256
+from utils import allowed_file
+
+SESSION_ID = re.compile(r'^[0-9a-f]{32}$')
+READ_SIZE = 64 * 1024
+MAX_HASHERS = 32  # Running hashes kept per worker
+
+
+class UploadError(Exception):
+    """A request the upload session cannot accept; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+_hashers = {}  # session id -> (offset, running sha256) for sessions appended to by this worker
+
+
+def _paths(session_id):
+    if not SESSION_ID.match(session_id or ''):
+        raise UploadError('Unknown upload.', 404)
+    base = os.path.join(Config.UPLOAD_SESSIONS_FOLDER, session_id)
+    return f'{base}.json', f'{base}.part'
+
+
+def _write_meta(meta_path, meta):
+    tmp_path = f'{meta_path}.{uuid.uuid4().hex}'  # Unique per call: threads of one worker may write at once
+    with open(tmp_path, 'w') as meta_file:
+        json.dump(meta, meta_file)
+    os.replace(tmp_path, meta_path)
+
+
+def load_session(session_id, user_id):
+    """The session's metadata; UploadError(404) unless it exists and belongs to user_id"""
+    meta_path, _ = _paths(session_id)
+    try:
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+    except (FileNotFoundError, ValueError):
+        raise UploadError('Unknown upload.', 404)
+    if meta['user_id'] != user_id:
+        raise UploadError('Unknown upload.', 404)
+    return meta
+
+
+def _prune_expired():
+    """Drop sessions nobody has touched for UPLOAD_SESSION_TTL seconds"""
+    cutoff = time.time() - Config.UPLOAD_SESSION_TTL
+    try:
+        names = os.listdir(Config.UPLOAD_SESSIONS_FOLDER)
+    except FileNotFoundError:
+        return
+    for name in names:
+        path = os.path.join(Config.UPLOAD_SESSIONS_FOLDER, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def create_session(user_id, filename, size):
+    """Start an upload of size bytes; returns its metadata"""
+    if not filename or not allowed_file(filename):
+        raise UploadError('Invalid file type. Allowed types: PDF, DOC, DOCX, PPT, PPTX')
+    if size is None or size <= 0:
+        raise UploadError('The file size is required.')
+    if size > Config.MAX_CHUNKED_UPLOAD_SIZE:
+        raise UploadError(f'Files may be at most {Config.MAX_CHUNKED_UPLOAD_SIZE // (1024 * 1024)}MB.', 413)
+
+    os.makedirs(Config.UPLOAD_SESSIONS_FOLDER, exist_ok=True)
+    _prune_expired()
+    session_id = uuid.uuid4().hex
+    meta_path, part_path = _paths(session_id)
+    open(part_path, 'wb').close()
+    meta = {'id': session_id, 'user_id': user_id, 'filename': filename, 'size': size, 'offset': 0,
+            'chunk_size': Config.UPLOAD_CHUNK_SIZE, 'created': time.time()}
+    _write_meta(meta_path, meta)
+    _hashers[session_id] = (0, hashlib.sha256())
+    return meta
+
+
+def append_chunk(session_id, user_id, offset, stream, length=None):
+    """
+    Write one chunk read from stream at offset, which must equal the
+    acknowledged offset (UploadError(409) with the right one otherwise).
+    Returns the new acknowledged offset.
+    """
+    meta = load_session(session_id, user_id)
+    meta_path, part_path = _paths(session_id)
+    if offset != meta['offset']:
+        raise UploadError('Chunk does not start at the acknowledged offset.', 409, meta['offset'])
+    remaining = min(meta['size'] - offset, Config.UPLOAD_CHUNK_SIZE)
+    if length is not None and length > remaining:
+        raise UploadError('Chunk is larger than allowed.', 413, offset)
+
+    # Hash into a copy so a chunk cut off half way leaves the running hash at offset
+    cached = _hashers.get(session_id)
+    hasher = cached[1].copy() if cached and cached[0] == offset else None
+
+    # pwrite at the offset: a retried chunk overwrites the same bytes whatever
+    # a dropped attempt left behind, and nothing is acknowledged until it is complete
+    fd = os.open(part_path, os.O_WRONLY)
+    written = 0
+    try:
+        while True:
+            block = stream.read(min(READ_SIZE, remaining - written + 1))
+            if not block:
+                break
+            written += len(block)
+            if written > remaining:
+                raise UploadError('Chunk is larger than allowed.', 413, offset)
+            os.pwrite(fd, block, offset + written - len(block))
+            if hasher is not None:
+                hasher.update(block)
+    finally:
+        os.close(fd)
+    if length is not None and written != length:
+        raise UploadError('Chunk was cut off; resend it.', 400, offset)
+
+    meta['offset'] = offset + written
+    _write_meta(meta_path, meta)
+    _hashers.pop(session_id, None)
+    if hasher is not None:
+        while len(_hashers) >= MAX_HASHERS:
+            _hashers.pop(next(iter(_hashers)))
+        _hashers[session_id] = (meta['offset'], hasher)
+    return meta['offset']
+
+
+def finish_session(session_id, user_id, destination, expected_sha256=None):
+    """
+    Move a fully received upload to destination.
+    Returns (metadata with 'path', sha256 hex digest); the session is gone afterwards.
+    """
+    meta = load_session(session_id, user_id)
+    meta_path, part_path = _paths(session_id)
+    if meta['offset'] != meta['size']:
+        raise UploadError('The upload is not complete yet.', 409, meta['offset'])
+
+    os.truncate(part_path, meta['size'])  # Anything a dropped, longer chunk left past the end
+    cached = _hashers.pop(session_id, None)
+    if cached and cached[0] == meta['size']:
+        sha256 = cached[1].hexdigest()
+    else:
+        sha256 = file_sha256(part_path)
+    if expected_sha256 and expected_sha256.lower() != sha256:
+        discard_session(session_id, user_id)
+        raise UploadError('The uploaded file is corrupt (checksum mismatch); upload it again.', 422)
+
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    shutil.move(part_path, destination)  # A rename when both are on one filesystem
+    os.remove(meta_path)
+    meta['path'] = destination
+    return meta, sha256
+
+
+def discard_session(session_id, user_id):
+    load_session(session_id, user_id)
+    _hashers.pop(session_id, None)
+    for path in _paths(session_id):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
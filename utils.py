@@ -1,21 +1,157 @@
 """
 Utility functions for the application
 """
+import multiprocessing
 import os
+import threading
+import time
 import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from werkzeug.utils import secure_filename
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
 from functools import wraps
+from itertools import repeat
 from flask import session, redirect, url_for, flash, request
 from config import Config
+from cache import VersionedCache
+from database import get_db
+from metrics import record_upload, inc_counter
+from storage import new_file_path
+
+# Only the shared version stamp is used: bumping it makes every session
+# re-resolve its teacher/student profile on the next request.
+principal_cache = VersionedCache('principal', ttl=0)
+
+PRINCIPAL_KEYS = ('teacher_id', 'student_id', 'class_id', 'section_id')
+
+class PasswordHasherBusy(Exception):
+    """Raised when PASSWORD_HASH_QUEUE hash operations are already pending"""
+
+_hash_pool = None
+_hash_pool_pid = None
+_hash_pool_lock = threading.Lock()
+_hash_slots = threading.BoundedSemaphore(Config.PASSWORD_HASH_QUEUE)
+
+def _timed(function, *args):
+    """Run in a pool worker; returns (result, seconds spent hashing)"""
+    started_at = time.perf_counter()
+    return function(*args), time.perf_counter() - started_at
+
+def _get_hash_pool():
+    """This process's hashing pool, recreated after a fork (e.g. gunicorn workers)"""
+    global _hash_pool, _hash_pool_pid
+    with _hash_pool_lock:
+        if _hash_pool is None or _hash_pool_pid != os.getpid():
+            # forkserver: forking a threaded web worker directly is not safe
+            _hash_pool = ProcessPoolExecutor(max_workers=Config.PASSWORD_HASH_WORKERS,
+                                             mp_context=multiprocessing.get_context('forkserver'))
+            _hash_pool_pid = os.getpid()
+        return _hash_pool
+
+def _discard_hash_pool(pool):
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is pool:
+            _hash_pool = None
+    pool.shutdown(wait=False)
+
+def _run_hash(operation, method, function, *args):
+    """
+    Run a hash operation in the pool (or inline when PASSWORD_HASH_WORKERS is 0)
+    and record its timing. Raises PasswordHasherBusy instead of queueing without bound.
+    A pooled job holds its queue slot until it is done or cancelled, not just
+    while this caller waits for it, so timed-out jobs still count as pending.
+    """
+    if not _hash_slots.acquire(blocking=False):
+        inc_counter('sms_password_hash_rejected_total', operation=operation)
+        raise PasswordHasherBusy()
+    started_at = time.perf_counter()
+    if Config.PASSWORD_HASH_WORKERS:
+        pool = _get_hash_pool()
+        try:
+            future = pool.submit(_timed, function, *args)
+        except BaseException as e:
+            _hash_slots.release()
+            if isinstance(e, BrokenProcessPool):
+                _discard_hash_pool(pool)
+            raise
+        future.add_done_callback(lambda _: _hash_slots.release())
+        try:
+            result, seconds = future.result(timeout=Config.PASSWORD_HASH_TIMEOUT)
+        except BrokenProcessPool:
+            _discard_hash_pool(pool)  # A killed hashing process; start fresh next time
+            raise
+        finally:
+            future.cancel()  # Drops a job still queued after a timeout; a running one finishes
+    else:
+        try:
+            result, seconds = _timed(function, *args)
+        finally:
+            _hash_slots.release()
+    inc_counter('sms_password_hash_operations_total', operation=operation, method=method)
+    inc_counter('sms_password_hash_seconds_total', seconds, operation=operation, method=method)
+    inc_counter('sms_password_hash_wait_seconds_total', time.perf_counter() - started_at - seconds,
+                operation=operation)
+    return result
 
 def hash_password(password):
-    """Hash a password using werkzeug.security"""
-    return generate_password_hash(password)
+    """Hash a password with the configured PASSWORD_HASH_METHOD"""
+    return _run_hash('hash', Config.PASSWORD_HASH_METHOD.split(':', 1)[0], generate_password_hash, password, Config.PASSWORD_HASH_METHOD)
 
 def check_password(password_hash, password):
-    """Verify a password against its hash"""
-    return check_password_hash(password_hash, password)
+    """Verify a password against its hash (any scheme werkzeug understands)"""
+    return _run_hash('verify', password_hash.split(':', 1)[0], check_password_hash, password_hash, password)
+
+def bulk_hash_pool(workers=None):
+    """Dedicated process pool for hash_passwords (one process per CPU by default)"""
+    return ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                               mp_context=multiprocessing.get_context('forkserver'))
+
+def hash_passwords(pool, passwords):
+    """
+    Hash many passwords with PASSWORD_HASH_METHOD across a bulk_hash_pool, in order.
+    Bulk jobs bring their own pool so they never queue behind (or starve) logins.
+    """
+    passwords = list(passwords)
+    method = Config.PASSWORD_HASH_METHOD
+    results = list(pool.map(_timed, repeat(generate_password_hash), passwords, repeat(method), chunksize=16))
+    labels = {'operation': 'bulk_hash', 'method': method.split(':', 1)[0]}
+    inc_counter('sms_password_hash_operations_total', len(results), **labels)
+    inc_counter('sms_password_hash_seconds_total', sum(seconds for _, seconds in results), **labels)
+    return [password_hash for password_hash, _ in results]
+
+_dummy_hash = None
+
+def check_dummy_password(password):
+    """
+    Spend the same hashing time as check_password for logins that have no
+    real hash to check (unknown or inactive users); always False
+    """
+    global _dummy_hash
+    if _dummy_hash is None or password_needs_rehash(_dummy_hash):
+        _dummy_hash = hash_password(uuid.uuid4().hex)
+    check_password(_dummy_hash, password)
+    return False
+
+def _hash_parameters(method):
+    """
+    [algorithm, parameters...] of a werkzeug method string such as 'scrypt' or
+    'pbkdf2:sha256:600000', with the defaults werkzeug applies filled in
+    """
+    algorithm, *params = method.split(':')
+    if algorithm == 'scrypt':
+        defaults = ['32768', '8', '1']
+    elif algorithm == 'pbkdf2':
+        defaults = ['sha256', str(DEFAULT_PBKDF2_ITERATIONS)]
+    else:
+        defaults = []
+    params += defaults[len(params):]
+    return [algorithm] + [int(param) if param.isdigit() else param for param in params]
+
+def password_needs_rehash(password_hash):
+    """True when a hash was made with other parameters than PASSWORD_HASH_METHOD"""
+    return _hash_parameters(password_hash.split('$', 1)[0]) != _hash_parameters(Config.PASSWORD_HASH_METHOD)
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
@@ -39,16 +175,14 @@ def secure_file_save(file, folder_path):
     if not allowed_file(file.filename):
         return False, None, "File type not allowed"
     
-    # Create directory if it doesn't exist
-    os.makedirs(folder_path, exist_ok=True)
-    
-    # Generate secure filename
+    # Generate secure filename (in its hash-prefixed subdirectory, created if needed)
     original_filename = secure_filename(file.filename)
     unique_filename = generate_unique_filename(original_filename)
-    file_path = os.path.join(folder_path, unique_filename)
+    file_path = new_file_path(folder_path, unique_filename)
     
     try:
         file.save(file_path)
+        record_upload(folder_path, os.path.getsize(file_path))
         return True, file_path, None
     except Exception as e:
         return False, None, f"Error saving file: {str(e)}"
@@ -91,13 +225,46 @@ def require_role(*roles):
         return decorated_function
     return decorator
 
+def remember_principal(teacher_id=None, student_id=None, class_id=None, section_id=None, version=None):
+    """Store the user's teacher/student profile ids in the session"""
+    session['teacher_id'] = teacher_id
+    session['student_id'] = student_id
+    session['class_id'] = class_id
+    session['section_id'] = section_id
+    session['principal_version'] = principal_cache.version() if version is None else version
+
+def load_principal(user_id, role):
+    """Resolve teacher/student profile ids for a user from the database"""
+    version = principal_cache.version()
+    cursor = get_db()
+    principal = {}
+    if role == 'teacher':
+        cursor.execute("SELECT id FROM teachers WHERE user_id = %s", (user_id,))
+        teacher = cursor.fetchone()
+        principal['teacher_id'] = teacher[0] if teacher else None
+    elif role == 'student':
+        cursor.execute("SELECT id, class_id, section_id FROM students WHERE user_id = %s", (user_id,))
+        student = cursor.fetchone()
+        if student:
+            principal.update(student_id=student[0], class_id=student[1], section_id=student[2])
+    remember_principal(version=version, **principal)
+
+def invalidate_principals():
+    """Call after changing a teacher's or student's profile, class or section"""
+    principal_cache.invalidate()
+
 def get_current_user():
-    """Get current logged-in user info from session"""
+    """Get current logged-in user info, including teacher/student ids, from session"""
     if 'user_id' not in session:
         return None
-    return {
+    if 'principal_version' not in session or session['principal_version'] != principal_cache.version():
+        load_principal(session['user_id'], session.get('role'))
+    user = {
         'user_id': session.get('user_id'),
         'username': session.get('username'),
         'role': session.get('role'),
         'email': session.get('email')
     }
+    for key in PRINCIPAL_KEYS:
+        user[key] = session.get(key)
+    return user